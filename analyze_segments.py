@@ -1,9 +1,12 @@
 #!/usr/bin/env python
 import time
 from datetime import datetime, timezone
-from google.cloud import firestore
 import argparse
-from app.services.firestore import process_raw_positions, calculate_distance, segment_positions
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from app.services.firestore import process_raw_positions, track_distances, segment_positions, sync_client
+from app.services import parallel
+from app.services import mirror
 
 MAX_REALISTIC_SPEED = 60.0      # mph (above this is flagged as spurious)
 
@@ -18,23 +21,33 @@ def format_duration(seconds):
     else:
         return f"{secs}s"
 
-def fetch_and_analyze(filter_spurious):
-    db = firestore.Client(project="boat-crumbs")
-    print("Fetching all GPS documents from Firestore (this may take a few seconds)...")
-    
+def fetch_and_analyze(filter_spurious, workers=1, mirror_path=None):
     start_time = time.time()
-    docs = db.collection("gps_data").stream()
-    
-    raw_positions = []
-    for doc in docs:
-        raw_positions.append(doc.to_dict())
+    if mirror_path:
+        print(f"Reading all GPS documents from the local mirror {mirror_path}...")
+        raw_positions = list(mirror.read_raw_positions(mirror_path, mirror.MIRROR_START_TSTAMP, mirror.MIRROR_END_TSTAMP).values())
+    else:
+        db = sync_client()
+        print("Fetching all GPS documents from Firestore (this may take a few seconds)...")
+        docs = db.collection("gps_data").stream()
+
+        raw_positions = []
+        for doc in docs:
+            raw_positions.append(doc.to_dict())
         
     fetch_time = time.time() - start_time
     print(f"Fetched {len(raw_positions)} documents in {fetch_time:.2f} seconds.")
     
-    positions = process_raw_positions(raw_positions, filter_spurious=filter_spurious)
-    segments = segment_positions(positions, filter_stationary=False)
-    print(f"Identified {len(segments)} segments.\n")
+    start_time = time.time()
+    if filter_spurious and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            positions = parallel.process_records_parallel(parallel.normalize_sorted(raw_positions), executor, workers)
+    else:
+        positions = process_raw_positions(raw_positions, filter_spurious=filter_spurious)
+    print(f"Processed {len(positions)} positions in {time.time() - start_time:.2f} seconds.")
+    segmented = segment_positions(positions, filter_stationary=False)
+    bounds = segmented.segment_bounds()
+    print(f"Identified {len(bounds)} segments.\n")
     
     # Print table header
     print(f"{'Seg #':<6} | {'Start Time (UTC)':<19} | {'End Time (UTC)':<19} | {'Pts':<5} | {'Distance':<10} | {'Duration':<12} | {'Max Speed':<10} | {'Spurious Likelihood / Warnings'}")
@@ -42,42 +55,29 @@ def fetch_and_analyze(filter_spurious):
     
     skipped_segments = 0
     printed_count = 0
-    for i, seg in enumerate(segments, 1):
+    for i, (start, end) in enumerate(bounds, 1):
+        seg = segmented.take(slice(start, end))
         pts_count = len(seg)
-        start_ts = seg[0]["utc_shifted_tstamp"]
-        end_ts = seg[-1]["utc_shifted_tstamp"]
+        start_ts = float(seg.utc_shifted_tstamp[0])
+        end_ts = float(seg.utc_shifted_tstamp[-1])
         duration = end_ts - start_ts
-        if pts_count == 1 and "duration_secs" in seg[0]:
-            duration = seg[0]["duration_secs"]
+        if pts_count == 1 and not np.isnan(seg.duration_secs[0]):
+            duration = float(seg.duration_secs[0])
             end_ts = start_ts + duration
             
         start_date = datetime.fromtimestamp(start_ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
         end_date = datetime.fromtimestamp(end_ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
         
         # Calculate total distance and max speed within the segment
-        total_dist = 0.0
-        max_speed = 0.0
         spurious_warnings = []
-        has_null_island = False
+        has_null_island = bool(np.any((seg.latitude == 0.0) | (seg.longitude == 0.0)))
         
-        seg_prev = None
-        for p in seg:
-            if p["latitude"] == 0.0 or p["longitude"] == 0.0:
-                has_null_island = True
-                
-            if not seg_prev:
-                seg_prev = p
-                continue
-                
-            d = calculate_distance(p["latitude"], p["longitude"], seg_prev["latitude"], seg_prev["longitude"])
-            t_diff = p["utc_shifted_tstamp"] - seg_prev["utc_shifted_tstamp"]
-            
-            total_dist += d
-            if t_diff > 0:
-                speed = d / (t_diff / 3600.0)
-                if speed > max_speed:
-                    max_speed = speed
-            seg_prev = p
+        steps = track_distances(seg).consecutive
+        t_diffs = np.diff(seg.utc_shifted_tstamp)
+        total_dist = float(steps.sum())
+        moving = t_diffs > 0
+        speeds = steps[moving] / (t_diffs[moving] / 3600.0)
+        max_speed = float(speeds.max(initial=0.0))
             
         # Ignore stationary/idle segments (<= 2 points and < 0.1 miles)
         # unless they represent a significant stationary stay (>= 30 minutes)
@@ -120,6 +120,8 @@ def fetch_and_analyze(filter_spurious):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Analyze GPS segments from Firestore.")
     parser.add_argument("--raw", action="store_true", help="Do not filter out Null Island points first (show raw data problems).")
+    parser.add_argument("--workers", type=int, default=1, help="Process the data in parallel chunks on this many cores.")
+    parser.add_argument("--mirror", default=mirror.mirror_path(), help="Read from this local mirror (see sync_mirror.py) instead of Firestore.")
     args = parser.parse_args()
     
-    fetch_and_analyze(filter_spurious=not args.raw)
+    fetch_and_analyze(filter_spurious=not args.raw, workers=args.workers, mirror_path=args.mirror)
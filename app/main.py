@@ -1,19 +1,55 @@
 import os
-import json
+import math
 import time
-from fastapi import FastAPI, Query, HTTPException
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query, HTTPException, Request
 from fastapi import Depends, status
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 import secrets
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from datetime import datetime, timezone
-from google.cloud import firestore
-from .services.firestore import fs_fetch_positions, segment_positions
-
-app = FastAPI()
+from .services.firestore import LazyAsyncClient
+from .services.position_stream import PositionStream, fs_fetch_positions, stream_positions
+from .services import year_cache
+from .services.single_flight import SingleFlight
+from .services import payload_cache
+from .services import segment_index
+from .services import wire_format
+from .services import lod
+from .services import parallel
+from .services import mirror
+from .services import metrics
+from .services import spatial_index
+from .services import live
+from .services import scheduler
+from .services import codec
+from .services import range_planner
+from .utils import mytime
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled async Firestore client shared by every request, connected on first use
+    app.state.db = LazyAsyncClient()
+    # Build and warm the caches in the background so requests never pay for a cold build
+    warmup.start(warm_years())
+    yield
+    await warmup.stop()
+    live_feed.close()
+    app.state.db.close()
+
+app = FastAPI(lifespan=lifespan)
+# Per-stage timings of each request go back in a Server-Timing header (see /metrics for totals)
+app.add_middleware(metrics.ServerTimingMiddleware)
 security = HTTPBasic()
 
+metrics.register_lru_cache("timezone", mytime.get_timezone)
+metrics.register_lru_cache("timezone_grid", mytime._zone_for_cell)
+
+def get_db(request: Request):
+    return request.app.state.db
+
 USERNAME = os.getenv("TRACKER_UI_USERNAME")
 PASSWORD = os.getenv("TRACKER_UI_PASSWORD")
 
@@ -55,7 +91,8 @@ async def home(user: str = Depends(verify_credentials)):
 async def get_positions(
     from_date: str = Query(..., regex="^\d{8}$", description="Start date in YYYYMMDD format"),
     to_date: str = Query(..., regex="^\d{8}$", description="End date in YYYYMMDD format"),
-    user: str = Depends(verify_credentials)
+    user: str = Depends(verify_credentials),
+    db: LazyAsyncClient = Depends(get_db)
 ):
     """
     Fetch positions within the specified date range.
@@ -73,49 +110,194 @@ async def get_positions(
 
         print(f"main.py: from_timestamp={from_timestamp}, to_timestamp={to_timestamp}")
 
-        db = firestore.Client(project="boat-crumbs")
-        positions = await fs_fetch_positions(db, from_timestamp, to_timestamp)
-        segments = segment_positions(positions)
+        # Identical ranges requested at the same time share one plan
+        payload = await range_flights.do(
+            (from_timestamp, to_timestamp), lambda: plan_range(db, from_timestamp, to_timestamp))
 
-        if positions:
-            print(f"✅ main.py: Fetched {len(positions)} records, grouped into {len(segments)} segments.")
-            print(f"📌 First position: {positions[0]}")
+        if payload["count"]:
+            print(f"✅ main.py: Fetched {payload['count']} records, grouped into {len(payload['segments'])} segments.")
         else:
             print("No positions found, returning default data.")
 
-        return {
-            "positions": positions,
-            "segments": segments,
-            "from_timestamp": from_timestamp,
-            "to_timestamp": to_timestamp
-        }
+        return json_response(payload)
 
     except ValueError as e:
         print(f"Error: Invalid date format: {e}")
         raise HTTPException(status_code=400, detail=f"Invalid date format: {e}")
 
+async def fetch_year_range(db, year: int, from_timestamp: int, to_timestamp: int) -> codec.Payload:
+    """
+    A range within one year straight from Firestore, segmented as the year
+    cache would be: with context around it, dropping trips that started in
+    the previous year (see range_planner.context_window).
+    """
+    fetch_from, fetch_to = range_planner.context_window(year, from_timestamp, to_timestamp)
+    positions = await fs_fetch_positions(db, fetch_from, fetch_to)
+
+    def encode():
+        _, _, segmented = year_cache.kept_segments(positions, range_planner.year_bounds(year)[0])
+        payload = wire_format.encode_payload(segmented, segmented.segment_bounds(), fetch_from, fetch_to)
+        return range_planner.slice_year(payload, segmented.utc_shifted_tstamp, from_timestamp, to_timestamp)
+
+    return await asyncio.to_thread(encode)
+
+async def plan_range(db, from_timestamp: int, to_timestamp: int) -> codec.Payload:
+    """
+    A range served from the cached years, fetching from Firestore only what
+    they do not cover (see app/services/range_planner.py).
+    """
+    pieces = []
+    for year, piece_from, piece_to in range_planner.year_pieces(from_timestamp, to_timestamp):
+        cached, stale = year_cache_status(year)
+        if cached and stale:
+            # Rows before the resume point never change; only a piece reaching past it needs the refresh
+            state = year_cache.load_state(CACHE_DIR, year)
+            if state is None or piece_to >= state["resume_tstamp"]:
+                await year_flights.do(year, lambda: refresh_year(year, db))
+        geometry = await asyncio.to_thread(year_geometry.get, CACHE_DIR, year) if cached else None
+        if geometry is None:
+            metrics.cache_miss("range_year")
+            print(f"main.py: range {piece_from}-{piece_to} not cached, fetching from Firestore")
+            piece = await fetch_year_range(db, year, piece_from, piece_to)
+        else:
+            metrics.cache_hit("range_year")
+            with metrics.stage("range_slice") as timing:
+                piece = range_planner.slice_year(geometry.payload, geometry.utc_shifted_tstamp, piece_from, piece_to)
+                timing.points_out = piece["count"]
+        year_from = range_planner.year_bounds(year)[0]
+        window = range_planner.year_edge_window(from_timestamp, year_from, piece, piece_to) if pieces else None
+        if window is not None:
+            positions = await fs_fetch_positions(db, *window)
+            trip = range_planner.year_edge_trip(positions, year_from, *window)
+            if trip is not None:
+                # The whole trip stands in for the part of it the previous year kept
+                pieces[-1] = range_planner.rows_before(pieces[-1], trip["columns"]["utc_shifted_tstamp"][0])
+                pieces.append(trip)
+        pieces.append(piece)
+
+    stitch = [range_planner.continues(a, b) for a, b in zip(pieces, pieces[1:])]
+    return wire_format.concat(pieces, from_timestamp, to_timestamp, stitch)
+
 
 CACHE_DIR = "app/cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-async def get_segment_offset_for_year(year: int, db) -> int:
-    offset = 0
-    # Data begins in 2025
-    for past_year in range(2025, year):
-        cache_path = os.path.join(CACHE_DIR, f"year_{past_year}.json")
-        if not os.path.exists(cache_path):
-            print(f"main.py: Cache missing for past year {past_year}, building it...")
-            await get_positions_for_year_internal(past_year, db)
-            
-        try:
-            with open(cache_path, "r") as f:
-                cached_data = json.load(f)
-                offset += len(cached_data.get("segments", []))
-        except Exception as e:
-            print(f"Error reading cache for year {past_year}: {e}")
-    return offset
-
-async def get_positions_for_year_internal(year: int, db) -> dict:
+FIRST_DATA_YEAR = 2025            # Data begins in 2025
+CURRENT_YEAR_STALE_SECS = 1800    # The current year's cache is refreshed after this long (past years are static)
+WARM_YEARS_ENV = "TRACKER_WARM_YEARS"
+
+# At most one build or refresh per year, and one fetch per /positions range, at a time
+year_flights = SingleFlight()
+range_flights = SingleFlight()
+
+# Encoded year payloads, served as bytes without touching JSON
+year_payloads = payload_cache.PayloadCache()
+
+def encoded_response(request: Request, entry: payload_cache.Entry) -> Response:
+    """Send a cached body in the best encoding the client accepts, or 304 if its copy is current."""
+    coding = payload_cache.pick_encoding(entry, request.headers.get("accept-encoding"))
+    headers = {
+        "ETag": payload_cache.variant_etag(entry.etag, coding),
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+    }
+    if payload_cache.etag_matches(entry, request.headers.get("if-none-match")):
+        return Response(status_code=304, headers=headers)
+    if coding != payload_cache.IDENTITY:
+        headers["Content-Encoding"] = coding
+    return Response(content=entry.bodies[coding], media_type=entry.media_type, headers=headers)
+
+MEDIA_TYPES = {"json": payload_cache.JSON_MEDIA_TYPE, "bin": wire_format.BINARY_MEDIA_TYPE}
+
+def json_response(data) -> Response:
+    """JSON response encoded with codec, skipping FastAPI's per-value jsonable_encoder pass."""
+    with metrics.stage("serialize"):
+        return Response(content=codec.dumps(data), media_type=payload_cache.JSON_MEDIA_TYPE)
+
+def encode_body(payload: dict, format: str) -> bytes:
+    if format == "bin":
+        return wire_format.encode_binary(payload)
+    with metrics.stage("serialize", payload["count"]):
+        return codec.dumps(payload)
+
+# Parsed years with their simplification tiers, for zoom/bbox views
+year_geometry = lod.YearGeometryCache()
+
+async def lod_response(request: Request, year: int, format: str, zoom: float = None, bounds: tuple = None,
+                       window: tuple = None) -> Response:
+    """A year simplified for a zoom level, clipped to bbox bounds and a (from, to) time window if given."""
+    geometry = await asyncio.to_thread(year_geometry.get, CACHE_DIR, year)
+    if geometry is None:
+        raise FileNotFoundError(year_cache.cache_path(CACHE_DIR, year))
+
+    if bounds is None:
+        tier = None if zoom is None else lod.select_tier(geometry.lod, zoom=zoom)
+        if window is None:
+            # Only the tier matters, so its encoded bytes are cached like the full year
+            entry = await asyncio.to_thread(
+                year_payloads.get_file, (year, format, tier), year_cache.cache_path(CACHE_DIR, year),
+                lambda _: encode_body(lod.tier_payload(geometry, tier), format), MEDIA_TYPES[format])
+            return encoded_response(request, entry)
+        view = lambda: lod.tier_payload(geometry, tier, window)
+    else:
+        view = lambda: lod.bbox_payload(geometry, zoom, bounds, window)
+    body = await asyncio.to_thread(lambda: encode_body(view(), format))
+    entry = await asyncio.to_thread(payload_cache.encode_entry, body, None, MEDIA_TYPES[format])
+    return encoded_response(request, entry)
+
+async def year_response(request: Request, year: int, payload: dict = None, format: str = "json") -> Response:
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    transform = wire_format.binary_from_json if format == "bin" else None
+    entry = await asyncio.to_thread(year_payloads.get_file, (year, format), cache_path, transform, MEDIA_TYPES[format])
+    if entry is None:
+        if payload is None:
+            raise FileNotFoundError(cache_path)
+        # Cache file could not be written; encode the payload we have
+        body = await asyncio.to_thread(encode_body, payload, format)
+        entry = await asyncio.to_thread(payload_cache.encode_entry, body, None, MEDIA_TYPES[format])
+    return encoded_response(request, entry)
+
+async def year_view_response(request: Request, year: int, payload: dict, format: str, zoom: float, bounds: tuple,
+                             window: tuple = None) -> Response:
+    if zoom is None and bounds is None and window is None:
+        return await year_response(request, year, payload, format)
+    return await lod_response(request, year, format, zoom, bounds, window)
+
+async def get_segment_offset_for_year(year: int, db, executor=None) -> int:
+    past_years = range(FIRST_DATA_YEAR, year)
+    for past_year in segment_index.missing_years(CACHE_DIR, past_years):
+        print(f"main.py: Cache missing for past year {past_year}, building it...")
+        await year_flights.do(past_year, lambda y=past_year: get_positions_for_year_internal(y, db, executor))
+    return segment_index.segment_offset(CACHE_DIR, past_years)
+
+def read_year_cache(year: int) -> codec.Payload:
+    with metrics.stage("cache_read"):
+        with open(year_cache.cache_path(CACHE_DIR, year), "rb") as f:
+            return codec.decode_payload(f.read(), wire_format.FORMAT_VERSION)
+
+def save_year_cache(year: int, payload: dict) -> bool:
+    """
+    Write a year's cache file, its segment index entry and derived files.
+    Blocking (the LOD tiers alone take about a second for a busy year): call
+    it in a worker thread.
+    """
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    try:
+        body = year_cache.write_json_atomic(cache_path, payload)
+    except Exception as e:
+        print(f"Error writing cache for year {year}: {e}")
+        return False
+    segment_index.record_year(CACHE_DIR, year, payload, body)
+    year_cache.save_lod(CACHE_DIR, year, payload, body)
+    year_cache.save_spatial(CACHE_DIR, year, payload, body)
+    year_cache.save_rollups(CACHE_DIR, year, payload, body)
+    return True
+
+async def get_positions_for_year_internal(year: int, db, executor=None) -> dict:
+    """
+    Build and cache a year from Firestore. With executor (a process pool), the
+    year is processed in parallel chunks instead of streamed (see backfill_years.py).
+    """
     from_datetime = datetime(year, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
     to_datetime = datetime(year, 12, 31, 23, 59, 59, tzinfo=timezone.utc)
     
@@ -123,82 +305,315 @@ async def get_positions_for_year_internal(year: int, db) -> dict:
     to_timestamp = int(to_datetime.timestamp())
 
     print(f"main.py: fetching Firestore data for year {year} with 5-day boundary buffer")
-    buffer_timestamp = from_timestamp - 5 * 86400
-    positions = await fs_fetch_positions(db, buffer_timestamp, to_timestamp)
-    segments = segment_positions(positions)
-
-    # Filter out segments that start in the previous year (already counted there)
-    segments = [seg for seg in segments if seg[0]["utc_shifted_tstamp"] >= from_timestamp]
-    # Rebuild positions list from the filtered segments
-    positions = [pos for seg in segments for pos in seg]
+    buffer_timestamp = from_timestamp - year_cache.YEAR_BUFFER_SECS
+
+    if executor is not None:
+        # Backfill: fetch the whole range and process it on every core
+        records = year_cache.normalize_documents(await mirror.fetch_raw_positions(db, buffer_timestamp, to_timestamp))
+        processed = await asyncio.to_thread(
+            parallel.process_records_parallel, parallel.normalize_sorted(records.values()), executor)
+        # Drop stationary segments and those that start in the previous year (already counted there)
+        segmented_all, keep, segmented = await asyncio.to_thread(year_cache.kept_segments, processed, from_timestamp)
+        hwm = max((rec["utc_shifted_tstamp"] for rec in records.values()), default=buffer_timestamp)
+        prev_state = None
+    else:
+        # Positions are segmented as the stream releases them; released rows always end
+        # before a segment start, so no segment is split between two batches
+        stream = PositionStream()
+        pieces = []
+        released_segments = 0
+        async for released in stream_positions(db, buffer_timestamp, to_timestamp, stream):
+            _, keep, kept = await asyncio.to_thread(year_cache.kept_segments, released, from_timestamp)
+            pieces.append(kept)
+            released_segments += int(keep.sum())
+
+        def finish():
+            processed = stream.process()
+            segmented_all, keep, kept = year_cache.kept_segments(processed, from_timestamp)
+            return processed, segmented_all, keep, year_cache.concat_segments(pieces + [kept])
+
+        processed, segmented_all, keep, segmented = await asyncio.to_thread(finish)
+        records = stream.pending
+        hwm = stream.hwm if stream.hwm is not None else buffer_timestamp
 
     # Calculate global segment offset from past years
-    offset = await get_segment_offset_for_year(year, db)
+    offset = await get_segment_offset_for_year(year, db, executor)
 
-    # Assign 1-indexed global segment numbers to position objects
-    for s_idx, segment in enumerate(segments, 1):
-        global_idx = offset + s_idx
-        for pos in segment:
-            pos["global_segment_index"] = global_idx
-
-    payload = {
-        "positions": positions,
-        "segments": segments,
-        "from_timestamp": from_timestamp,
-        "to_timestamp": to_timestamp
-    }
+    payload = await asyncio.to_thread(
+        wire_format.encode_payload, segmented, segmented.segment_bounds(), from_timestamp, to_timestamp, offset)
+
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    if await asyncio.to_thread(save_year_cache, year, payload):
+        print(f"💾 Saved year {year} data to local cache: {cache_path} (offset: {offset}, segments: {len(payload['segments'])})")
+
+    # Remember where the next refresh can pick up from
+    if executor is None:
+        prev_state = year_cache.stream_state(stream, released_segments, offset)
+    state = await asyncio.to_thread(
+        year_cache.next_state, records, processed, segmented_all, keep, hwm, offset, prev_state)
+    await asyncio.to_thread(year_cache.save_state, CACHE_DIR, year, state)
+
+    return payload
+
+async def refresh_year(year: int, db) -> dict:
+    """Incrementally refresh a cached year, falling back to a full build."""
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    state = year_cache.load_state(CACHE_DIR, year)
+    if state is None or not os.path.exists(cache_path):
+        return await get_positions_for_year_internal(year, db)
 
-    cache_path = os.path.join(CACHE_DIR, f"year_{year}.json")
     try:
-        with open(cache_path, "w") as f:
-            json.dump(payload, f)
-        print(f"💾 Saved year {year} data to local cache: {cache_path} (offset: {offset}, segments: {len(segments)})")
+        payload = await asyncio.to_thread(read_year_cache, year)
+        payload, state = await year_cache.refresh_year_incremental(db, payload, state)
     except Exception as e:
-        print(f"Error writing cache for year {year}: {e}")
+        print(f"Error refreshing year {year} incrementally: {e}. Rebuilding.")
+        return await get_positions_for_year_internal(year, db)
+
+    if await asyncio.to_thread(save_year_cache, year, payload):
+        print(f"💾 Refreshed year {year} cache incrementally: {cache_path} (segments: {len(payload['segments'])})")
+    await asyncio.to_thread(year_cache.save_state, CACHE_DIR, year, state)
 
     return payload
 
+def year_cache_status(year: int) -> tuple:
+    """(cached, stale) for a year's cache file."""
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    if not os.path.exists(cache_path):
+        return False, False
+    if year < datetime.now(timezone.utc).year:
+        return True, False
+    return True, time.time() - os.path.getmtime(cache_path) >= CURRENT_YEAR_STALE_SECS
+
+def year_expires_at(year: int):
+    """When a year's cache turns stale (epoch seconds), or None for past years and missing caches."""
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    if year < datetime.now(timezone.utc).year or not os.path.exists(cache_path):
+        return None
+    return os.path.getmtime(cache_path) + CURRENT_YEAR_STALE_SECS
+
+def warm_years() -> list:
+    """Years to warm at startup, highest priority first: TRACKER_WARM_YEARS, or the current year back to the first."""
+    configured = os.getenv(WARM_YEARS_ENV)
+    if configured is not None:
+        return [int(y) for y in configured.split(",") if y.strip()]
+    return list(range(datetime.now(timezone.utc).year, FIRST_DATA_YEAR - 1, -1))
+
+def warm_year(year: int):
+    """Load a cached year's rollups and geometry into memory."""
+    cache_path = year_cache.cache_path(CACHE_DIR, year)
+    year_payloads.get_file(("rollups", year), cache_path, lambda body: rollups_body(year, body))
+    year_geometry.get(CACHE_DIR, year)
+
+warmup = scheduler.WarmupScheduler(
+    build=lambda year: year_flights.do(year, lambda: refresh_year(year, app.state.db)),
+    warm=warm_year,
+    cached=lambda year: os.path.exists(year_cache.cache_path(CACHE_DIR, year)),
+    expires_at=year_expires_at,
+)
+
+async def ensure_year(year: int, db):
+    """
+    Cache a missing year. While the warm-up scheduler runs the request waits for
+    it to build the year (moved to the front of its queue) rather than starting a
+    cold build of its own. Returns the payload if one was built here.
+    """
+    if warmup.running:
+        await warmup.wait(year)
+        # The scheduler can report a year ready whose cache file has since been deleted
+        if os.path.exists(year_cache.cache_path(CACHE_DIR, year)):
+            return None
+    return await year_flights.do(year, lambda: refresh_year(year, db))
+
 @app.get("/positions/year")
 async def get_positions_for_year(
+    request: Request,
     year: int = Query(..., ge=2000, le=2100, description="Year to fetch"),
-    user: str = Depends(verify_credentials)
+    format: str = Query("json", pattern="^(json|bin)$", description="json, or bin for typed-array columns"),
+    zoom: float = Query(None, ge=0, le=24, description="Map zoom level; simplifies tracks to what it can show"),
+    bbox: str = Query(None, description="west,south,east,north; only positions in view (implies zoom if none given)"),
+    from_timestamp: float = Query(None, description="Only positions from this utc_shifted_tstamp on"),
+    to_timestamp: float = Query(None, description="Only positions up to this utc_shifted_tstamp"),
+    user: str = Depends(verify_credentials),
+    db: LazyAsyncClient = Depends(get_db)
 ):
     """
     Fetch positions and segments for an entire year with local file-based JSON caching and global segment numbers.
     """
+    try:
+        bounds = lod.parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bbox: {e}")
+    window = None
+    if from_timestamp is not None or to_timestamp is not None:
+        window = (-math.inf if from_timestamp is None else from_timestamp,
+                  math.inf if to_timestamp is None else to_timestamp)
+
     try:
         print(f"main.py: year={year}")
-        cache_path = os.path.join(CACHE_DIR, f"year_{year}.json")
-        current_year = datetime.now(timezone.utc).year
-        
-        use_cache = False
-        if os.path.exists(cache_path):
-            if year < current_year:
-                # Past years are static, cache is always valid
-                use_cache = True
-            else:
-                # Current year: check if cache is fresh (less than 30 minutes old)
-                cache_age = time.time() - os.path.getmtime(cache_path)
-                if cache_age < 1800:
-                    use_cache = True
-        
+        cache_path = year_cache.cache_path(CACHE_DIR, year)
+        use_cache, stale = year_cache_status(year)
+
         if use_cache:
-            print(f"⚡ Loading year {year} from local cache: {cache_path}")
+            metrics.cache_hit("year_file")
             try:
-                with open(cache_path, "r") as f:
-                    return json.load(f)
+                response = await year_view_response(request, year, None, format, zoom, bounds, window)
+                if stale:
+                    # Stale-while-revalidate: serve what we have, refresh in the background
+                    print(f"⚡ Loading stale year {year} from local cache, refreshing in background: {cache_path}")
+                    year_flights.start(year, lambda: refresh_year(year, db))
+                else:
+                    print(f"⚡ Loading year {year} from local cache: {cache_path}")
+                return response
             except Exception as e:
                 print(f"Error reading cache for year {year}: {e}. Falling back to Firestore.")
 
-        # Cache miss or stale: build and cache using internal logic
-        db = firestore.Client(project="boat-crumbs")
-        return await get_positions_for_year_internal(year, db)
+        # Cache miss: refresh the tail if we can, otherwise build and cache using internal logic
+        metrics.cache_miss("year_file")
+        payload = await ensure_year(year, db)
+        return await year_view_response(request, year, payload, format, zoom, bounds, window)
 
     except Exception as e:
         print(f"Error fetching year data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+SPATIAL_MAX_RADIUS_METERS = 100000
+
+def spatial_years(from_year: int = None, to_year: int = None) -> list:
+    """Cached years to search, oldest first."""
+    years = sorted(int(y) for y in segment_index.load_index(CACHE_DIR)["years"])
+    return [y for y in years if (from_year is None or y >= from_year) and (to_year is None or y <= to_year)]
+
+def spatial_search(from_year: int, to_year: int, query) -> dict:
+    """Run query(geometry) -> (rows, meters) over the cached years and collect the matching segments."""
+    segments = []
+    count = 0
+    for year in spatial_years(from_year, to_year):
+        geometry = year_geometry.get(CACHE_DIR, year)
+        if geometry is None:
+            continue
+        with metrics.stage("spatial_query") as timing:
+            rows, meters = query(geometry)
+            timing.points_out = len(rows)
+        for entry in spatial_index.match_segments(geometry.payload, geometry.utc_shifted_tstamp, geometry.segment_id,
+                                                  geometry.spatial, rows, meters):
+            segments.append({"year": year, **entry})
+        count += len(rows)
+    return {"count": count, "segments": segments}
+
+@app.get("/positions/bbox")
+async def get_positions_in_bbox(
+    bbox: str = Query(..., description="west,south,east,north"),
+    from_year: int = Query(None, ge=2000, le=2100, description="First year to search (default: all cached years)"),
+    to_year: int = Query(None, ge=2000, le=2100, description="Last year to search"),
+    user: str = Depends(verify_credentials),
+):
+    """Segments of the cached years that pass through a bounding box, with the times they were inside it."""
+    try:
+        west, south, east, north = lod.parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid bbox: {e}")
+    return json_response(await asyncio.to_thread(spatial_search, from_year, to_year, lambda g: (
+        spatial_index.rows_in_bbox(g.spatial, g.latitude, g.longitude, west, south, east, north), None)))
+
+@app.get("/positions/near")
+async def get_positions_near(
+    lat: float = Query(..., ge=-90, le=90, description="Latitude of the place"),
+    lon: float = Query(..., ge=-180, le=180, description="Longitude of the place"),
+    radius: float = Query(500, gt=0, le=SPATIAL_MAX_RADIUS_METERS, description="Search radius in meters"),
+    from_year: int = Query(None, ge=2000, le=2100, description="First year to search (default: all cached years)"),
+    to_year: int = Query(None, ge=2000, le=2100, description="Last year to search"),
+    user: str = Depends(verify_credentials),
+):
+    """Segments of the cached years that came within radius meters of a place, with when and how close."""
+    return json_response(await asyncio.to_thread(spatial_search, from_year, to_year, lambda g: spatial_index.rows_near(
+        g.spatial, g.latitude, g.longitude, lat, lon, radius)))
+
+async def live_seed() -> tuple:
+    """(year, incremental state, segment offset) of the current year, refreshed first, to start the live feed from."""
+    year = datetime.now(timezone.utc).year
+    db = app.state.db
+    if not year_cache_status(year)[0]:
+        await ensure_year(year, db)
+    offset = await get_segment_offset_for_year(year, db)
+    await year_flights.do(year, lambda: refresh_year(year, db))
+    return year, year_cache.load_state(CACHE_DIR, year), offset
+
+# One feed of new positions shared by every /positions/live connection
+live_feed = live.LiveFeed(live.source_from_env(), live_seed)
+
+@app.get("/positions/live")
+async def get_live_positions(user: str = Depends(verify_credentials)):
+    """
+    Server-Sent Events with new positions of the current year as they arrive
+    (see app/services/live.py for the events), replacing cache polling.
+    """
+    queue = live_feed.subscribe()
+
+    async def events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), live.LIVE_HEARTBEAT_SECS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"event: {event['type']}\ndata: {codec.dumps(event).decode()}\n\n"
+        finally:
+            live_feed.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/cache/status")
+async def get_cache_status(user: str = Depends(verify_credentials)):
+    """Warm-up progress: each year's build state and timings, the queue and the next current-year refresh."""
+    return warmup.status()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(user: str = Depends(verify_credentials)):
+    """Stage timings, cache hit/miss counts and request totals in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def rollups_body(year: int, body: bytes) -> bytes:
+    data = year_cache.load_rollups(CACHE_DIR, year, body)
+    return codec.dumps({k: v for k, v in data.items() if k not in ("hash", "version")})
+
+@app.get("/rollups")
+async def get_rollups(
+    request: Request,
+    year: int = Query(..., ge=2000, le=2100, description="Year to summarize"),
+    user: str = Depends(verify_credentials),
+    db: LazyAsyncClient = Depends(get_db)
+):
+    """
+    Daily and hourly rollups of a year (speeds, distance, engine time, activity),
+    built with the year cache, for the timeline and prev/next navigation.
+    """
+    try:
+        cached, stale = year_cache_status(year)
+        if not cached:
+            metrics.cache_miss("year_file")
+            await ensure_year(year, db)
+        else:
+            metrics.cache_hit("year_file")
+            if stale:
+                year_flights.start(year, lambda: refresh_year(year, db))
+
+        cache_path = year_cache.cache_path(CACHE_DIR, year)
+        entry = await asyncio.to_thread(year_payloads.get_file, ("rollups", year), cache_path,
+                                        lambda body: rollups_body(year, body))
+        if entry is None:
+            raise FileNotFoundError(cache_path)
+        return encoded_response(request, entry)
+    except Exception as e:
+        print(f"Error fetching rollups: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.get("/engine-hours/latest")
 async def get_latest_engine_hours(user: str = Depends(verify_credentials)):
     """Fetch the latest recorded engine hours from Firestore."""
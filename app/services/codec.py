@@ -0,0 +1,78 @@
+from typing import List, Optional, TypedDict
+import orjson
+
+# JSON encoding for the cache files, API responses and CLI dumps.
+#
+# orjson encodes the payload columns (long lists of plain numbers) about ten
+# times faster than json.dumps and parses them several times faster than
+# json.loads, and it writes bytes directly. Payloads are described by the typed
+# schema below; decode_payload checks a decoded cache file against it before it
+# is used.
+
+
+class Columns(TypedDict):
+    utc_shifted_tstamp: List[float]
+    latitude: List[Optional[float]]
+    longitude: List[Optional[float]]
+    altitude: List[Optional[float]]
+    engine_hours: List[Optional[float]]
+    rpm: List[Optional[float]]
+    coolant_temp: List[Optional[float]]
+    alternator_voltage: List[Optional[float]]
+    tz_offset: List[Optional[int]]          # index into Payload.tz_offsets
+    is_delta: List[bool]
+    duration_secs: List[Optional[float]]
+    mph: List[float]
+    knots: List[float]
+    delta_miles: List[float]
+
+
+class Payload(TypedDict, total=False):
+    version: int
+    from_timestamp: float
+    to_timestamp: float
+    count: int
+    columns: Columns
+    tz_offsets: List[str]
+    segments: List[List[int]]               # [start, end) row ranges
+    segment_offset: Optional[int]
+    rows: List[int]                         # subsets only (wire_format.take_rows)
+    segment_ids: List[int]
+
+
+PAYLOAD_KEYS = ("version", "from_timestamp", "to_timestamp", "count", "columns", "tz_offsets", "segments",
+                "segment_offset")
+COLUMN_NAMES = tuple(Columns.__annotations__)
+
+
+def dumps(data, indent: bool = False) -> bytes:
+    """UTF-8 JSON bytes of data."""
+    return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+def loads(data):
+    """Parse JSON bytes or str."""
+    return orjson.loads(data)
+
+
+def decode_payload(body, version: Optional[int] = None) -> Payload:
+    """
+    Parse a payload and check it against the schema: every key present, every
+    column count long, segments inside the rows. Raises ValueError otherwise.
+    """
+    payload = loads(body)
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not an object")
+    missing = [key for key in PAYLOAD_KEYS if key not in payload]
+    if missing:
+        raise ValueError(f"payload is missing {', '.join(missing)}")
+    if version is not None and payload["version"] != version:
+        raise ValueError(f"payload version {payload['version']}, expected {version}")
+    count = payload["count"]
+    columns = payload["columns"]
+    for name in COLUMN_NAMES:
+        if len(columns.get(name, ())) != count:
+            raise ValueError(f"column {name} does not have {count} rows")
+    if any(not 0 <= start < end <= count for start, end in payload["segments"]):
+        raise ValueError("segment outside the payload rows")
+    return payload
@@ -0,0 +1,225 @@
+from typing import NamedTuple, Optional
+import math
+import numpy as np
+
+# Distance kernel used by the position pipeline.
+#
+# "ellipsoidal" solves the inverse problem on the WGS-84 ellipsoid (Vincenty) and
+# agrees with geopy.distance.geodesic to within 1e-6 miles (a few millimetres) for
+# any pair of points that are not nearly antipodal; those rare pairs fall back to
+# geodesic itself. "haversine" uses a spherical earth and is within 0.6% of geodesic.
+
+ELLIPSOIDAL = "ellipsoidal"
+HAVERSINE = "haversine"
+MODES = (ELLIPSOIDAL, HAVERSINE)
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+MEAN_EARTH_RADIUS_MILES = 6371.0088 / 1.609344
+METERS_PER_MILE = 1609.344
+
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 200
+
+
+class PathDistances(NamedTuple):
+    consecutive: np.ndarray   # consecutive[i] = distance(i, i + 1), length n - 1
+    skip_one: np.ndarray      # skip_one[i] = distance(i, i + 2), length n - 2
+    to_anchor: np.ndarray     # to_anchor[i] = distance(i, anchor), length n (empty without an anchor)
+
+
+def _check_mode(mode):
+    if mode not in MODES:
+        raise ValueError(f"Unknown distance mode: {mode}")
+
+
+def _is_valid(lat, lon):
+    return -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def _vincenty_miles(lat1, lon1, lat2, lon2):
+    """Scalar Vincenty inverse on WGS-84, or None if it does not converge."""
+    f = WGS84_F
+    L = math.radians(lon2 - lon1)
+    U1 = math.atan((1 - f) * math.tan(math.radians(lat1)))
+    U2 = math.atan((1 - f) * math.tan(math.radians(lat2)))
+    sinU1, cosU1 = math.sin(U1), math.cos(U1)
+    sinU2, cosU2 = math.sin(U2), math.cos(U2)
+
+    lam = L
+    for _ in range(VINCENTY_MAX_ITERATIONS):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cosU1 * cosU2 * sin_lam / sin_sigma
+        cos2_alpha = 1 - sin_alpha * sin_alpha
+        cos_2sm = cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha if cos2_alpha != 0 else 0.0
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        lam_prev = lam
+        lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm * cos_2sm)))
+        if abs(lam - lam_prev) < VINCENTY_TOLERANCE:
+            break
+    else:
+        return None
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sm * cos_2sm)
+        - B / 6 * cos_2sm * (-3 + 4 * sin_sigma * sin_sigma) * (-3 + 4 * cos_2sm * cos_2sm)))
+    return WGS84_B * A * (sigma - delta_sigma) / METERS_PER_MILE
+
+
+def _haversine_miles(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lam = math.radians(lon2 - lon1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lam / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _geodesic_miles(lat1, lon1, lat2, lon2):
+    from geopy.distance import geodesic
+    return geodesic((lat1, lon1), (lat2, lon2)).miles
+
+
+def distance_miles(lat1, lon1, lat2, lon2, mode=ELLIPSOIDAL):
+    """Distance in miles between two points, 0.0 if either point is invalid."""
+    _check_mode(mode)
+    if not (_is_valid(lat1, lon1) and _is_valid(lat2, lon2)):
+        return 0.0
+    if mode == HAVERSINE:
+        return _haversine_miles(lat1, lon1, lat2, lon2)
+    miles = _vincenty_miles(lat1, lon1, lat2, lon2)
+    if miles is None:
+        miles = _geodesic_miles(lat1, lon1, lat2, lon2)
+    return miles
+
+
+def _vincenty_miles_array(lat1, lon1, lat2, lon2):
+    f = WGS84_F
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    active = np.ones(L.shape, dtype=bool)
+    sin_sigma = np.zeros(L.shape)
+    cos_sigma = np.ones(L.shape)
+    sigma = np.zeros(L.shape)
+    cos2_alpha = np.ones(L.shape)
+    cos_2sm = np.zeros(L.shape)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            idx = np.flatnonzero(active)
+            if idx.size == 0:
+                break
+            lm = lam[idx]
+            su1, cu1, su2, cu2 = sinU1[idx], cosU1[idx], sinU2[idx], cosU2[idx]
+            sin_lam, cos_lam = np.sin(lm), np.cos(lm)
+            s_sig = np.hypot(cu2 * sin_lam, cu1 * su2 - su1 * cu2 * cos_lam)
+            c_sig = su1 * su2 + cu1 * cu2 * cos_lam
+            sig = np.arctan2(s_sig, c_sig)
+            sin_alpha = np.where(s_sig == 0, 0.0, cu1 * cu2 * sin_lam / s_sig)
+            c2a = 1 - sin_alpha * sin_alpha
+            c2sm = np.where(c2a == 0, 0.0, c_sig - 2 * su1 * su2 / c2a)
+            C = f / 16 * c2a * (4 + f * (4 - 3 * c2a))
+            new_lam = L[idx] + (1 - C) * f * sin_alpha * (
+                sig + C * s_sig * (c2sm + C * c_sig * (-1 + 2 * c2sm * c2sm)))
+
+            sin_sigma[idx], cos_sigma[idx], sigma[idx] = s_sig, c_sig, sig
+            cos2_alpha[idx], cos_2sm[idx] = c2a, c2sm
+            done = (np.abs(new_lam - lm) < VINCENTY_TOLERANCE) | (s_sig == 0)
+            lam[idx] = new_lam
+            active[idx[done]] = False
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sm + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sm * cos_2sm)
+            - B / 6 * cos_2sm * (-3 + 4 * sin_sigma * sin_sigma) * (-3 + 4 * cos_2sm * cos_2sm)))
+        miles = WGS84_B * A * (sigma - delta_sigma) / METERS_PER_MILE
+        miles[sin_sigma == 0] = 0.0
+
+    # Nearly antipodal pairs never converge; hand them to geodesic one by one.
+    for k in np.flatnonzero(active):
+        miles[k] = _geodesic_miles(lat1[k], lon1[k], lat2[k], lon2[k])
+    return miles
+
+
+def _haversine_miles_array(lat1, lon1, lat2, lon2):
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lam = np.radians(lon2 - lon1)
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lam / 2) ** 2
+    return 2 * MEAN_EARTH_RADIUS_MILES * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def distances_miles(lats1, lons1, lats2, lons2, mode=ELLIPSOIDAL):
+    """
+    Element-wise distance in miles between two sets of points.
+
+    Inputs broadcast against each other. Pairs with an invalid or missing (NaN)
+    coordinate get 0.0, matching distance_miles.
+    """
+    _check_mode(mode)
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(
+        *(np.asarray(v, dtype=np.float64) for v in (lats1, lons1, lats2, lons2)))
+    shape = lat1.shape
+    lat1, lon1, lat2, lon2 = (v.ravel() for v in (lat1, lon1, lat2, lon2))
+
+    valid = ((np.abs(lat1) <= 90) & (np.abs(lon1) <= 180) &
+             (np.abs(lat2) <= 90) & (np.abs(lon2) <= 180))
+    miles = np.zeros(lat1.shape)
+    if valid.any():
+        args = (lat1[valid], lon1[valid], lat2[valid], lon2[valid])
+        if mode == HAVERSINE:
+            miles[valid] = _haversine_miles_array(*args)
+        else:
+            miles[valid] = _vincenty_miles_array(*args)
+    return miles.reshape(shape)
+
+
+def path_distances(lats, lons, anchor: Optional[tuple] = None, mode=ELLIPSOIDAL) -> PathDistances:
+    """
+    Consecutive, skip-one and (optionally) anchor distances along a track in one
+    vectorized call.
+
+    Args:
+        lats, lons: Coordinates of the track points, in order.
+        anchor: Optional (lat, lon) to measure every point against.
+        mode: ELLIPSOIDAL or HAVERSINE.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    n_cons = max(n - 1, 0)
+    n_skip = max(n - 2, 0)
+
+    from_lats = [lats[1:], lats[2:]]
+    from_lons = [lons[1:], lons[2:]]
+    to_lats = [lats[:n_cons], lats[:n_skip]]
+    to_lons = [lons[:n_cons], lons[:n_skip]]
+    if anchor is not None:
+        from_lats.append(lats)
+        from_lons.append(lons)
+        to_lats.append(np.full(n, anchor[0], dtype=np.float64))
+        to_lons.append(np.full(n, anchor[1], dtype=np.float64))
+
+    miles = distances_miles(np.concatenate(from_lats), np.concatenate(from_lons),
+                            np.concatenate(to_lats), np.concatenate(to_lons), mode)
+    return PathDistances(
+        consecutive=miles[:n_cons],
+        skip_one=miles[n_cons:n_cons + n_skip],
+        to_anchor=miles[n_cons + n_skip:],
+    )
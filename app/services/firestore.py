@@ -1,9 +1,49 @@
-from google.cloud import firestore
-from google.cloud.firestore_v1.base_query import FieldFilter
-from datetime import datetime, timedelta, timezone
-from geopy.distance import geodesic
-import app.utils.mytime as mytime
-import json
+import time
+import asyncio
+from app.services.positions import PositionTable
+from app.services import metrics
+import app.services.distance as distance
+import numpy as np
+
+# Distance model used throughout the pipeline: distance.ELLIPSOIDAL matches geopy's
+# geodesic, distance.HAVERSINE is a cheaper spherical approximation.
+DISTANCE_MODE = distance.ELLIPSOIDAL
+
+# Number of points the stationary grouping looks ahead for bounces back to the anchor
+LOOK_AHEAD_POINTS = 15
+
+# google.cloud.firestore takes longer to import than the rest of the app together,
+# so it is only imported once a client is actually needed (cache-only servers and
+# mirror-backed runs never import it)
+FIRESTORE_PROJECT = "boat-crumbs"
+
+def async_client(project=FIRESTORE_PROJECT):
+    from google.cloud import firestore
+    return firestore.AsyncClient(project=project)
+
+def sync_client(project=FIRESTORE_PROJECT):
+    from google.cloud import firestore
+    return firestore.Client(project=project)
+
+class LazyAsyncClient:
+    """AsyncClient created on first use."""
+
+    def __init__(self, project=FIRESTORE_PROJECT):
+        self.project = project
+        self._client = None
+
+    def __getattr__(self, name):
+        if self._client is None:
+            self._client = async_client(self.project)
+        return getattr(self._client, name)
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+
+def field_filter(field, op, value):
+    from google.cloud.firestore_v1.base_query import FieldFilter
+    return FieldFilter(field, op, value)
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate the distance between two lat/lon points in miles safely."""
@@ -12,10 +52,14 @@ def calculate_distance(lat1, lon1, lat2, lon2):
             return 0.0
         if not (-180 <= lon1 <= 180) or not (-180 <= lon2 <= 180):
             return 0.0
-        return geodesic((lat1, lon1), (lat2, lon2)).miles
+        return distance.distance_miles(lat1, lon1, lat2, lon2, DISTANCE_MODE)
     except Exception:
         return 0.0
 
+def track_distances(positions, anchor=None):
+    """Batched consecutive/skip-one/anchor distances along a PositionTable."""
+    return distance.path_distances(positions.latitude, positions.longitude, anchor=anchor, mode=DISTANCE_MODE)
+
 def normalize_position(raw_pos):
     """Normalize position document based on key-swap pattern for historical data."""
     tstamp_val = raw_pos.get("utc_shifted_tstamp")
@@ -49,273 +93,369 @@ def normalize_position(raw_pos):
             "is_delta": raw_pos.get("is_delta")
         }
 
-def get_lat_lon_time_values(pos):
-    """Extract latitude, longitude, and timestamp from a position dictionary."""
-    lat = pos.get('latitude')
-    lon = pos.get('longitude')
-    tstamp = pos.get('utc_shifted_tstamp')
-    tz_offset = pos.get('tz_offset')
-    return lat, lon, tstamp, tz_offset
+@metrics.timed("collapse")
+def collapse_duplicates(positions):
+    """Fold points within 0.0001 miles (0.5 feet) of the last kept point into it."""
+    tstamps = positions.utc_shifted_tstamp.tolist()
+    lats = positions.latitude.tolist()
+    lons = positions.longitude.tolist()
+    durations = positions.duration_secs.tolist()
+    consecutive = track_distances(positions).consecutive.tolist()
 
-#
-# adds to pos object
-#
-def add_speed(prev_pos, pos):
-    prev_lat, prev_lon, prev_utc_tstamp, prev_tz_offset = get_lat_lon_time_values(prev_pos)
-    lat, lon, utc_tstamp, tz_offset = get_lat_lon_time_values(pos)
+    kept = [0]
+    for i in range(1, len(positions)):
+        prev = kept[-1]
+        if prev == i - 1:
+            dist = consecutive[i - 1]
+        else:
+            # Previous point was folded away, so compare against the last kept point
+            dist = calculate_distance(lats[i], lons[i], lats[prev], lons[prev])
+        if dist < 0.0001:
+            # Fold into previous
+            durations[prev] = tstamps[i] - tstamps[prev]
+        else:
+            kept.append(i)
 
-    local_tz = mytime.get_timezone(tz_offset)
-    local_tstamp = mytime.unshift_timestamp(utc_tstamp, local_tz)
-    pos['utc_shifted_time'] = str(datetime.fromtimestamp(utc_tstamp, timezone.utc))
-    pos['local_time'] = str(datetime.fromtimestamp(local_tstamp, local_tz))
+    positions.duration_secs = np.array(durations, dtype=np.float64)
+    return positions.take(kept)
 
-    # Prevent division by zero
-    if utc_tstamp == prev_utc_tstamp:
-        pos['mph'] = 0.0
-        pos['knots'] = 0.0
-        pos['delta_miles'] = 0.0
-        return
+@metrics.timed("spike_filter")
+def filter_spikes(positions):
+    """Drop points more than 0.15 miles from both neighbors while the neighbors are within 0.15 miles of each other."""
+    n = len(positions)
+    if n < 3:
+        return positions
+    dists = track_distances(positions)
+    spike = np.zeros(n, dtype=bool)
+    spike[1:-1] = (dists.consecutive[:-1] > 0.15) & (dists.consecutive[1:] > 0.15) & (dists.skip_one < 0.15)
 
-    delta_secs = utc_tstamp - prev_utc_tstamp
-    delta_miles = calculate_distance(lat, lon, prev_lat, prev_lon)
-    mph = delta_miles / (delta_secs / 3600.0)
+    # Fold each spike's duration into the last kept point before it so we do not lose track of time
+    tstamps = positions.utc_shifted_tstamp
+    durations = positions.duration_secs
+    last_kept = np.maximum.accumulate(np.where(spike, 0, np.arange(n)))
+    for i in np.flatnonzero(spike).tolist():
+        prev = last_kept[i]
+        own = durations[i] if not np.isnan(durations[i]) else 0
+        durations[prev] = (tstamps[i] + own) - tstamps[prev]
 
-    pos['mph'] = mph
-    pos['knots'] = (mph * 0.868976)  # Convert to knots
-    pos['delta_miles'] = delta_miles
-    return 
+    return positions.take(~spike)
 
-#
-# prev_pos points to last collected position or None
-# pos points to ignored position at later time
-#
-def add_duration_2prev(pos, prev_pos):
-    if prev_pos is None:
-        return
-    
-    data_points = prev_pos.get('data_points', 1) + 1
-    start_tstamp = prev_pos.get('utc_shifted_tstamp')
-    later_tstamp = pos.get('utc_shifted_tstamp')
-    duration_secs = (later_tstamp + pos.get('duration_secs', 0)) - start_tstamp
-    prev_pos['duration_secs'] = duration_secs
-    
+@metrics.timed("anchor_grouping")
+def group_stationary(positions):
+    """
+    Centroid-based reference-anchor grouping.
 
-def process_raw_positions(raw_positions, filter_spurious=True):
-    # 1. Normalize and filter out Null Island (0,0) coordinates
-    normalized_positions = []
-    for raw in raw_positions:
-        p = normalize_position(raw)
-        if p["utc_shifted_tstamp"] is not None:
-            if not filter_spurious or (p["latitude"] != 0.0 and p["longitude"] != 0.0):
-                normalized_positions.append(p)
-            
-    # 2. Sort chronologically
-    normalized_positions.sort(key=lambda x: x["utc_shifted_tstamp"])
-    
-    if not normalized_positions:
-        return []
+    Each kept point becomes an anchor; later points within 0.15 miles (or short
+    bounces that return to it) are absorbed into its duration and pull its
+    coordinates toward the running centroid. Teleport-speed jumps are skipped.
 
-    # 3. Collapse contiguous duplicate coordinates (dock/drift points with 0 distance)
-    # This collapses consecutive identical points (like the hills/Pennsylvania glitches) into a single point.
-    if filter_spurious:
-        collapsed = []
-        for p in normalized_positions:
-            if not collapsed:
-                collapsed.append(p)
-            else:
-                prev = collapsed[-1]
-                dist = calculate_distance(p["latitude"], p["longitude"], prev["latitude"], prev["longitude"])
-                # If coordinates are identical (within a micro-threshold of 0.0001 miles / 0.5 feet)
-                if dist < 0.0001:
-                    # Fold into previous
-                    prev['duration_secs'] = p["utc_shifted_tstamp"] - prev["utc_shifted_tstamp"]
-                else:
-                    collapsed.append(p)
-        normalized_positions = collapsed
-
-    # 4. Filter out trajectory stay spikes (GPS jumps with immediate return)
-    # Since stay glitches are now collapsed to a single point, they will be discarded here.
-    if filter_spurious:
-        spike_filtered = []
-        n = len(normalized_positions)
-        for i in range(n):
-            p = normalized_positions[i]
-            if i == 0 or i == n - 1:
-                spike_filtered.append(p)
-                continue
-                
-            prev_p = normalized_positions[i - 1]
-            next_p = normalized_positions[i + 1]
-            
-            d_prev = calculate_distance(p["latitude"], p["longitude"], prev_p["latitude"], prev_p["longitude"])
-            d_next = calculate_distance(p["latitude"], p["longitude"], next_p["latitude"], next_p["longitude"])
-            d_across = calculate_distance(prev_p["latitude"], prev_p["longitude"], next_p["latitude"], next_p["longitude"])
-            
-            # If the point is more than 0.15 miles from both neighbors, but neighbors are within 0.15 miles
-            if d_prev > 0.15 and d_next > 0.15 and d_across < 0.15:
-                # Discard this stay spike!
-                # Fold its duration into the previous anchor so we do not lose track of time
-                if len(spike_filtered) > 0:
-                    prev_anchor = spike_filtered[-1]
-                    prev_anchor['duration_secs'] = (p["utc_shifted_tstamp"] + p.get('duration_secs', 0)) - prev_anchor["utc_shifted_tstamp"]
-                continue
-                
-            spike_filtered.append(p)
-        normalized_positions = spike_filtered
-
-    # 5. Group stationary points using Centroid-Based Reference-Anchor Algorithm
-    positions = []
-    if not filter_spurious:
-        for pos in normalized_positions:
-            pos['is_delta'] = True
-        positions = normalized_positions
-    else:
-        anchor = None
-        stationary_points = []
-        i = 0
-        n = len(normalized_positions)
-        while i < n:
-            pos = normalized_positions[i]
-            if anchor is None:
-                pos['is_delta'] = True
-                anchor = pos
-                stationary_points = [pos]
-                positions.append(pos)
-                i += 1
-            else:
-                # Look ahead to see if this is a temporary bounce that returns to the current anchor
-                bounce_found = False
-                bounce_end_idx = -1
-                
-                # We look ahead up to 15 points or 20 minutes (1200 seconds).
-                # We also allow up to 5 points of look-ahead regardless of time to catch jump-and-sleep bounces.
-                look_ahead_limit = min(i + 15, n)
-                for j in range(i, look_ahead_limit):
-                    p_ahead = normalized_positions[j]
-                    time_diff = p_ahead["utc_shifted_tstamp"] - anchor["utc_shifted_tstamp"]
-                    if time_diff > 1200 and (j - i) >= 5:
-                        break
-                        
-                    dist_to_anchor = calculate_distance(p_ahead["latitude"], p_ahead["longitude"], anchor["latitude"], anchor["longitude"])
-                    
-                    # If it returns to the anchor
-                    if dist_to_anchor <= 0.15:
-                        # Verify that all intermediate points (from i to j) are within 5.0 miles of the anchor
-                        all_within_limit = True
-                        for k in range(i, j + 1):
-                            pk = normalized_positions[k]
-                            dk = calculate_distance(pk["latitude"], pk["longitude"], anchor["latitude"], anchor["longitude"])
-                            if dk > 5.0:
-                                all_within_limit = False
-                                break
-                        
-                        if all_within_limit:
-                            bounce_found = True
-                            bounce_end_idx = j
-                        break  # Found the return point, stop looking ahead
-                
-                if bounce_found:
-                    # Absorb all points from i to bounce_end_idx into the current anchor
-                    for k in range(i, bounce_end_idx + 1):
-                        pk = normalized_positions[k]
-                        stationary_points.append(pk)
-                        add_duration_2prev(pk, anchor)
-                    
-                    # Update anchor's coordinates to be the running average centroid
-                    lats = [p["latitude"] for p in stationary_points]
-                    lons = [p["longitude"] for p in stationary_points]
-                    anchor["latitude"] = sum(lats) / len(lats)
-                    anchor["longitude"] = sum(lons) / len(lons)
-                    
-                    # Advance index past the absorbed bounce
-                    i = bounce_end_idx + 1
-                    continue
-                
-                # Normal processing if it's not a bounce
-                dist = calculate_distance(pos["latitude"], pos["longitude"], anchor["latitude"], anchor["longitude"])
-                
-                # Check if this point represents a sudden impossible teleportation speed spike (>60 mph)
-                time_diff = pos["utc_shifted_tstamp"] - anchor["utc_shifted_tstamp"]
-                is_spurious = False
-                if time_diff > 0:
-                    speed = dist / (time_diff / 3600.0)
-                    if speed > 60.0 and dist > 0.05:
-                        is_spurious = True
-                
-                if is_spurious:
-                    # Skip this spurious jump entirely
-                    i += 1
-                    continue
-                    
-                pos['is_delta'] = dist > 0.15
-                
-                if pos['is_delta']:
-                    anchor = pos
-                    stationary_points = [pos]
-                    positions.append(pos)
-                else:
-                    stationary_points.append(pos)
-                    add_duration_2prev(pos, anchor)
-                    
-                    # Update anchor's coordinates to be the running average centroid
-                    lats = [p["latitude"] for p in stationary_points]
-                    lons = [p["longitude"] for p in stationary_points]
-                    anchor["latitude"] = sum(lats) / len(lats)
-                    anchor["longitude"] = sum(lons) / len(lons)
-                
+    Runs in a single pass: each distance to the anchor is computed once per anchor
+    position and shared by the bounce look-ahead and the step itself.
+
+    Anchors whose look-ahead window reached the last point are marked unsettled:
+    more data could still turn them into bounces.
+    """
+    tstamps = positions.utc_shifted_tstamp.tolist()
+    lats = positions.latitude.tolist()
+    lons = positions.longitude.tolist()
+    durations = positions.duration_secs.tolist()
+
+    def add_duration_2prev(k, anchor):
+        # Anchor covers the absorbed point, including anything already folded into it
+        own = durations[k] if durations[k] == durations[k] else 0
+        durations[anchor] = (tstamps[k] + own) - tstamps[anchor]
+
+    kept = []
+    anchor = None
+    # Coordinates of the points absorbed into the current anchor, in order
+    stay_lats = []
+    stay_lons = []
+    # Distance from point j to the anchor at its current coordinates
+    anchor_dist = {}
+
+    def dist_to_anchor(j):
+        d = anchor_dist.get(j)
+        if d is None:
+            d = anchor_dist[j] = calculate_distance(lats[j], lons[j], lats[anchor], lons[anchor])
+        return d
+
+    def start_anchor(k):
+        nonlocal anchor
+        anchor = k
+        stay_lats.clear()
+        stay_lons.clear()
+        anchor_dist.clear()
+        kept.append(k)
+
+    def absorb(k):
+        stay_lats.append(lats[k])
+        stay_lons.append(lons[k])
+        add_duration_2prev(k, anchor)
+
+    def recenter():
+        # Running average centroid of the anchor's current coordinates and everything it
+        # absorbed. sum() adds left to right in C, the same float additions as summing the
+        # whole group in order (a carried running total would round differently); the
+        # + 0.0 matches summing from the integer 0 for -0.0.
+        size = len(stay_lats) + 1
+        lats[anchor] = sum(stay_lats, lats[anchor] + 0.0) / size
+        lons[anchor] = sum(stay_lons, lons[anchor] + 0.0) / size
+        anchor_dist.clear()
+
+    i = 0
+    n = len(positions)
+    while i < n:
+        if anchor is None:
+            start_anchor(i)
+            i += 1
+            continue
+
+        # Look ahead to see if this is a temporary bounce that returns to the current anchor
+        bounce_end_idx = -1
+
+        # We look ahead up to 15 points or 20 minutes (1200 seconds).
+        # We also allow up to 5 points of look-ahead regardless of time to catch jump-and-sleep bounces.
+        # A return only counts as a bounce if no point on the way strayed more than 5.0 miles.
+        farthest = 0.0
+        look_ahead_limit = min(i + LOOK_AHEAD_POINTS, n)
+        for j in range(i, look_ahead_limit):
+            time_diff = tstamps[j] - tstamps[anchor]
+            if time_diff > 1200 and (j - i) >= 5:
+                break
+
+            dist_to_j = dist_to_anchor(j)
+            farthest = max(farthest, dist_to_j)
+
+            # If it returns to the anchor
+            if dist_to_j <= 0.15:
+                if farthest <= 5.0:
+                    bounce_end_idx = j
+                break  # Found the return point, stop looking ahead
+
+        if bounce_end_idx >= 0:
+            # Absorb all points from i to bounce_end_idx into the current anchor
+            for k in range(i, bounce_end_idx + 1):
+                absorb(k)
+            recenter()
+
+            # Advance index past the absorbed bounce
+            i = bounce_end_idx + 1
+            continue
+
+        # Normal processing if it's not a bounce
+        dist = dist_to_anchor(i)
+
+        # Check if this point represents a sudden impossible teleportation speed spike (>60 mph)
+        time_diff = tstamps[i] - tstamps[anchor]
+        if time_diff > 0:
+            speed = dist / (time_diff / 3600.0)
+            if speed > 60.0 and dist > 0.05:
+                # Skip this spurious jump entirely
                 i += 1
+                continue
 
-    if not positions:
-        return []
+        if dist > 0.15:
+            start_anchor(i)
+        else:
+            absorb(i)
+            recenter()
+
+        i += 1
 
-    # 6. Calculate speed and local time metrics relative to look-back
+    positions.latitude = np.array(lats, dtype=np.float64)
+    positions.longitude = np.array(lons, dtype=np.float64)
+    positions.duration_secs = np.array(durations, dtype=np.float64)
+    # The last point can still turn out to be a spike, so windows must stop short of it
+    positions.settled = np.arange(n) + LOOK_AHEAD_POINTS < n
+    return positions.take(kept)
+
+@metrics.timed("speed")
+def add_speed(positions):
+    """Fill delta_miles, mph and knots relative to the position two rows back (the first position for the first two rows)."""
     look_back = 2
-    first_pos = positions[0]
-    for idx in range(0, len(positions)):
-        pos = positions[idx]
-        prev_pos = first_pos if idx < look_back else positions[idx - look_back]
-        add_speed(prev_pos, pos)
+    n = len(positions)
+    tstamps = positions.utc_shifted_tstamp
+    dists = track_distances(positions)
+    delta_miles = np.zeros(n)
+    if n > 1:
+        delta_miles[1] = dists.consecutive[0]
+        delta_miles[look_back:] = dists.skip_one
+    prev = np.maximum(np.arange(n) - look_back, 0)
+    delta_secs = tstamps - tstamps[prev]
 
+    # Prevent division by zero
+    moving = delta_secs != 0
+    mph = np.zeros(n)
+    mph[moving] = delta_miles[moving] / (delta_secs[moving] / 3600.0)
+
+    positions.mph = mph
+    positions.knots = mph * 0.868976  # Convert to knots
+    positions.delta_miles = np.where(moving, delta_miles, 0.0)
     return positions
 
-async def fs_fetch_positions(db, from_timestamp: int, to_timestamp: int):
+def normalize_positions(raw_positions, filter_spurious=True):
+    """Raw Firestore documents as a PositionTable in time order."""
+    with metrics.stage("normalize", len(raw_positions)) as timing:
+        # 1. Normalize and filter out Null Island (0,0) coordinates
+        normalized = [normalize_position(raw) for raw in raw_positions]
+        positions = PositionTable.from_records([p for p in normalized if p["utc_shifted_tstamp"] is not None])
+        if filter_spurious:
+            positions = positions.take((positions.latitude != 0.0) & (positions.longitude != 0.0))
+
+        # 2. Sort chronologically
+        positions = positions.take(np.argsort(positions.utc_shifted_tstamp, kind="stable"))
+        timing.points_out = len(positions)
+    return positions
+
+def add_anchor_speed(positions):
+    # Every surviving point is an anchor
+    positions.is_delta[:] = True
+
+    # 6. Calculate speed metrics relative to look-back (local time strings are built in PositionTable.to_dicts)
+    return add_speed(positions)
+
+def pipeline_steps(filter_spurious=True):
+    """(metrics stage name, function) of the steps process_raw_positions runs after normalize_positions, in order."""
+    steps = []
+    if filter_spurious:
+        # 3. Collapse contiguous duplicate coordinates (dock/drift points with 0 distance)
+        # This collapses consecutive identical points (like the hills/Pennsylvania glitches) into a single point.
+        steps.append(("collapse", collapse_duplicates))
+
+        # 4. Filter out trajectory stay spikes (GPS jumps with immediate return)
+        # Since stay glitches are now collapsed to a single point, they will be discarded here.
+        steps.append(("spike_filter", filter_spikes))
+
+        # 5. Group stationary points using Centroid-Based Reference-Anchor Algorithm
+        steps.append(("anchor_grouping", group_stationary))
+
+    steps.append(("speed", add_anchor_speed))
+    return steps
+
+def process_raw_positions(raw_positions, filter_spurious=True):
+    """Run raw Firestore documents through the filter pipeline and return a PositionTable."""
+    positions = normalize_positions(raw_positions, filter_spurious)
+    if len(positions) == 0:
+        return positions
+    for _, step in pipeline_steps(filter_spurious):
+        positions = step(positions)
+    return positions
+
+# Schema marker: gps_meta/schema records which timestamp ranges may still hold
+# documents in the older swapped schema (see migrate_schema.py). Only fetches that
+# overlap one of them also run the swapped query. Without a marker every range does.
+SCHEMA_COLLECTION = "gps_meta"
+SCHEMA_DOCUMENT = "schema"
+SCHEMA_VERSION = 2                   # version 2: every document is in the correct schema
+SCHEMA_TSTAMP_MIN = 0
+SCHEMA_TSTAMP_MAX = 253402300799     # 9999-12-31
+SCHEMA_MARKER_TTL_SECS = 300         # re-read the marker at most this often
+
+_schema_marker = {"fetched_at": None, "legacy_ranges": None}
+
+async def fs_legacy_ranges(db):
+    """[(from, to), ...] timestamp ranges that may still hold swapped-schema documents."""
+    now = time.monotonic()
+    fetched_at = _schema_marker["fetched_at"]
+    if fetched_at is None or now - fetched_at > SCHEMA_MARKER_TTL_SECS:
+        snapshot = await db.collection(SCHEMA_COLLECTION).document(SCHEMA_DOCUMENT).get()
+        marker = snapshot.to_dict() if snapshot.exists else None
+        if marker is None or marker.get("version", 0) < SCHEMA_VERSION:
+            ranges = [(SCHEMA_TSTAMP_MIN, SCHEMA_TSTAMP_MAX)]
+        else:
+            ranges = [(r["from"], r["to"]) for r in marker.get("legacy_ranges", [])]
+        _schema_marker.update(fetched_at=now, legacy_ranges=ranges)
+    return _schema_marker["legacy_ranges"]
+
+def forget_schema_marker():
+    """Make the next fetch re-read the schema marker."""
+    _schema_marker["fetched_at"] = None
+
+async def _range_queries(db, from_timestamp, to_timestamp):
+    """
+    (correct-schema, swapped-schema) queries for a timestamp range. The swapped
+    query is None when the schema marker says the range holds no legacy documents.
+    """
+    query_correct = db.collection("gps_data") \
+                      .where(filter=field_filter("utc_shifted_tstamp", ">=", from_timestamp)) \
+                      .where(filter=field_filter("utc_shifted_tstamp", "<=", to_timestamp))
+
+    # Older (swapped) documents hold the timestamp in the latitude field
+    legacy = any(start <= to_timestamp and from_timestamp <= end for start, end in await fs_legacy_ranges(db))
+    if not legacy:
+        return query_correct, None
+    query_swapped = db.collection("gps_data") \
+                      .where(filter=field_filter("latitude", ">=", from_timestamp)) \
+                      .where(filter=field_filter("latitude", "<=", to_timestamp))
+
+    return query_correct, query_swapped
+
+async def fs_fetch_raw_positions(db, from_timestamp: int, to_timestamp: int):
     """
-    Fetch positions from Firestore based on UNIX timestamp range, supporting
-    both swapped and correct schemas dynamically.
+    Fetch raw position documents from Firestore based on UNIX timestamp range,
+    supporting both swapped and correct schemas dynamically.
 
     Args:
-        db: Firestore client.
+        db: Firestore AsyncClient.
         from_timestamp (int): Start of the range (UNIX timestamp in seconds).
         to_timestamp (int): End of the range (UNIX timestamp in seconds).
 
     Returns:
-        List[Dict]: List of position records from Firestore.
+        Dict[str, Dict]: Raw documents keyed by document ID.
     """
-    # Query both fields in parallel to capture older (swapped) and newer (correct) schemas
-    query_correct = db.collection("gps_data") \
-                      .where(filter=FieldFilter("utc_shifted_tstamp", ">=", from_timestamp)) \
-                      .where(filter=FieldFilter("utc_shifted_tstamp", "<=", to_timestamp))
+    query_correct, query_swapped = await _range_queries(db, from_timestamp, to_timestamp)
+    if query_swapped is None:
+        return await _collect_docs(query_correct)
 
-    query_swapped = db.collection("gps_data") \
-                      .where(filter=FieldFilter("latitude", ">=", from_timestamp)) \
-                      .where(filter=FieldFilter("latitude", "<=", to_timestamp))
-
-    # stream() fetches documents synchronously
-    docs_correct = query_correct.stream()
-    docs_swapped = query_swapped.stream()
+    # Both streams run concurrently without blocking the event loop
+    docs_correct, docs_swapped = await asyncio.gather(
+        _collect_docs(query_correct),
+        _collect_docs(query_swapped),
+    )
 
     # Merge and deduplicate by document ID
-    unique_docs = {}
-    for doc in docs_correct:
-        unique_docs[doc.id] = doc.to_dict()
-        
-    for doc in docs_swapped:
-        if doc.id not in unique_docs:
-            unique_docs[doc.id] = doc.to_dict()
-
-    raw_positions = list(unique_docs.values())
-    
-    return process_raw_positions(raw_positions)
+    unique_docs = docs_correct
+    for doc_id, doc in docs_swapped.items():
+        if doc_id not in unique_docs:
+            unique_docs[doc_id] = doc
+
+    return unique_docs
+
+async def _collect_docs(query):
+    return {doc.id: doc.to_dict() async for doc in query.stream()}
+
+async def _next_doc(docs):
+    doc = await anext(docs, None)
+    return None if doc is None else (doc.id, doc.to_dict())
+
+async def fs_stream_raw_positions(db, from_timestamp: int, to_timestamp: int):
+    """
+    Stream raw position documents from Firestore in timestamp order, as (doc ID, dict).
+
+    Both schemas are queried ordered by their timestamp field (the swapped one
+    only where the schema marker allows legacy documents) and merged as the
+    documents arrive. On equal timestamps correct-schema documents come first,
+    which is the order a stable sort of fs_fetch_raw_positions' result gives.
+    Only swapped-schema documents are taken from the swapped query, so nothing
+    is yielded twice.
+    """
+    query_correct, query_swapped = await _range_queries(db, from_timestamp, to_timestamp)
+    fields = ("utc_shifted_tstamp", "latitude")
+    streams = [aiter(query_correct.order_by("utc_shifted_tstamp").stream())]
+    if query_swapped is not None:
+        streams.append(aiter(query_swapped.order_by("latitude").stream()))
+    heads = [await _next_doc(docs) for docs in streams]
+
+    while True:
+        live = [i for i, head in enumerate(heads) if head is not None]
+        if not live:
+            return
+        i = min(live, key=lambda i: (heads[i][1].get(fields[i]), i))
+        doc_id, doc = heads[i]
+        heads[i] = await _next_doc(streams[i])
+        if i == 1 and not isinstance(doc.get("utc_shifted_tstamp"), str):
+            continue
+        yield doc_id, doc
 
 
 # Track Rejection Constants (Glossary of Rejection Variables)
@@ -336,76 +476,62 @@ STATIONARY_DURATION_THRESHOLD = 1800
 MIN_SEGMENT_RADIUS_MILES = 1.5
 MIN_TRIP_POINTS = 5
 
+@metrics.timed("segmentation")
 def segment_positions(positions, max_gap_secs=SEGMENT_MAX_GAP_SECS, max_gap_miles=SEGMENT_MAX_GAP_MILES, filter_stationary=True):
-    """Segment a list of positions into trips based on time and distance gaps."""
-    segments = []
-    current_segment = []
-    prev = None
-    
-    for pos in positions:
-        if not prev:
-            current_segment.append(pos)
-            prev = pos
-            continue
-            
-        time_gap = pos["utc_shifted_tstamp"] - prev["utc_shifted_tstamp"]
-        dist_gap = calculate_distance(
-            pos["latitude"], pos["longitude"],
-            prev["latitude"], prev["longitude"]
-        )
-        
-        if time_gap > max_gap_secs or dist_gap > max_gap_miles:
-            if len(current_segment) > 0:
-                segments.append(current_segment)
-            current_segment = [pos]
-        else:
-            current_segment.append(pos)
-            
-        prev = pos
-        
-    if len(current_segment) > 0:
-        segments.append(current_segment)
-        
+    """
+    Segment positions into trips based on time and distance gaps.
+
+    Returns a PositionTable of the positions that belong to (kept) segments,
+    with segment_id numbered from 0.
+    """
+    segmented = positions.copy()
+    if len(segmented) == 0:
+        return segmented
+
+    time_gaps = np.diff(segmented.utc_shifted_tstamp)
+    dist_gaps = track_distances(segmented).consecutive
+    breaks = (time_gaps > max_gap_secs) | (dist_gaps > max_gap_miles)
+    segmented.segment_id = np.concatenate(([0], np.cumsum(breaks))).astype(np.int32)
+
     if filter_stationary:
-        filtered_segments = []
-        for seg in segments:
-            pts_count = len(seg)
-            if pts_count == 0:
-                continue
-            start_ts = seg[0]["utc_shifted_tstamp"]
-            end_ts = seg[-1]["utc_shifted_tstamp"]
-            duration = end_ts - start_ts
-            if pts_count == 1 and "duration_secs" in seg[0]:
-                duration = seg[0]["duration_secs"]
-                
-            total_dist = 0.0
-            seg_prev = None
-            for p in seg:
-                if not seg_prev:
-                    seg_prev = p
-                    continue
-                total_dist += calculate_distance(p["latitude"], p["longitude"], seg_prev["latitude"], seg_prev["longitude"])
-                seg_prev = p
-                
-            # Calculate max radius from start point
-            start_p = seg[0]
-            max_radius = 0.0
-            for p in seg:
-                r = calculate_distance(p["latitude"], p["longitude"], start_p["latitude"], start_p["longitude"])
-                if r > max_radius:
-                    max_radius = r
-                    
-            # Basic stationary check
-            is_stationary = pts_count <= STATIONARY_POINTS_THRESHOLD and total_dist < STATIONARY_DISTANCE_THRESHOLD
-            if is_stationary and duration < STATIONARY_DURATION_THRESHOLD:
-                continue
-                
-            # Mooring hop check for active trips (multi-point segments)
-            # If the segment's maximum displacement radius is less than the threshold, we classify it as a spurious mooring hop and discard it.
-            if pts_count > 1 and max_radius < MIN_SEGMENT_RADIUS_MILES:
-                continue
-                
-            filtered_segments.append(seg)
-        segments = filtered_segments
-        
-    return segments
+        segmented = segmented.keep_segments(trip_segment_mask(segmented, dist_gaps))
+
+    return segmented
+
+def trip_segment_mask(segmented, dist_gaps=None):
+    """One bool per segment of an unfiltered segmentation: False for stationary stays and mooring hops."""
+    n = len(segmented)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    if dist_gaps is None:
+        dist_gaps = track_distances(segmented).consecutive
+    starts = segmented.segment_starts()
+    ends = np.append(starts[1:], n)
+    pts_count = ends - starts
+
+    tstamps = segmented.utc_shifted_tstamp
+    duration = tstamps[ends - 1] - tstamps[starts]
+    start_duration = segmented.duration_secs[starts]
+    single = (pts_count == 1) & ~np.isnan(start_duration)
+    duration[single] = start_duration[single]
+
+    # Accumulated distance: only steps between points of the same segment count
+    steps = np.zeros(n)
+    steps[1:] = np.where(segmented.segment_id[1:] == segmented.segment_id[:-1], dist_gaps, 0.0)
+    total_dist = np.add.reduceat(steps, starts)
+
+    # Max radius from each segment's start point
+    start_rows = np.repeat(starts, pts_count)
+    radius = distance.distances_miles(segmented.latitude, segmented.longitude,
+                                      segmented.latitude[start_rows], segmented.longitude[start_rows], DISTANCE_MODE)
+    max_radius = np.maximum.reduceat(radius, starts)
+
+    # Basic stationary check
+    is_stationary = (pts_count <= STATIONARY_POINTS_THRESHOLD) & (total_dist < STATIONARY_DISTANCE_THRESHOLD)
+    short_stay = is_stationary & (duration < STATIONARY_DURATION_THRESHOLD)
+
+    # Mooring hop check for active trips (multi-point segments)
+    # If the segment's maximum displacement radius is less than the threshold, we classify it as a spurious mooring hop and discard it.
+    mooring_hop = (pts_count > 1) & (max_radius < MIN_SEGMENT_RADIUS_MILES)
+
+    return ~(short_stay | mooring_hop)
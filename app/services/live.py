@@ -0,0 +1,230 @@
+import os
+import asyncio
+import contextvars
+from datetime import datetime, timezone
+from app.services.firestore import normalize_position, sync_client, field_filter, FIRESTORE_PROJECT
+from app.services.position_stream import PositionStream
+from app.services import year_cache, wire_format
+
+# Live positions for /positions/live (Server-Sent Events).
+#
+# One LiveFeed serves every connected browser. While anyone is subscribed it
+# tails new gps_data documents from a source (FirestoreWatch, a snapshot
+# listener, or LocalSource as a stand-in) and runs them through a PositionStream
+# seeded from the current year's incremental state (see year_cache), so the
+# results match what the next cache refresh will write. Events are JSON:
+#   snapshot   sent to each new subscriber: live_from, every final row so far, the tail
+#   positions  final (rows released since the last event, or None) and the new tail
+#   reset      the feed restarted; clients should reload the year
+# Positions from live_from on come from the feed; cached positions before it are
+# unchanged. final rows never change again, the tail replaces the previous one.
+# Each payload's segment_offset continues the year's global segment numbering.
+
+LIVE_QUEUE_EVENTS = 64          # events a slow subscriber may fall behind before it is reset
+LIVE_MAX_FINAL_ROWS = 20000     # restart (and re-seed from the year cache) past this many final rows
+LIVE_HEARTBEAT_SECS = 15
+LIVE_SOURCE_ENV = "GPS_LIVE"    # "local" follows a LocalSource instead of Firestore (development and tests)
+
+
+class LocalSource:
+    """Stand-in for FirestoreWatch: documents handed to push() arrive as if Firestore sent them."""
+
+    def __init__(self):
+        self.on_docs = None
+        self.from_timestamp = None
+
+    def start(self, from_timestamp, on_docs):
+        self.from_timestamp = from_timestamp
+        self.on_docs = on_docs
+
+    def push(self, docs):
+        """Deliver (doc ID, raw document) pairs, as a snapshot listener would."""
+        if self.on_docs is not None:
+            self.on_docs([(doc_id, raw) for doc_id, raw in docs
+                          if (normalize_position(raw)["utc_shifted_tstamp"] or 0) >= self.from_timestamp])
+
+    def stop(self):
+        self.on_docs = None
+
+
+class FirestoreWatch:
+    """Snapshot listener on gps_data documents from a timestamp on. Callbacks come from the listener's thread."""
+
+    def __init__(self, project=FIRESTORE_PROJECT):
+        self.project = project
+        self._client = None
+        self._watch = None
+
+    def start(self, from_timestamp, on_docs):
+        def on_snapshot(snapshots, changes, read_time):
+            docs = [(change.document.id, change.document.to_dict()) for change in changes
+                    if change.type.name in ("ADDED", "MODIFIED")]
+            if docs:
+                on_docs(docs)
+
+        self._client = sync_client(self.project)
+        query = self._client.collection("gps_data").where(
+            filter=field_filter("utc_shifted_tstamp", ">=", from_timestamp))
+        self._watch = query.on_snapshot(on_snapshot)
+
+    def stop(self):
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+
+def source_from_env():
+    return LocalSource() if os.getenv(LIVE_SOURCE_ENV) == "local" else FirestoreWatch()
+
+
+class _Tail:
+    """PositionStream over the live documents, and the payloads it produces."""
+
+    def __init__(self, year, state, segment_offset):
+        self.from_timestamp = int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp())
+        self.to_timestamp = int(datetime(year, 12, 31, 23, 59, 59, tzinfo=timezone.utc).timestamp())
+        self.stream = PositionStream(chunk_docs=1)
+        if state is None:
+            # Nothing settled yet this year: follow it from the start
+            self.live_from = self.from_timestamp
+            self.listen_from = self.from_timestamp
+            self.next_segment = segment_offset
+        else:
+            self.stream.pending = dict(state["tail"])
+            self.stream.resume_tstamp = state["resume_tstamp"]
+            self.stream.context = state["context"]
+            self.stream.hwm = state["hwm"]
+            self.live_from = state["resume_tstamp"]
+            self.listen_from = int(max(state["hwm"] - year_cache.INCREMENTAL_OVERLAP_SECS, state["resume_tstamp"]))
+            self.next_segment = state["segment_offset"] + state["resume_segment"]
+        self.final_rows = 0
+        self._tail = None              # (processed positions, tail payload) last sent
+
+    def _payload(self, positions, segment_offset):
+        segmented_all, keep = year_cache.segment_year(positions, self.from_timestamp)
+        segmented = segmented_all.keep_segments(keep)
+        payload = wire_format.encode_payload(segmented, segmented.segment_bounds(), self.from_timestamp,
+                                             self.to_timestamp, segment_offset=segment_offset)
+        return payload, int(keep.sum())
+
+    def advance(self, docs):
+        """Feed raw (doc ID, document) pairs; returns (final payload or None, tail payload)."""
+        records = []
+        for doc_id, raw in docs:
+            rec = normalize_position(raw)
+            tstamp = rec["utc_shifted_tstamp"]
+            if not isinstance(tstamp, (int, float)) or not self.from_timestamp <= tstamp <= self.to_timestamp:
+                continue
+            if self.stream.resume_tstamp is not None and tstamp < self.stream.resume_tstamp:
+                print(f"live.py: skipping late document {doc_id} at {tstamp}; the next cache refresh will include it")
+                continue
+            records.append((doc_id, rec))
+
+        final = None
+        released = self.stream.feed(sorted(records, key=lambda item: item[1]["utc_shifted_tstamp"]))
+        if len(released):
+            final, segments = self._payload(released, self.next_segment)
+            self.next_segment += segments
+            self.final_rows += final["count"]
+        # process() reuses feed()'s result and stays cached while pending is unchanged
+        # (no documents, or only ones already seen), so the tail is only rebuilt when it changed
+        positions = self.stream.process()
+        if self._tail is None or self._tail[0] is not positions:
+            self._tail = positions, self._payload(positions, self.next_segment)[0]
+        return final, self._tail[1]
+
+
+class LiveFeed:
+    def __init__(self, source, seed):
+        """
+        source: LocalSource or FirestoreWatch.
+        seed: async function returning (year, incremental state or None, segment offset of the year).
+        """
+        self.source = source
+        self.seed = seed
+        self.subscribers = set()
+        self._task = None
+        self._finals = []          # final payloads since the feed started
+        self._tail = None
+        self._live_from = None
+
+    def subscribe(self):
+        """Queue receiving this subscriber's events; None marks the end of the feed for it."""
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_EVENTS)
+        self.subscribers.add(queue)
+        if self._task is None:
+            # A clean context: the feed outlives the request that started it
+            self._task = asyncio.get_running_loop().create_task(self._run(), context=contextvars.Context())
+        elif self._tail is not None:
+            queue.put_nowait(self._snapshot())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def close(self):
+        """Stop the feed and end every subscriber's stream."""
+        for queue in list(self.subscribers):
+            self._end(queue, [None])
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _snapshot(self):
+        return {"type": "snapshot", "live_from": self._live_from, "final": list(self._finals), "tail": self._tail}
+
+    def _publish(self, event):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too far behind to catch up: have it reload instead
+                self._end(queue, [{"type": "reset"}, None])
+
+    def _end(self, queue, events):
+        """Replace whatever a subscriber has not read yet with events and drop it."""
+        while not queue.empty():
+            queue.get_nowait()
+        for event in events:
+            queue.put_nowait(event)
+        self.subscribers.discard(queue)
+
+    async def _run(self):
+        try:
+            await self._follow()
+        except Exception as e:
+            print(f"live.py: feed stopped: {e}")
+            for queue in list(self.subscribers):
+                self._end(queue, [{"type": "reset"}, None])
+            self._task = None
+
+    async def _follow(self):
+        loop = asyncio.get_running_loop()
+        incoming = asyncio.Queue()
+        while True:
+            year, state, segment_offset = await self.seed()
+            tail = _Tail(year, state, segment_offset)
+            self._finals, self._live_from = [], tail.live_from
+            _, self._tail = await asyncio.to_thread(tail.advance, [])
+            print(f"live.py: following gps_data from {tail.listen_from} (live from {tail.live_from})")
+            self._publish(self._snapshot())
+
+            self.source.start(tail.listen_from, lambda docs: loop.call_soon_threadsafe(incoming.put_nowait, docs))
+            try:
+                while tail.final_rows < LIVE_MAX_FINAL_ROWS:
+                    docs = await incoming.get()
+                    while not incoming.empty():
+                        docs = docs + incoming.get_nowait()
+                    final, self._tail = await asyncio.to_thread(tail.advance, docs)
+                    if final is not None:
+                        self._finals.append(final)
+                    self._publish({"type": "positions", "final": final, "tail": self._tail})
+            finally:
+                self.source.stop()
+            self._publish({"type": "reset"})
@@ -0,0 +1,118 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+import numpy as np
+from app.services import simplify, spatial_index, wire_format, year_cache, metrics, codec
+
+# Level-of-detail views of cached years for /positions/year?zoom=...&bbox=...
+#
+# Parsed year payloads and their tiers are kept for a few recently used years so
+# bbox requests do not re-read the cache file. Zoom-only views depend on nothing
+# but the tier, so main.py keeps their encoded bytes in the payload LRU instead.
+
+LOD_CACHE_YEARS = 4
+
+
+class YearGeometry(NamedTuple):
+    payload: dict
+    lod: dict
+    latitude: np.ndarray
+    longitude: np.ndarray
+    segment_id: np.ndarray   # k of each row's segment in payload
+    utc_shifted_tstamp: np.ndarray
+    spatial: dict            # grid index, see spatial_index
+
+
+def parse_bbox(bbox):
+    """(west, south, east, north) from a 'west,south,east,north' string."""
+    west, south, east, north = (float(v) for v in bbox.split(","))
+    if west > east or south > north:
+        raise ValueError(f"Invalid bbox: {bbox}")
+    return west, south, east, north
+
+
+def tier_rows(lod, tier, count):
+    return lod["tiers"][tier] if tier is not None else range(count)
+
+
+def select_tier(lod, zoom=None, bbox=None):
+    """Tier for a zoom level, or for the zoom a bbox implies when no zoom is given."""
+    latitude = lod["latitude"]
+    if zoom is None:
+        west, south, east, north = bbox
+        zoom = simplify.zoom_for_bbox(west, south, east, north)
+        latitude = (south + north) / 2
+    return simplify.tier_for_zoom(zoom, latitude)
+
+
+def window_rows(geometry, rows, window):
+    """The rows (ascending) whose timestamp lies in a (from, to) window, found by binary search."""
+    if window is None:
+        return rows
+    start = int(np.searchsorted(geometry.utc_shifted_tstamp, window[0], side="left"))
+    end = int(np.searchsorted(geometry.utc_shifted_tstamp, window[1], side="right"))
+    if isinstance(rows, range):
+        return range(max(rows.start, start), max(min(rows.stop, end), start))
+    rows = np.asarray(rows, dtype=np.int64)
+    return rows[np.searchsorted(rows, start):np.searchsorted(rows, end)]
+
+
+def tier_payload(geometry, tier, window=None):
+    """Subset payload of a year at one tier, within a time window if given."""
+    rows = tier_rows(geometry.lod, tier, geometry.payload["count"])
+    return wire_format.take_rows(geometry.payload, window_rows(geometry, rows, window))
+
+
+def bbox_payload(geometry, zoom, bbox, window=None):
+    """Subset payload of the rows of a tier that fall inside (or lead into) bbox, within a time window if given."""
+    tier = select_tier(geometry.lod, zoom, bbox)
+    rows = tier_rows(geometry.lod, tier, geometry.payload["count"])
+    rows = simplify.rows_in_bbox(geometry.latitude, geometry.longitude, geometry.segment_id, rows, *bbox)
+    return wire_format.take_rows(geometry.payload, window_rows(geometry, rows, window))
+
+
+class YearGeometryCache:
+    def __init__(self, max_years=LOD_CACHE_YEARS):
+        self.max_years = max_years
+        self._years = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_dir, year):
+        """Geometry of a cached year, reloaded when its cache file changes. None without a cache file."""
+        path = year_cache.cache_path(cache_dir, year)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            cached = self._years.get(year)
+            if cached is not None and cached[0] == version:
+                self._years.move_to_end(year)
+                metrics.cache_hit("year_geometry")
+                return cached[1]
+
+        metrics.cache_miss("year_geometry")
+        with metrics.stage("cache_read"):
+            with open(path, "rb") as f:
+                body = f.read()
+            payload = codec.decode_payload(body)
+        columns = payload["columns"]
+        geometry = YearGeometry(
+            payload=payload,
+            lod=year_cache.load_lod(cache_dir, year, payload, body),
+            latitude=np.array(columns["latitude"], dtype=np.float64),
+            longitude=np.array(columns["longitude"], dtype=np.float64),
+            segment_id=spatial_index.segment_ids(payload["count"], payload["segments"]),
+            utc_shifted_tstamp=np.array(columns["utc_shifted_tstamp"], dtype=np.float64),
+            spatial=year_cache.load_spatial(cache_dir, year, payload, body),
+        )
+
+        with self._lock:
+            self._years[year] = (version, geometry)
+            self._years.move_to_end(year)
+            while len(self._years) > self.max_years:
+                self._years.popitem(last=False)
+        return geometry
@@ -0,0 +1,218 @@
+import sys
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+
+# Lightweight per-stage instrumentation.
+#
+# stage() and timed() record a pipeline stage's wall time, rows in and out, and
+# the net number of memory blocks it left allocated (sys.getallocatedblocks, a
+# cheap counter that also sees other threads running at the same time). Records
+# go into process-wide totals, which /metrics serves in the Prometheus text
+# format, and into the current request's list, which ServerTimingMiddleware
+# sends back as a Server-Timing header. Caches count lookups with cache_hit and
+# cache_miss; functools.lru_cache functions can be registered instead.
+#
+# Work done in other processes (parallel backfills) is not counted.
+
+METRIC_PREFIX = "tracker"
+
+_lock = threading.Lock()
+_stages = {}          # stage -> [calls, seconds, rows in, rows out, net allocated blocks]
+_caches = {}          # cache -> [hits, misses]
+_lru_caches = {}      # cache -> function wrapped by functools.lru_cache
+_requests = {}        # route -> [requests, seconds]
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Stage:
+    """Rows a stage produced; set points_out inside a stage() block."""
+
+    def __init__(self, points_in=None):
+        self.points_in = points_in
+        self.points_out = None
+
+
+def record(name, secs, points_in=None, points_out=None, blocks=0):
+    with _lock:
+        totals = _stages.setdefault(name, [0, 0.0, 0, 0, 0])
+        totals[0] += 1
+        totals[1] += secs
+        totals[2] += points_in or 0
+        totals[3] += points_out or 0
+        totals[4] += blocks
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, secs, points_in, points_out))
+
+
+@contextmanager
+def stage(name, points_in=None):
+    """Time the block as stage name."""
+    timing = Stage(points_in)
+    blocks = sys.getallocatedblocks()
+    start_time = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        record(name, time.perf_counter() - start_time, timing.points_in, timing.points_out,
+               sys.getallocatedblocks() - blocks)
+
+
+def timed(name, rows_in=len, rows_out=len):
+    """
+    Decorator timing a function as stage name. Rows in and out are rows_in(first
+    argument) and rows_out(result); pass None to leave either uncounted.
+    """
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name, rows_in(args[0]) if rows_in and args else None) as timing:
+                result = func(*args, **kwargs)
+                if rows_out:
+                    timing.points_out = rows_out(result)
+                return result
+        return wrapper
+    return decorate
+
+
+async def timed_stream(name, items):
+    """Yield from an async iterator, timing only the waits for its next item."""
+    secs = 0.0
+    count = 0
+    iterator = aiter(items)
+    try:
+        while True:
+            start_time = time.perf_counter()
+            try:
+                item = await anext(iterator)
+            except StopAsyncIteration:
+                break
+            finally:
+                secs += time.perf_counter() - start_time
+            count += 1
+            yield item
+    finally:
+        record(name, secs, points_out=count)
+
+
+def cache_hit(cache):
+    with _lock:
+        _caches.setdefault(cache, [0, 0])[0] += 1
+
+
+def cache_miss(cache):
+    with _lock:
+        _caches.setdefault(cache, [0, 0])[1] += 1
+
+
+def register_lru_cache(cache, func):
+    """Report the hits and misses of a functools.lru_cache function as cache."""
+    _lru_caches[cache] = func
+
+
+def server_timing(timings, total_secs):
+    """Server-Timing header value: one entry per stage (summed over its runs) plus the total."""
+    stages = {}
+    for name, secs, points_in, points_out in timings:
+        totals = stages.setdefault(name, [0.0, None, None])
+        totals[0] += secs
+        if points_in is not None:
+            totals[1] = (totals[1] or 0) + points_in
+        if points_out is not None:
+            totals[2] = (totals[2] or 0) + points_out
+    entries = []
+    for name, (secs, points_in, points_out) in stages.items():
+        entry = f"{name};dur={secs * 1000:.2f}"
+        counts = [f"{label}={n}" for label, n in (("in", points_in), ("out", points_out)) if n is not None]
+        if counts:
+            entry += f';desc="{" ".join(counts)}"'
+        entries.append(entry)
+    entries.append(f"total;dur={total_secs * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _route(scope):
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    return "/static" if scope["path"].startswith("/static/") else "other"
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware collecting each request's stages into a Server-Timing header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = []
+        token = _request_timings.set(timings)
+        start_time = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                header = server_timing(timings, time.perf_counter() - start_time).encode()
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            with _lock:
+                totals = _requests.setdefault(_route(scope), [0, 0.0])
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start_time
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+    for labels, value in samples:
+        label_str = ",".join(f'{key}="{_label(v)}"' for key, v in labels.items())
+        lines.append(f"{METRIC_PREFIX}_{name}{{{label_str}}} {value}")
+
+
+def render():
+    """All metrics in the Prometheus text exposition format."""
+    with _lock:
+        stages = {name: list(totals) for name, totals in _stages.items()}
+        caches = {name: list(counts) for name, counts in _caches.items()}
+        requests = {route: list(totals) for route, totals in _requests.items()}
+    for cache, func in _lru_caches.items():
+        info = func.cache_info()
+        counts = caches.setdefault(cache, [0, 0])
+        counts[0] += info.hits
+        counts[1] += info.misses
+
+    lines = []
+    _family(lines, "stage_runs_total", "counter", "Pipeline stage runs.",
+            [({"stage": name}, t[0]) for name, t in stages.items()])
+    _family(lines, "stage_seconds_total", "counter", "Wall time spent in each pipeline stage.",
+            [({"stage": name}, f"{t[1]:.6f}") for name, t in stages.items()])
+    _family(lines, "stage_points_in_total", "counter", "Rows handed to each pipeline stage.",
+            [({"stage": name}, t[2]) for name, t in stages.items()])
+    _family(lines, "stage_points_out_total", "counter", "Rows produced by each pipeline stage.",
+            [({"stage": name}, t[3]) for name, t in stages.items()])
+    _family(lines, "stage_allocated_blocks", "gauge", "Net memory blocks left allocated by each stage, summed over runs.",
+            [({"stage": name}, t[4]) for name, t in stages.items()])
+    _family(lines, "cache_hits_total", "counter", "Cache lookups served from the cache.",
+            [({"cache": name}, c[0]) for name, c in caches.items()])
+    _family(lines, "cache_misses_total", "counter", "Cache lookups that had to load or compute.",
+            [({"cache": name}, c[1]) for name, c in caches.items()])
+    _family(lines, "requests_total", "counter", "HTTP requests handled.",
+            [({"route": route}, r[0]) for route, r in requests.items()])
+    _family(lines, "request_seconds_total", "counter", "Wall time spent handling HTTP requests.",
+            [({"route": route}, f"{r[1]:.6f}") for route, r in requests.items()])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,168 @@
+import os
+import sqlite3
+import asyncio
+from app.services.firestore import fs_fetch_raw_positions, fs_stream_raw_positions, normalize_position
+from app.services import metrics
+
+# Local SQLite mirror of the gps_data collection.
+#
+# Set GPS_MIRROR to the mirror's path (sync_mirror.py keeps it up to date) and
+# range reads it covers are served from it instead of Firestore. Rows hold the
+# normalized document (swapped-schema documents already un-swapped) plus
+#   doc_id     Firestore document ID
+#   swapped    1 if the document was stored in the older swapped schema
+# and come back ordered by (utc_shifted_tstamp, swapped, doc_id), the same order
+# fs_stream_raw_positions yields. Values are stored untyped, exactly as Firestore
+# returned them. The meta table records the newest timestamp synced (hwm).
+#
+# A range is covered when it ends at least MIRROR_OVERLAP_SECS before hwm, so
+# documents that arrive late are not missed.
+
+MIRROR_ENV = "GPS_MIRROR"
+MIRROR_START_TSTAMP = 631152000      # 1990-01-01; documents before this are not mirrored
+MIRROR_END_TSTAMP = 4102444800       # 2100-01-01
+MIRROR_OVERLAP_SECS = 600            # re-sync this much before hwm to catch late arrivals
+MIRROR_BATCH_DOCS = 5000
+
+FIELDS = ("tz_offset", "utc_shifted_tstamp", "latitude", "longitude", "altitude",
+          "engine_hours", "rpm", "coolant_temp", "alternator_voltage", "is_delta")
+
+
+def mirror_path():
+    """Path of the mirror to read from, or None when GPS_MIRROR is not set."""
+    return os.getenv(MIRROR_ENV) or None
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(f"CREATE TABLE IF NOT EXISTS positions (doc_id TEXT PRIMARY KEY, swapped INTEGER, {', '.join(FIELDS)})")
+    conn.execute("CREATE INDEX IF NOT EXISTS positions_tstamp ON positions (utc_shifted_tstamp, swapped, doc_id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+    return conn
+
+
+def get_hwm(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'hwm'").fetchone()
+    return row[0] if row else None
+
+
+def covers(path, from_timestamp, to_timestamp):
+    """True if the mirror at path holds every document of the range."""
+    if not os.path.exists(path):
+        return False
+    conn = connect(path)
+    try:
+        hwm = get_hwm(conn)
+    finally:
+        conn.close()
+    return hwm is not None and from_timestamp >= MIRROR_START_TSTAMP and to_timestamp <= hwm - MIRROR_OVERLAP_SECS
+
+
+def _row(doc_id, raw, rec):
+    return (doc_id, int(isinstance(raw.get("utc_shifted_tstamp"), str))) + tuple(rec[f] for f in FIELDS)
+
+
+def _write(conn, rows, hwm):
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO positions VALUES ({', '.join('?' * (len(FIELDS) + 2))})", rows)
+        conn.execute("INSERT OR REPLACE INTO meta VALUES ('hwm', ?)", (hwm,))
+
+
+async def sync(db, path, full=False):
+    """
+    Copy documents newer than the mirror's hwm (everything with full=True)
+    from Firestore into the mirror at path. Returns the number of documents written.
+    """
+    conn = connect(path)
+    try:
+        hwm = None if full else get_hwm(conn)
+        from_timestamp = MIRROR_START_TSTAMP if hwm is None else int(hwm - MIRROR_OVERLAP_SECS)
+        print(f"mirror.py: syncing gps_data from {from_timestamp} into {path}")
+
+        written = 0
+        rows = []
+        async for doc_id, raw in fs_stream_raw_positions(db, from_timestamp, MIRROR_END_TSTAMP):
+            rec = normalize_position(raw)
+            if not isinstance(rec["utc_shifted_tstamp"], (int, float)):
+                continue
+            hwm = rec["utc_shifted_tstamp"] if hwm is None else max(hwm, rec["utc_shifted_tstamp"])
+            rows.append(_row(doc_id, raw, rec))
+            if len(rows) >= MIRROR_BATCH_DOCS:
+                await asyncio.to_thread(_write, conn, rows, hwm)
+                written += len(rows)
+                rows = []
+        if rows or hwm is not None:
+            await asyncio.to_thread(_write, conn, rows, hwm)
+            written += len(rows)
+        return written
+    finally:
+        conn.close()
+
+
+def write_documents(path, docs, hwm=MIRROR_END_TSTAMP):
+    """
+    Store (doc ID, raw document) pairs from elsewhere than Firestore (such as
+    synthetic data) and mark the mirror synced up to hwm.
+    """
+    conn = connect(path)
+    try:
+        rows = []
+        for doc_id, raw in docs:
+            rec = normalize_position(raw)
+            if isinstance(rec["utc_shifted_tstamp"], (int, float)):
+                rows.append(_row(doc_id, raw, rec))
+        _write(conn, rows, hwm)
+    finally:
+        conn.close()
+
+
+def read_batches(path, from_timestamp, to_timestamp, batch_docs=MIRROR_BATCH_DOCS):
+    """Lists of (doc ID, normalized document) of a range, in stream order."""
+    conn = connect(path)
+    try:
+        cursor = conn.execute(
+            f"SELECT doc_id, {', '.join(FIELDS)} FROM positions "
+            "WHERE utc_shifted_tstamp >= ? AND utc_shifted_tstamp <= ? "
+            "ORDER BY utc_shifted_tstamp, swapped, doc_id", (from_timestamp, to_timestamp))
+        while rows := cursor.fetchmany(batch_docs):
+            yield [(row[0], dict(zip(FIELDS, row[1:]))) for row in rows]
+    finally:
+        conn.close()
+
+
+def read_raw_positions(path, from_timestamp, to_timestamp):
+    """Normalized documents of a range keyed by document ID, in stream order."""
+    return {doc_id: rec for batch in read_batches(path, from_timestamp, to_timestamp) for doc_id, rec in batch}
+
+
+async def _mirror_stream(path, from_timestamp, to_timestamp):
+    batches = read_batches(path, from_timestamp, to_timestamp)
+    while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+        for doc_id, rec in batch:
+            yield doc_id, rec
+
+
+async def stream_raw_positions(db, from_timestamp, to_timestamp):
+    """fs_stream_raw_positions, read from the mirror when it covers the range."""
+    path = mirror_path()
+    if path and await asyncio.to_thread(covers, path, from_timestamp, to_timestamp):
+        async for doc_id, rec in metrics.timed_stream("mirror_read", _mirror_stream(path, from_timestamp, to_timestamp)):
+            yield doc_id, rec
+        return
+    async for doc_id, raw in metrics.timed_stream("firestore_query", fs_stream_raw_positions(db, from_timestamp, to_timestamp)):
+        yield doc_id, raw
+
+
+async def fetch_raw_positions(db, from_timestamp, to_timestamp):
+    """fs_fetch_raw_positions, read from the mirror when it covers the range."""
+    path = mirror_path()
+    if path and await asyncio.to_thread(covers, path, from_timestamp, to_timestamp):
+        with metrics.stage("mirror_read") as timing:
+            docs = await asyncio.to_thread(read_raw_positions, path, from_timestamp, to_timestamp)
+            timing.points_out = len(docs)
+    else:
+        with metrics.stage("firestore_query") as timing:
+            docs = await fs_fetch_raw_positions(db, from_timestamp, to_timestamp)
+            timing.points_out = len(docs)
+    return docs
@@ -0,0 +1,125 @@
+import os
+import numpy as np
+from app.services.firestore import (
+    normalize_position, process_raw_positions, add_speed, segment_positions, SEGMENT_MAX_GAP_SECS,
+)
+from app.services.positions import PositionTable
+from app.services.position_stream import resume_row
+
+# Multi-core process_raw_positions for backfills.
+#
+# Time-sorted documents are split at gaps longer than SEGMENT_MAX_GAP_SECS and
+# each chunk is processed in a worker process as if it began the range. A chunk
+# may still differ from the serial run near its start (an anchor can outlast a
+# gap), so chunks are stitched in order: the serial run is re-computed from the
+# previous chunk's last resume point (see position_stream.resume_row) into the
+# next chunk until it reaches a resume point the chunk's own run also has. From
+# that document on both runs give exactly what the serial run does, so the rest
+# of the chunk is taken from the worker. Speeds are filled in over the stitched
+# table, and the result is identical to process_raw_positions on all documents.
+
+PARALLEL_CHUNKS_PER_WORKER = 4
+PARALLEL_MIN_CHUNK_DOCS = 2000  # smaller chunks are not worth a round trip to a worker
+BOUNDARY_DOCS = 512             # documents past a chunk start re-run serially at first (doubles until stitched)
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def normalize_sorted(raw_docs):
+    """Normalized documents with a numeric timestamp, in (stable) timestamp order."""
+    records = [normalize_position(raw) for raw in raw_docs]
+    records = [rec for rec in records if isinstance(rec["utc_shifted_tstamp"], (int, float))]
+    records.sort(key=lambda rec: rec["utc_shifted_tstamp"])
+    return records
+
+
+def split_at_gaps(tstamps, chunks, min_docs=PARALLEL_MIN_CHUNK_DOCS, max_gap_secs=SEGMENT_MAX_GAP_SECS):
+    """
+    [start, end) index ranges of about len(tstamps) / chunks sorted timestamps
+    each, cut only where the next timestamp is more than max_gap_secs later.
+    """
+    n = len(tstamps)
+    size = max(n // max(chunks, 1), min_docs)
+    gaps = np.flatnonzero(np.diff(tstamps) > max_gap_secs) + 1
+    cuts = [0]
+    while True:
+        k = np.searchsorted(gaps, cuts[-1] + size)
+        if k == len(gaps):
+            break
+        cuts.append(int(gaps[k]))
+    return list(zip(cuts, cuts[1:] + [n]))
+
+
+def _resume_tstamps(positions):
+    """Timestamps of every row a run could be restarted from, with their row indexes."""
+    settled_rows = np.flatnonzero(positions.settled)
+    if len(settled_rows) == 0:
+        return {}
+    starts = segment_positions(positions, filter_stationary=False).segment_starts()
+    starts = starts[(starts > 0) & (starts < settled_rows[-1])]
+    return {float(positions.utc_shifted_tstamp[row]): int(row) for row in starts}
+
+
+def _last_resume_start(tstamps, run):
+    """Index into tstamps of the document a run's last resume point starts from, or None."""
+    row = resume_row(run, segment_positions(run, filter_stationary=False))
+    return None if row is None else int(np.searchsorted(tstamps, run.utc_shifted_tstamp[row], side="left"))
+
+
+def _stitch(records, run_start, chunk_start, chunk_end, chunk_run, boundary_runs):
+    """
+    Serial run over records[run_start:chunk_end], where run_start is a resume
+    point and chunk_run is the run over records[chunk_start:chunk_end].
+    boundary_runs holds runs already done for some (start, end) document ranges.
+    """
+    chunk_resumes = _resume_tstamps(chunk_run)
+    boundary = BOUNDARY_DOCS
+    while True:
+        end = min(chunk_start + boundary, chunk_end)
+        serial = boundary_runs.get((run_start, end))
+        if serial is None:
+            serial = process_raw_positions(records[run_start:end])
+        for row in sorted(_resume_tstamps(serial).values()):
+            tstamp = float(serial.utc_shifted_tstamp[row])
+            if tstamp in chunk_resumes:
+                return PositionTable.concat([serial.take(slice(0, row)),
+                                             chunk_run.take(slice(chunk_resumes[tstamp], None))])
+        if end == chunk_end:
+            return serial
+        boundary *= 2
+
+
+def process_records_parallel(records, executor, workers=None):
+    """
+    process_raw_positions over normalize_sorted records, with chunks processed
+    in executor (a ProcessPoolExecutor).
+    """
+    tstamps = np.array([rec["utc_shifted_tstamp"] for rec in records], dtype=np.float64)
+    bounds = split_at_gaps(tstamps, (workers or default_workers()) * PARALLEL_CHUNKS_PER_WORKER)
+    if len(bounds) == 1:
+        return process_raw_positions(records)
+    chunk_runs = list(executor.map(process_raw_positions, [records[start:end] for start, end in bounds]))
+
+    # The serial run usually joins a chunk's own run within a few documents, so the
+    # stitch will resume from where each chunk's run last could. Do those first
+    # boundary runs in the pool too; _stitch falls back to running them itself.
+    guesses = []
+    for run, (chunk_start, chunk_end) in zip(chunk_runs, bounds[1:]):
+        run_start = _last_resume_start(tstamps, run)
+        if run_start is not None:
+            guesses.append((run_start, min(chunk_start + BOUNDARY_DOCS, chunk_end)))
+    boundary_runs = dict(zip(guesses, executor.map(process_raw_positions, [records[a:b] for a, b in guesses])))
+
+    final = []
+    run, run_start = chunk_runs[0], 0
+    for (chunk_start, chunk_end), chunk_run in zip(bounds[1:], chunk_runs[1:]):
+        # Everything before the run's last resume point is final
+        row = resume_row(run, segment_positions(run, filter_stationary=False))
+        if row is not None:
+            final.append(run.take(slice(0, row)))
+            run_start = int(np.searchsorted(tstamps, run.utc_shifted_tstamp[row], side="left"))
+        run = _stitch(records, run_start, chunk_start, chunk_end, chunk_run, boundary_runs)
+    final.append(run)
+    return add_speed(PositionTable.concat(final))
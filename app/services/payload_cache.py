@@ -0,0 +1,131 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+from app.services import metrics
+
+try:
+    import brotli
+except ImportError:  # optional: without it we only offer gzip
+    brotli = None
+
+# In-memory LRU of encoded response bodies.
+#
+# Entries hold the JSON bytes of a cache file exactly as stored on disk (or a
+# transform of them, such as the binary format), plus gzip (and brotli, if
+# installed) variants and an ETag, so a hit never parses or re-encodes JSON.
+# An entry is tied to the file's mtime and size and is reloaded when the file
+# is rewritten. Size is bounded by the total bytes of all variants.
+
+PAYLOAD_CACHE_MAX_BYTES = 256 * 1024 * 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+IDENTITY = "identity"
+JSON_MEDIA_TYPE = "application/json"
+
+
+class Entry(NamedTuple):
+    version: tuple        # (mtime_ns, size) of the source file
+    etag: str             # quoted ETag of the identity body
+    bodies: dict          # content-coding -> bytes
+    size: int             # total bytes across bodies
+    media_type: str
+
+
+@metrics.timed("compress", rows_in=None, rows_out=None)
+def encode_entry(body, version=None, media_type=JSON_MEDIA_TYPE):
+    """Build an entry (ETag and compressed variants) for a response body."""
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    bodies = {IDENTITY: body, "gzip": gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return Entry(version, etag, bodies, sum(len(b) for b in bodies.values()), media_type)
+
+
+def variant_etag(etag, coding):
+    """Each content-coding is its own representation, so it gets its own tag."""
+    return etag if coding == IDENTITY else f'{etag[:-1]}-{coding}"'
+
+
+def pick_encoding(entry, accept_encoding):
+    """Smallest-first choice of br, gzip or identity allowed by an Accept-Encoding header."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for coding in ("br", "gzip"):
+        if coding in entry.bodies and (coding in accepted or "*" in accepted):
+            return coding
+    return IDENTITY
+
+
+def etag_matches(entry, if_none_match):
+    """True if an If-None-Match header names any representation of entry."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return any(variant_etag(entry.etag, coding) in tags for coding in entry.bodies)
+
+
+class PayloadCache:
+    def __init__(self, max_bytes=PAYLOAD_CACHE_MAX_BYTES, name="payload"):
+        self.name = name        # cache label in /metrics
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_file(self, key, path, transform=None, media_type=JSON_MEDIA_TYPE):
+        """
+        Entry for the JSON file at path, loading and encoding it on a miss or
+        when the file changed. With transform, the entry holds transform(file
+        bytes) instead. Returns None if the file does not exist.
+        """
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.invalidate(key)
+            return None
+        version = (st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                metrics.cache_hit(self.name)
+                return entry
+
+        metrics.cache_miss(self.name)
+        with metrics.stage("cache_read"):
+            with open(path, "rb") as f:
+                body = f.read()
+        if transform is not None:
+            body = transform(body)
+        entry = encode_entry(body, version, media_type)
+        self.put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
+            if entry.size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def invalidate(self, key):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old.size
@@ -0,0 +1,156 @@
+import asyncio
+import numpy as np
+from app.services.firestore import normalize_position, process_raw_positions, add_speed, segment_positions
+from app.services.positions import PositionTable
+from app.services import mirror
+
+# Streaming version of the fetch -> normalize -> filter -> segment pipeline.
+#
+# Documents arrive from Firestore (or the local mirror, see mirror.py) in
+# timestamp order and are fed to a PositionStream in chunks. After each chunk
+# the pending documents are run through process_raw_positions, and every row
+# before the last segment start whose look-ahead window has closed is released:
+# no later document can change it, and re-running the pipeline from that
+# document alone gives exactly what a single pass over the whole range would
+# (the same rule year_cache uses to resume incremental refreshes). Only the unreleased tail stays in memory, and the next
+# chunk downloads while the previous one is processed in a worker thread.
+
+STREAM_CHUNK_DOCS = 5000  # documents per processing step
+
+
+def context_table(context):
+    """PositionTable of [tstamp, lat, lon] rows kept for speeds across a resume point."""
+    table = PositionTable(len(context))
+    for i, (tstamp, lat, lon) in enumerate(context):
+        table.utc_shifted_tstamp[i] = tstamp
+        table.latitude[i] = lat
+        table.longitude[i] = lon
+    return table
+
+
+def context_rows(table, end):
+    """[tstamp, lat, lon] of the two rows of table before end."""
+    rows = table.take(slice(max(end - 2, 0), end))
+    return [[float(t), float(lat), float(lon)]
+            for t, lat, lon in zip(rows.utc_shifted_tstamp, rows.latitude, rows.longitude)]
+
+
+def resume_row(positions, segmented_all):
+    """
+    Last segment start (of the unfiltered segmentation) before the last settled
+    row, or None if there is none yet.
+    """
+    settled_rows = np.flatnonzero(positions.settled)
+    if len(settled_rows) == 0:
+        return None
+    starts = segmented_all.segment_starts()
+    candidates = starts[(starts > 0) & (starts < settled_rows[-1])]
+    return int(candidates[-1]) if len(candidates) else None
+
+
+class PositionStream:
+    """process_raw_positions over normalized documents fed in timestamp order."""
+
+    def __init__(self, chunk_docs=STREAM_CHUNK_DOCS):
+        self.chunk_docs = chunk_docs
+        self.pending = {}            # doc ID -> normalized document from resume_tstamp onward
+        self.resume_tstamp = None    # timestamp of the first unreleased row
+        self.context = []            # [tstamp, lat, lon] of the last two released rows
+        self.hwm = None              # newest document timestamp fed so far
+        self._process_at = chunk_docs
+        self._processed = None       # process() result until pending changes
+
+    def process(self):
+        """Processed positions of the pending documents, with speeds continuing from the released rows."""
+        if self._processed is None:
+            positions = process_raw_positions(list(self.pending.values()))
+            context = context_table(self.context)
+            self._processed = add_speed(PositionTable.concat([context, positions])).take(slice(len(context), None))
+        return self._processed
+
+    def feed(self, records):
+        """
+        Add (doc ID, normalized document) pairs and return the positions that
+        became final, which always end just before a segment start.
+        """
+        for doc_id, rec in records:
+            tstamp = rec["utc_shifted_tstamp"]
+            if self.resume_tstamp is not None and tstamp < self.resume_tstamp:
+                raise ValueError(f"Document {doc_id} at {tstamp} is older than released positions")
+            if self.pending.get(doc_id) != rec:
+                self.pending[doc_id] = rec
+                self._processed = None
+            self.hwm = tstamp if self.hwm is None else max(self.hwm, tstamp)
+
+        # A long stretch without a usable segment start keeps growing the tail;
+        # wait for it to double before trying again so the work stays linear
+        if len(self.pending) < self._process_at:
+            return PositionTable(0)
+        positions = self.process()
+        row = resume_row(positions, segment_positions(positions, filter_stationary=False))
+        if row is None:
+            self._process_at = 2 * len(self.pending)
+            return PositionTable(0)
+
+        with_context = PositionTable.concat([context_table(self.context), positions])
+        self.context = context_rows(with_context, len(self.context) + row)
+        self.resume_tstamp = float(positions.utc_shifted_tstamp[row])
+        self.pending = {doc_id: rec for doc_id, rec in self.pending.items()
+                        if rec["utc_shifted_tstamp"] >= self.resume_tstamp}
+        self._processed = None
+        self._process_at = len(self.pending) + self.chunk_docs
+        return positions.take(slice(0, row))
+
+
+async def _document_chunks(db, from_timestamp, to_timestamp, chunk_docs):
+    """Lists of (doc ID, normalized document), never splitting documents with equal timestamps."""
+    chunk = []
+    async for doc_id, raw in mirror.stream_raw_positions(db, from_timestamp, to_timestamp):
+        rec = normalize_position(raw)
+        tstamp = rec["utc_shifted_tstamp"]
+        if not isinstance(tstamp, (int, float)):
+            continue
+        if len(chunk) >= chunk_docs and tstamp != chunk[-1][1]["utc_shifted_tstamp"]:
+            yield chunk
+            chunk = []
+        chunk.append((doc_id, rec))
+    if chunk:
+        yield chunk
+
+
+async def stream_positions(db, from_timestamp, to_timestamp, stream):
+    """
+    Feed the documents of a range into stream as they arrive, yielding each batch
+    of released positions. Rows still pending at the end are left in stream
+    (see PositionStream.process).
+    """
+    feeding = None
+    async for chunk in _document_chunks(db, from_timestamp, to_timestamp, stream.chunk_docs):
+        if feeding is not None:
+            released = await feeding
+            if len(released):
+                yield released
+        # CPU-bound: runs in a worker thread while the next chunk downloads
+        feeding = asyncio.ensure_future(asyncio.to_thread(stream.feed, chunk))
+    if feeding is not None:
+        released = await feeding
+        if len(released):
+            yield released
+
+
+async def fs_fetch_positions(db, from_timestamp: int, to_timestamp: int):
+    """
+    Fetch and process positions from Firestore based on UNIX timestamp range.
+
+    Args:
+        db: Firestore AsyncClient.
+        from_timestamp (int): Start of the range (UNIX timestamp in seconds).
+        to_timestamp (int): End of the range (UNIX timestamp in seconds).
+
+    Returns:
+        PositionTable: Processed positions from Firestore.
+    """
+    stream = PositionStream()
+    pieces = [released async for released in stream_positions(db, from_timestamp, to_timestamp, stream)]
+    pieces.append(await asyncio.to_thread(stream.process))
+    return PositionTable.concat(pieces)
@@ -0,0 +1,192 @@
+import numpy as np
+import app.utils.mytime as mytime
+
+# Columnar (struct-of-arrays) store for positions flowing through the pipeline.
+#
+# Missing numeric values are NaN, duration_secs is NaN for points that never had
+# anything folded into them, and segment_id is -1 until segment_positions runs.
+# settled is False for the last few anchors whose look-ahead window ran past the
+# end of the data, so later documents could still change them.
+# Dicts are only built at the API boundary by to_dicts().
+
+TELEMETRY_FIELDS = ("altitude", "engine_hours", "rpm", "coolant_temp", "alternator_voltage")
+
+COLUMNS = (
+    # name, dtype, fill value
+    ("utc_shifted_tstamp", np.float64, np.nan),
+    ("latitude", np.float64, np.nan),
+    ("longitude", np.float64, np.nan),
+    ("altitude", np.float32, np.nan),
+    ("engine_hours", np.float32, np.nan),
+    ("rpm", np.float32, np.nan),
+    ("coolant_temp", np.float32, np.nan),
+    ("alternator_voltage", np.float32, np.nan),
+    ("tz_offset", object, None),
+    ("is_delta", np.bool_, False),
+    ("duration_secs", np.float64, np.nan),
+    ("mph", np.float64, 0.0),
+    ("knots", np.float64, 0.0),
+    ("delta_miles", np.float64, 0.0),
+    ("segment_id", np.int32, -1),
+    ("settled", np.bool_, True),
+)
+COLUMN_NAMES = tuple(name for name, _, _ in COLUMNS)
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+
+class PositionTable:
+    """Positions stored as one NumPy array per field, all of equal length."""
+
+    __slots__ = COLUMN_NAMES
+
+    def __init__(self, size=0):
+        for name, dtype, fill in COLUMNS:
+            setattr(self, name, np.full(size, fill, dtype=dtype))
+
+    def __len__(self):
+        return len(self.utc_shifted_tstamp)
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from normalized position dicts (see normalize_position)."""
+        table = cls(len(records))
+        for name, dtype, fill in COLUMNS:
+            if name == "tz_offset":
+                table.tz_offset[:] = [r.get("tz_offset") for r in records]
+            elif name == "is_delta":
+                table.is_delta[:] = [bool(r.get("is_delta")) for r in records]
+            elif name not in ("segment_id", "settled"):
+                setattr(table, name, np.array([_number(r.get(name, fill)) for r in records], dtype=dtype))
+        return table
+
+    def take(self, index):
+        """New table holding the rows selected by an index array, mask or slice."""
+        table = PositionTable.__new__(PositionTable)
+        for name in COLUMN_NAMES:
+            setattr(table, name, getattr(self, name)[index].copy())
+        return table
+
+    def copy(self):
+        return self.take(slice(None))
+
+    @staticmethod
+    def concat(tables):
+        """Stack tables row-wise, in order."""
+        table = PositionTable(0)
+        if tables:
+            for name in COLUMN_NAMES:
+                setattr(table, name, np.concatenate([getattr(t, name) for t in tables]))
+        return table
+
+    def segment_starts(self):
+        """Row index where each segment begins (segment_id changes)."""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64)
+        change = np.flatnonzero(self.segment_id[1:] != self.segment_id[:-1]) + 1
+        return np.concatenate(([0], change))
+
+    def segment_bounds(self):
+        """[(start, end), ...] row ranges of consecutive segments."""
+        starts = self.segment_starts()
+        ends = np.append(starts[1:], len(self))
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def keep_segments(self, keep):
+        """Rows of the segments flagged in keep (one bool per segment), renumbered from 0."""
+        keep = np.asarray(keep, dtype=bool)
+        starts = self.segment_starts()
+        lengths = np.diff(np.append(starts, len(self)))
+        table = self.take(np.repeat(keep, lengths))
+        table.segment_id = np.repeat(np.arange(int(keep.sum()), dtype=np.int32), lengths[keep])
+        return table
+
+    def to_columns(self):
+        """Plain per-field lists for the compact wire format (see wire_format)."""
+        return {
+            "utc_shifted_tstamp": _plain_numbers(self.utc_shifted_tstamp, ints=True),
+            "latitude": _plain_numbers(self.latitude),
+            "longitude": _plain_numbers(self.longitude),
+            **{name: _plain_float32(getattr(self, name)) for name in TELEMETRY_FIELDS},
+            "tz_offset": self.tz_offset.tolist(),
+            "is_delta": self.is_delta.tolist(),
+            "duration_secs": _plain_numbers(self.duration_secs, ints=True),
+            "mph": self.mph.tolist(),
+            "knots": self.knots.tolist(),
+            "delta_miles": self.delta_miles.tolist(),
+        }
+
+    def to_dicts(self, segment_offset=None):
+        """
+        Build API position dicts.
+
+        If segment_offset is given each dict also gets a 1-indexed
+        global_segment_index of segment_offset + segment_id + 1.
+        """
+        tstamps = _plain_numbers(self.utc_shifted_tstamp, ints=True)
+        lats = _plain_numbers(self.latitude)
+        lons = _plain_numbers(self.longitude)
+        telemetry = [_plain_float32(getattr(self, name)) for name in TELEMETRY_FIELDS]
+        durations = _plain_numbers(self.duration_secs, ints=True)
+        has_duration = ~np.isnan(self.duration_secs)
+        tz_offsets = self.tz_offset.tolist()
+        is_delta = self.is_delta.tolist()
+        mph = self.mph.tolist()
+        knots = self.knots.tolist()
+        delta_miles = self.delta_miles.tolist()
+        global_idx = (self.segment_id.astype(np.int64) + segment_offset + 1).tolist() if segment_offset is not None else None
+
+        utc_times, local_times = mytime.format_shifted_times(self.utc_shifted_tstamp, tz_offsets)
+
+        records = []
+        for i in range(len(self)):
+            utc_tstamp = tstamps[i]
+            pos = {
+                "tz_offset": tz_offsets[i],
+                "utc_shifted_tstamp": utc_tstamp,
+                "latitude": lats[i],
+                "longitude": lons[i],
+                "altitude": telemetry[0][i],
+                "engine_hours": telemetry[1][i],
+                "rpm": telemetry[2][i],
+                "coolant_temp": telemetry[3][i],
+                "alternator_voltage": telemetry[4][i],
+                "is_delta": is_delta[i],
+            }
+            if has_duration[i]:
+                pos["duration_secs"] = durations[i]
+            pos["utc_shifted_time"] = utc_times[i]
+            pos["local_time"] = local_times[i]
+            pos["mph"] = mph[i]
+            pos["knots"] = knots[i]
+            pos["delta_miles"] = delta_miles[i]
+            if global_idx is not None:
+                pos["global_segment_index"] = global_idx[i]
+            records.append(pos)
+        return records
+
+
+def _plain_numbers(values, ints=False):
+    """Python numbers for JSON, None for NaN. With ints=True integral values become ints."""
+    integral = np.isfinite(values) & (values == np.floor(values)) if ints else np.zeros(len(values), dtype=bool)
+    if ints and integral.all():
+        return values.astype(np.int64).tolist()
+    out = values.tolist()
+    for i in np.flatnonzero(integral).tolist():
+        out[i] = int(out[i])
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        out[i] = None
+    return out
+
+
+def _plain_float32(values):
+    """Shortest float repr of float32 values (13.8, not 13.800000190734863), None for NaN."""
+    if len(values) == 0:
+        return []
+    # np.unique counts -0.0 and 0.0 as one value and keeps whichever sorts first;
+    # adding 0.0 turns every -0.0 into 0.0 so the output does not depend on row order
+    uniques, inverse = np.unique(values + values.dtype.type(0.0), return_inverse=True)
+    shortest = [None if u != u else float(s) for u, s in zip(uniques.tolist(), uniques.astype(str).tolist())]
+    return [shortest[k] for k in inverse.tolist()]
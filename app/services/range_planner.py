@@ -0,0 +1,119 @@
+import numpy as np
+from datetime import datetime, timezone
+from app.services.firestore import segment_positions, trip_segment_mask, SEGMENT_MAX_GAP_SECS, SEGMENT_MAX_GAP_MILES, DISTANCE_MODE
+from app.services import codec, distance, wire_format, year_cache
+
+# Serving /positions ranges from the year caches.
+#
+# A range is split at year edges into pieces. A piece whose year is cached is
+# sliced out of the year payload by binary search on its timestamps; only the
+# pieces of uncached years are fetched from Firestore (a stale current year is
+# refreshed first, which fetches just what arrived since). The pieces are then
+# concatenated, joining segments that run on across a seam under the same rule
+# segment_positions breaks them by.
+#
+# A fetched piece is segmented the way its year cache would be, so a range
+# comes back the same whether or not its year is cached: RANGE_CONTEXT_SECS of
+# positions either side of it (within the year) decide the segments running
+# over its ends, and trips that started in the previous year are dropped. The
+# context is the same buffer a year build reads before Jan 1; a dock stay longer
+# than that before a trip can still leave the trip's first row (the stay's
+# centroid and duration) slightly different from the cached one.
+#
+# A trip over New Year belongs to the year it started in, whose cache stops at
+# midnight, and the next year's cache leaves it out, so its rows after midnight
+# are in neither. The stretch around the edge (at most YEAR_EDGE_FETCH_SECS on
+# either side) is fetched from Firestore and the trip running over it replaces
+# whatever part of it the earlier year kept.
+
+YEAR_EDGE_FETCH_SECS = 86400
+RANGE_CONTEXT_SECS = year_cache.YEAR_BUFFER_SECS
+
+
+def year_bounds(year):
+    """(from, to) timestamps a year cache covers."""
+    return (int(datetime(year, 1, 1, tzinfo=timezone.utc).timestamp()),
+            int(datetime(year, 12, 31, 23, 59, 59, tzinfo=timezone.utc).timestamp()))
+
+
+def year_pieces(from_timestamp, to_timestamp):
+    """[(year, from, to), ...] of a range split at year edges."""
+    pieces = []
+    year = datetime.fromtimestamp(from_timestamp, tz=timezone.utc).year
+    while True:
+        year_from, year_to = year_bounds(year)
+        if year_from > to_timestamp:
+            return pieces
+        pieces.append((year, max(from_timestamp, year_from), min(to_timestamp, year_to)))
+        year += 1
+
+
+def context_window(year, from_timestamp, to_timestamp):
+    """(from, to) to fetch for a range within year: RANGE_CONTEXT_SECS either side, not past the year's end."""
+    return from_timestamp - RANGE_CONTEXT_SECS, min(to_timestamp + RANGE_CONTEXT_SECS, year_bounds(year)[1])
+
+
+def slice_year(payload: codec.Payload, tstamps, from_timestamp, to_timestamp) -> codec.Payload:
+    """Plain-range payload of the rows of a year payload within [from, to]; tstamps is its timestamp column."""
+    start = int(np.searchsorted(tstamps, from_timestamp, side="left"))
+    end = int(np.searchsorted(tstamps, to_timestamp, side="right"))
+    segments = [[max(s, start) - start, min(e, end) - start] for s, e in payload["segments"] if s < end and e > start]
+    return {
+        "version": payload["version"],
+        "from_timestamp": from_timestamp,
+        "to_timestamp": to_timestamp,
+        "count": end - start,
+        "columns": {name: values[start:end] for name, values in payload["columns"].items()},
+        "tz_offsets": payload["tz_offsets"],
+        "segments": segments,
+        "segment_offset": None,
+    }
+
+
+def rows_before(payload, tstamp):
+    """payload cut back to its rows before tstamp."""
+    tstamps = np.asarray(payload["columns"]["utc_shifted_tstamp"])
+    end = int(np.searchsorted(tstamps, tstamp, side="left"))
+    return slice_year(payload, tstamps, payload["from_timestamp"], tstamps[end - 1] if end else tstamp - 1)
+
+
+def continues(a, b):
+    """Whether the first segment of payload b carries on the last segment of payload a."""
+    if not a["segments"] or not b["segments"] or a["segments"][-1][1] != a["count"] or b["segments"][0][0] != 0:
+        return False
+    ca, cb = a["columns"], b["columns"]
+    if cb["utc_shifted_tstamp"][0] - ca["utc_shifted_tstamp"][-1] > SEGMENT_MAX_GAP_SECS:
+        return False
+    miles = distance.distance_miles(ca["latitude"][-1], ca["longitude"][-1], cb["latitude"][0], cb["longitude"][0],
+                                    DISTANCE_MODE)
+    return miles <= SEGMENT_MAX_GAP_MILES
+
+
+def year_edge_window(from_timestamp, year_from, piece, piece_to):
+    """
+    (from, to) around a year edge to fetch for a trip running over it: up to
+    YEAR_EDGE_FETCH_SECS either side, stopping before the next year's first
+    cached row. None when no uncovered row can follow the edge.
+    """
+    first_cached = piece["columns"]["utc_shifted_tstamp"][0] if piece["count"] else float("inf")
+    fetch_to = min(piece_to, first_cached - 1, year_from + YEAR_EDGE_FETCH_SECS)
+    if fetch_to < year_from:
+        return None
+    return max(from_timestamp, year_from - YEAR_EDGE_FETCH_SECS), fetch_to
+
+
+def year_edge_trip(positions, year_from, from_timestamp, to_timestamp):
+    """Payload of the trip segment among positions that runs over year_from, or None."""
+    if len(positions) == 0:
+        return None
+    segmented = segment_positions(positions, filter_stationary=False)
+    row = int(np.searchsorted(segmented.utc_shifted_tstamp, year_from, side="left"))
+    if row == 0 or row == len(segmented):
+        return None
+    starts = segmented.segment_starts()
+    k = int(np.searchsorted(starts, row, side="right")) - 1
+    if starts[k] == row or not trip_segment_mask(segmented)[k]:
+        return None
+    start, end = segmented.segment_bounds()[k]
+    return wire_format.encode_payload(segmented.take(slice(start, end)), [[0, end - start]],
+                                      from_timestamp, to_timestamp)
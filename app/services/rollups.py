@@ -0,0 +1,91 @@
+import numpy as np
+from app.services import distance
+from app.services.firestore import DISTANCE_MODE
+
+# Daily and hourly rollups of a year payload for the timeline and prev/next
+# navigation, so the client does not need every position to draw them.
+#
+# Buckets are aligned to utc_shifted_tstamp, which reads as local wall-clock
+# time, so days are local days. Only buckets holding positions are listed, as
+# columns:
+#   start          bucket start (utc_shifted_tstamp)
+#   points         positions in the bucket
+#   max_knots      fastest speed
+#   avg_knots      mean speed over positions that have one
+#   miles          path length within segments (each step counts in the bucket it ends in)
+#   engine_secs    time from each position with rpm > 0 to the next one in its segment
+#   active         1 if any position reached ACTIVE_MPH
+#   first_active   utc_shifted_tstamp of the first such position (None if not active)
+#   last_active    utc_shifted_tstamp of the last such position (None if not active)
+
+ROLLUP_BUCKETS = {"daily": 86400, "hourly": 3600}
+ROLLUPS_VERSION = 2            # version 2: miles from neighbouring points, not delta_miles
+ACTIVE_MPH = 1.5               # same threshold as MIN_MOTION_SPEED in constants.js
+
+
+def _column(payload, name):
+    return np.array([np.nan if v is None else v for v in payload["columns"][name]], dtype=np.float64)
+
+
+def _optional(values):
+    return [None if not np.isfinite(v) else float(v) for v in values]
+
+
+def bucket_rollups(tstamps, knots, mph, miles, engine_secs, bucket_secs):
+    """Rollup columns of time-ordered per-position values."""
+    if len(tstamps) == 0:
+        return {"bucket_secs": bucket_secs, **{name: [] for name in (
+            "start", "points", "max_knots", "avg_knots", "miles", "engine_secs", "active", "first_active", "last_active")}}
+
+    buckets = np.floor(tstamps / bucket_secs) * bucket_secs
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    points = np.diff(np.concatenate((starts, [len(tstamps)])))
+
+    has_knots = np.isfinite(knots)
+    knots0 = np.where(has_knots, knots, 0.0)
+    speed_counts = np.add.reduceat(has_knots.astype(np.int64), starts)
+    active = np.nan_to_num(mph) >= ACTIVE_MPH
+    first_active = np.minimum.reduceat(np.where(active, tstamps, np.inf), starts)
+    last_active = np.maximum.reduceat(np.where(active, tstamps, -np.inf), starts)
+
+    return {
+        "bucket_secs": bucket_secs,
+        "start": buckets[starts].tolist(),
+        "points": points.tolist(),
+        "max_knots": np.round(np.maximum.reduceat(knots0, starts), 2).tolist(),
+        "avg_knots": np.round(np.add.reduceat(knots0, starts) / np.maximum(speed_counts, 1), 2).tolist(),
+        "miles": np.round(np.add.reduceat(miles, starts), 3).tolist(),
+        "engine_secs": np.add.reduceat(engine_secs, starts).tolist(),
+        "active": np.logical_or.reduceat(active, starts).astype(int).tolist(),
+        "first_active": _optional(first_active),
+        "last_active": _optional(last_active),
+    }
+
+
+def build_rollups(payload):
+    """Daily and hourly rollups of a year payload, plus its time range."""
+    tstamps = _column(payload, "utc_shifted_tstamp")
+    knots = _column(payload, "knots")
+    mph = _column(payload, "mph")
+    rpm = _column(payload, "rpm")
+    # delta_miles reaches two positions back (see add_speed), so summing it counts every stretch twice
+    miles = np.zeros(len(tstamps))
+    miles[1:] = distance.path_distances(_column(payload, "latitude"), _column(payload, "longitude"),
+                                        mode=DISTANCE_MODE).consecutive
+
+    # Distances and engine time only count between positions of the same segment
+    same_segment = np.zeros(len(tstamps), dtype=bool)
+    for start, end in payload["segments"]:
+        same_segment[start + 1:end] = True
+    miles[~same_segment] = 0.0
+    engine_secs = np.zeros(len(tstamps))
+    to_next = same_segment[1:] & (np.nan_to_num(rpm[:-1]) > 0)
+    engine_secs[:-1][to_next] = np.diff(tstamps)[to_next]
+
+    return {
+        "from_timestamp": payload["from_timestamp"],
+        "to_timestamp": payload["to_timestamp"],
+        "first_tstamp": float(tstamps[0]) if len(tstamps) else None,
+        "last_tstamp": float(tstamps[-1]) if len(tstamps) else None,
+        **{name: bucket_rollups(tstamps, knots, mph, miles, engine_secs, secs) for name, secs in ROLLUP_BUCKETS.items()},
+    }
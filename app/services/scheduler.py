@@ -0,0 +1,165 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+
+# Background cache warm-up and refresh, started from the app's lifespan.
+#
+# Years are prepared in priority order: built if their cache file is missing,
+# then loaded into the in-memory caches. The current year is refreshed
+# WARMUP_REFRESH_LEAD_SECS before its cache would turn stale, so requests keep
+# finding it fresh. Requests needing a year that is not cached yet call wait(),
+# which moves it to the front of the queue, instead of starting a cold build.
+# If the current year failed or its cache file is missing, it is queued again
+# after WARMUP_RETRY_SECS, doubling up to WARMUP_RETRY_MAX_SECS until it is ready.
+# status() reports each year's state:
+#   queued     waiting its turn
+#   building   being built (cold) or loaded
+#   ready      cached and warm
+#   failed     last attempt raised; the next wait() queues it again
+
+WARMUP_REFRESH_LEAD_SECS = 300   # refresh the current year this long before it turns stale
+WARMUP_RETRY_SECS = 60           # at least this long between refresh attempts
+WARMUP_RETRY_MAX_SECS = 1800     # longest wait between retries of a missing current year
+
+
+class WarmupScheduler:
+    def __init__(self, build, warm, cached, expires_at):
+        """
+        build(year): coroutine that builds (or refreshes) a year's cache.
+        warm(year): loads a cached year into memory; runs in a worker thread.
+        cached(year): whether the year's cache file exists.
+        expires_at(year): epoch seconds when the year's cache turns stale, or None.
+        """
+        self.build = build
+        self.warm = warm
+        self.cached = cached
+        self.expires_at = expires_at
+        self.years = {}          # year -> status dict
+        self._queue = []         # years to prepare, first is next
+        self._waiters = {}       # year -> futures resolved when it is prepared
+        self._wake = asyncio.Event()
+        self._task = None
+        self._retry_secs = WARMUP_RETRY_SECS
+        self.next_refresh_at = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self, years):
+        """Queue years (highest priority first) and start the background task."""
+        for year in years:
+            self._enqueue(year)
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def wait(self, year):
+        """Prepare year next (unless it is ready) and wait until it is."""
+        if self.years.get(year, {}).get("state") == "ready":
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(year, []).append(future)
+        self._enqueue(year, first=True)
+        await future
+
+    def status(self):
+        return {
+            "running": self.running,
+            "queue": list(self._queue),
+            "next_refresh_at": self.next_refresh_at,
+            "years": {str(year): status for year, status in sorted(self.years.items())},
+        }
+
+    def _enqueue(self, year, first=False):
+        state = self.years.get(year, {}).get("state")
+        if state == "building" or (state == "queued" and not first):
+            return
+        if year in self._queue:
+            self._queue.remove(year)
+        self._queue.insert(0 if first else len(self._queue), year)
+        self.years[year] = {**self.years.get(year, {}), "state": "queued"}
+        self._wake.set()
+
+    async def _prepare(self, year):
+        status = self.years[year] = {**self.years.get(year, {}), "state": "building", "started_at": time.time()}
+        start_time = time.perf_counter()
+        try:
+            cold = not self.cached(year)
+            if cold:
+                print(f"🔥 Warm-up: building year {year}")
+                await self.build(year)
+            await asyncio.to_thread(self.warm, year)
+            status.update(state="ready", cold=cold, seconds=round(time.perf_counter() - start_time, 3),
+                          finished_at=time.time(), error=None)
+            self._retry_secs = WARMUP_RETRY_SECS
+            error = None
+        except Exception as e:
+            print(f"Warm-up of year {year} failed: {e}")
+            status.update(state="failed", seconds=round(time.perf_counter() - start_time, 3),
+                          finished_at=time.time(), error=str(e))
+            error = e
+        for future in self._waiters.pop(year, []):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def _refresh(self, year):
+        status = self.years.setdefault(year, {})
+        start_time = time.perf_counter()
+        try:
+            await self.build(year)
+            await asyncio.to_thread(self.warm, year)
+            status.update(refreshed_at=time.time(), refresh_seconds=round(time.perf_counter() - start_time, 3),
+                          refresh_error=None)
+        except Exception as e:
+            print(f"Background refresh of year {year} failed: {e}")
+            status.update(refresh_error=str(e))
+
+    def _refresh_delay(self, year):
+        expires_at = self.expires_at(year) if self.years.get(year, {}).get("state") == "ready" else None
+        if expires_at is None:
+            self.next_refresh_at = None
+            return None
+        self.next_refresh_at = max(expires_at - WARMUP_REFRESH_LEAD_SECS, time.time() + WARMUP_RETRY_SECS)
+        return self.next_refresh_at - time.time()
+
+    async def _run(self):
+        while True:
+            # A new year starts out cold: get it ready before anything else
+            year = datetime.now(timezone.utc).year
+            if year not in self.years:
+                self._enqueue(year, first=True)
+
+            if self._queue:
+                await self._prepare(self._queue.pop(0))
+                continue
+
+            # Without the current year there is nothing to refresh: keep retrying it instead
+            missing = self.years[year].get("state") == "failed" or not self.cached(year)
+            if missing:
+                self.next_refresh_at = time.time() + self._retry_secs
+                delay = self._retry_secs
+            else:
+                delay = self._refresh_delay(year)
+
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                if missing:
+                    print(f"🔥 Warm-up: retrying year {year}")
+                    self._retry_secs = min(2 * self._retry_secs, WARMUP_RETRY_MAX_SECS)
+                    self._enqueue(year, first=True)
+                else:
+                    await self._refresh(year)
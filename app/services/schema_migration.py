@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+from app.services.firestore import (
+    normalize_position, fs_legacy_ranges, forget_schema_marker, field_filter,
+    SCHEMA_COLLECTION, SCHEMA_DOCUMENT, SCHEMA_VERSION,
+)
+
+# One-time rewrite of swapped-schema gps_data documents into the correct schema.
+#
+# Documents are rewritten with normalize_position, a range at a time, and only
+# then is the range removed from the schema marker's legacy_ranges, so a fetch
+# never skips the swapped query for a range that could still need it.
+
+MIGRATION_BATCH_DOCS = 400   # Firestore allows 500 writes per batch
+MAX_LATITUDE = 90            # swapped documents hold a timestamp in latitude, which is always larger
+
+
+def subtract_range(ranges, start, end):
+    """ranges ([(from, to), ...], inclusive) minus [start, end]."""
+    remaining = []
+    for a, b in ranges:
+        if b < start or a > end:
+            remaining.append((a, b))
+            continue
+        if a < start:
+            remaining.append((a, start - 1))
+        if b > end:
+            remaining.append((end + 1, b))
+    return remaining
+
+
+async def migrate_range(db, from_timestamp, to_timestamp, dry_run=False):
+    """Rewrite the swapped-schema documents of a range. Returns how many there were."""
+    query = db.collection("gps_data") \
+              .where(filter=field_filter("latitude", ">=", max(from_timestamp, MAX_LATITUDE + 1))) \
+              .where(filter=field_filter("latitude", "<=", to_timestamp))
+
+    found = 0
+    batch, batch_docs = db.batch(), 0
+    async for doc in query.stream():
+        raw = doc.to_dict()
+        if not isinstance(raw.get("utc_shifted_tstamp"), str):
+            continue
+        found += 1
+        if dry_run:
+            continue
+        batch.set(doc.reference, normalize_position(raw))
+        batch_docs += 1
+        if batch_docs >= MIGRATION_BATCH_DOCS:
+            await batch.commit()
+            print(f"schema_migration.py: rewrote {found} documents")
+            batch, batch_docs = db.batch(), 0
+    if batch_docs:
+        await batch.commit()
+    return found
+
+
+async def migrate(db, from_timestamp, to_timestamp, dry_run=False):
+    """
+    Migrate a range and record it in the schema marker.
+    Returns (documents rewritten, legacy ranges left).
+    """
+    forget_schema_marker()
+    ranges = await fs_legacy_ranges(db)
+    found = await migrate_range(db, from_timestamp, to_timestamp, dry_run)
+    if dry_run:
+        return found, ranges
+    remaining = subtract_range(ranges, from_timestamp, to_timestamp)
+    await db.collection(SCHEMA_COLLECTION).document(SCHEMA_DOCUMENT).set({
+        "version": SCHEMA_VERSION,
+        "legacy_ranges": [{"from": a, "to": b} for a, b in remaining],
+        "updated_at": datetime.now(timezone.utc),
+    })
+    forget_schema_marker()
+    return found, remaining
@@ -0,0 +1,103 @@
+import os
+import hashlib
+from app.services.year_cache import write_json_atomic, cache_path
+from app.services import wire_format
+from app.services import codec
+
+# Persisted index of the cached years, so global segment numbering never has to
+# parse a year payload.
+#
+# app/cache/segment_index.json holds, per year:
+#   segments        number of segments in the year payload
+#   first_tstamp    utc_shifted_tstamp of the first cached position (None if empty)
+#   last_tstamp     utc_shifted_tstamp of the last cached position (None if empty)
+#   hash            sha256 of the cache file bytes
+#   size, mtime_ns  stat of the cache file when the entry was recorded
+#
+# An entry whose size or mtime no longer matches its file is rebuilt from the
+# file on the next lookup.
+
+INDEX_FILE = "segment_index.json"
+
+
+def index_path(cache_dir):
+    return os.path.join(cache_dir, INDEX_FILE)
+
+
+def load_index(cache_dir):
+    path = index_path(cache_dir)
+    if not os.path.exists(path):
+        return {"years": {}}
+    try:
+        with open(path, "rb") as f:
+            return codec.loads(f.read())
+    except Exception as e:
+        print(f"Error reading segment index: {e}")
+        return {"years": {}}
+
+
+def year_entry(payload, body, path):
+    """Index entry for a year payload whose encoded bytes were just written to path."""
+    first_tstamp, last_tstamp = wire_format.boundary_tstamps(payload)
+    st = os.stat(path)
+    return {
+        "segments": len(payload["segments"]),
+        "first_tstamp": first_tstamp,
+        "last_tstamp": last_tstamp,
+        "hash": hashlib.sha256(body).hexdigest(),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+    }
+
+
+def record_year(cache_dir, year, payload, body):
+    """Update the index after the year payload file was written with body."""
+    index = load_index(cache_dir)
+    try:
+        index["years"][str(year)] = year_entry(payload, body, cache_path(cache_dir, year))
+        write_json_atomic(index_path(cache_dir), index)
+    except Exception as e:
+        print(f"Error writing segment index for year {year}: {e}")
+
+
+def _is_current(entry, path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    return entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns
+
+
+def lookup(cache_dir, year, index=None):
+    """Index entry for year, re-indexing the cache file if the entry is missing or out of date."""
+    index = index if index is not None else load_index(cache_dir)
+    path = cache_path(cache_dir, year)
+    entry = index["years"].get(str(year))
+    if entry is not None and _is_current(entry, path):
+        return entry
+    if not os.path.exists(path):
+        return None
+
+    print(f"segment_index.py: indexing cache for year {year}")
+    with open(path, "rb") as f:
+        body = f.read()
+    record_year(cache_dir, year, codec.loads(body), body)
+    return load_index(cache_dir)["years"].get(str(year))
+
+
+def missing_years(cache_dir, years):
+    """Years without a cache file."""
+    return [y for y in years if not os.path.exists(cache_path(cache_dir, y))]
+
+
+def segment_offset(cache_dir, years):
+    """Total segment count of the given (past) years."""
+    index = load_index(cache_dir)
+    offset = 0
+    for year in years:
+        entry = lookup(cache_dir, year, index)
+        if entry is None:
+            print(f"segment_index.py: no cache for year {year}, counting 0 segments")
+            continue
+        offset += entry["segments"]
+    return offset
@@ -0,0 +1,113 @@
+import math
+import numpy as np
+
+# Level-of-detail tiers for drawing tracks.
+#
+# Every segment is simplified with Douglas-Peucker once, recording for each point
+# the largest tolerance at which it survives. A tier for tolerance t is then just
+# the rows whose value exceeds t (plus segment endpoints), which is exactly what
+# running Douglas-Peucker with tolerance t would keep. Tiers hold row indexes into
+# the year payload, so the client can map any simplified point back to the original.
+
+LOD_TOLERANCES_METERS = (1000.0, 250.0, 60.0, 15.0, 4.0)  # coarse to fine; finer than the last is full detail
+EARTH_RADIUS_METERS = 6371008.8
+WEB_MERCATOR_METERS_PER_PIXEL = 156543.03392  # at zoom 0 on the equator
+BBOX_VIEW_PIXELS = 1024  # assumed map width when only a bbox is given
+
+
+def _project(lats, lons):
+    """Local equirectangular projection to meters around the mean latitude."""
+    k = math.radians(1) * EARTH_RADIUS_METERS
+    x = lons * k * math.cos(math.radians(float(np.mean(lats))))
+    y = lats * k
+    return x, y
+
+
+def _line_distances(x, y, a, b):
+    """Distance in meters of points a+1..b-1 to the chord from a to b."""
+    px, py = x[a + 1:b], y[a + 1:b]
+    dx, dy = x[b] - x[a], y[b] - y[a]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return np.hypot(px - x[a], py - y[a])
+    t = np.clip(((px - x[a]) * dx + (py - y[a]) * dy) / length2, 0.0, 1.0)
+    return np.hypot(px - (x[a] + t * dx), py - (y[a] + t * dy))
+
+
+def survival_tolerances(lats, lons, min_tolerance=LOD_TOLERANCES_METERS[-1]):
+    """
+    For each point of one segment, the largest Douglas-Peucker tolerance that
+    keeps it (inf for the endpoints, 0 for points no tier down to min_tolerance keeps).
+    """
+    n = len(lats)
+    survive = np.zeros(n)
+    if n == 0:
+        return survive
+    survive[0] = survive[-1] = np.inf
+    if n < 3:
+        return survive
+
+    x, y = _project(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+    # (first, last, tolerance the chord itself survives to)
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        a, b, limit = stack.pop()
+        if b - a < 2:
+            continue
+        dist = _line_distances(x, y, a, b)
+        k = int(np.argmax(dist))
+        d = float(dist[k])
+        if d <= min_tolerance:
+            continue
+        i = a + 1 + k
+        # A point only survives while every split above it does
+        survive[i] = min(d, limit)
+        stack.append((a, i, survive[i]))
+        stack.append((i, b, survive[i]))
+    return survive
+
+
+def build_tiers(lats, lons, segments):
+    """
+    Row indexes kept at each of LOD_TOLERANCES_METERS, for a payload's
+    coordinates and [start, end) segment ranges.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    survive = np.zeros(len(lats))
+    for start, end in segments:
+        survive[start:end] = survival_tolerances(lats[start:end], lons[start:end])
+    return [np.flatnonzero(survive > tol).tolist() for tol in LOD_TOLERANCES_METERS]
+
+
+def tier_for_zoom(zoom, latitude):
+    """Coarsest tier whose tolerance is under one screen pixel at zoom, or None for full detail."""
+    meters_per_pixel = WEB_MERCATOR_METERS_PER_PIXEL * math.cos(math.radians(latitude)) / 2 ** zoom
+    for tier, tol in enumerate(LOD_TOLERANCES_METERS):
+        if tol <= meters_per_pixel:
+            return tier
+    return None
+
+
+def zoom_for_bbox(west, south, east, north):
+    """Web-map zoom at which the bbox spans BBOX_VIEW_PIXELS."""
+    width = max(east - west, 1e-9)
+    return math.log2(360.0 * BBOX_VIEW_PIXELS / 256 / width)
+
+
+def rows_in_bbox(lats, lons, segment_ids, rows, west, south, east, north):
+    """
+    The subset of rows inside the bbox, plus the row before and after each run
+    within the same segment so lines still reach the edge of the view.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return rows
+    lat, lon = lats[rows], lons[rows]
+    inside = (lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)
+    seg = segment_ids[rows]
+    keep = inside.copy()
+    same_prev = seg[1:] == seg[:-1]
+    keep[:-1] |= inside[1:] & same_prev
+    keep[1:] |= inside[:-1] & same_prev
+    return rows[keep]
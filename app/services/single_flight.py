@@ -0,0 +1,37 @@
+import asyncio
+
+# Per-key request coalescing.
+#
+# The first caller for a key starts the work as a task; callers that arrive while
+# it is running await that same task instead of starting their own. The key is
+# released when the task finishes, so the next caller after that starts fresh.
+# Tasks are shielded, so a caller that disconnects does not cancel the work for
+# everyone else.
+
+
+class SingleFlight:
+    def __init__(self):
+        self._tasks = {}
+
+    def in_flight(self, key):
+        return key in self._tasks
+
+    def start(self, key, fn):
+        """Start fn() for key unless it is already running. Returns the task."""
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._release(key, t))
+        return task
+
+    async def do(self, key, fn):
+        """Run fn() for key, or wait on the run already in flight, and return its result."""
+        return await asyncio.shield(self.start(key, fn))
+
+    def _release(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Background runs nobody awaited still report their errors
+        if not task.cancelled() and task.exception() is not None:
+            print(f"single_flight.py: run for {key!r} failed: {task.exception()}")
@@ -0,0 +1,145 @@
+import math
+import numpy as np
+from app.services import distance
+
+# Grid index over a year payload for /positions/bbox and /positions/near.
+#
+# Positions are bucketed into SPATIAL_CELL_DEGREES cells. Each cell lists the
+# runs of consecutive rows of one segment that stay inside it, as flat
+# [k, start, end) triples, so a query only tests the rows of the cells it
+# overlaps. The index also keeps each segment's bounding box
+# [west, south, east, north]. Row indexes refer to the year payload, so time
+# ranges come straight from its timestamp column.
+
+SPATIAL_CELL_DEGREES = 0.02          # about 2 km north-south
+METERS_PER_DEGREE = 111320.0         # latitude degree; longitude scales by cos(latitude)
+
+
+def _cell(values, cell_degrees):
+    return np.floor(np.asarray(values, dtype=np.float64) / cell_degrees).astype(np.int64)
+
+
+def segment_ids(count, segments):
+    """k of each row's segment, -1 for rows in no segment."""
+    ids = np.full(count, -1, dtype=np.int64)
+    for k, (start, end) in enumerate(segments):
+        ids[start:end] = k
+    return ids
+
+
+def build_index(lats, lons, segments, cell_degrees=SPATIAL_CELL_DEGREES):
+    """Cells and segment bounding boxes for a payload's coordinates and [start, end) segments."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    boxes = []
+    for start, end in segments:
+        lat, lon = lats[start:end], lons[start:end]
+        ok = np.isfinite(lat) & np.isfinite(lon)
+        boxes.append([float(lon[ok].min()), float(lat[ok].min()), float(lon[ok].max()), float(lat[ok].max())]
+                     if ok.any() else None)
+    if n == 0:
+        return {"cell_degrees": cell_degrees, "segments": boxes, "cells": {}}
+
+    seg = segment_ids(n, segments)
+    ok = np.isfinite(lats) & np.isfinite(lons) & (seg >= 0)
+    ix = np.where(ok, _cell(np.nan_to_num(lons), cell_degrees), 0)
+    iy = np.where(ok, _cell(np.nan_to_num(lats), cell_degrees), 0)
+
+    # A run ends wherever the cell, the segment or usability changes
+    change = np.flatnonzero((ix[1:] != ix[:-1]) | (iy[1:] != iy[:-1]) | (seg[1:] != seg[:-1]) | (ok[1:] != ok[:-1])) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [n]))
+    keep = ok[starts]
+    starts, ends = starts[keep], ends[keep]
+
+    cells = {}
+    for x, y, k, start, end in zip(ix[starts].tolist(), iy[starts].tolist(), seg[starts].tolist(),
+                                   starts.tolist(), ends.tolist()):
+        cells.setdefault(f"{x},{y}", []).extend((k, start, end))
+    return {"cell_degrees": cell_degrees, "segments": boxes, "cells": cells}
+
+
+def candidate_rows(index, west, south, east, north):
+    """Sorted rows of every run in a cell overlapping the bbox (a superset of the rows inside it)."""
+    cell_degrees = index["cell_degrees"]
+    x0, x1 = (int(v) for v in _cell([west, east], cell_degrees))
+    y0, y1 = (int(v) for v in _cell([south, north], cell_degrees))
+    cells = index["cells"]
+    if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(cells):
+        keys = (f"{x},{y}" for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+    else:
+        # A huge box: cheaper to walk the occupied cells than the empty ones
+        keys = (key for key in cells if x0 <= int(key.split(",")[0]) <= x1 and y0 <= int(key.split(",")[1]) <= y1)
+
+    ranges = [run for key in keys for run in _runs(cells.get(key))]
+    if not ranges:
+        return np.zeros(0, dtype=np.int64)
+    ranges.sort()
+    return np.concatenate([np.arange(start, end) for start, end in ranges])
+
+
+def _runs(flat):
+    if not flat:
+        return []
+    return [(flat[i + 1], flat[i + 2]) for i in range(0, len(flat), 3)]
+
+
+def rows_in_bbox(index, lats, lons, west, south, east, north):
+    """Rows whose position lies inside the bbox."""
+    rows = candidate_rows(index, west, south, east, north)
+    lat, lon = lats[rows], lons[rows]
+    return rows[(lat >= south) & (lat <= north) & (lon >= west) & (lon <= east)]
+
+
+def radius_bbox(lat, lon, radius_meters):
+    """(west, south, east, north) enclosing a circle."""
+    dlat = radius_meters / METERS_PER_DEGREE
+    dlon = radius_meters / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return lon - dlon, max(lat - dlat, -90.0), lon + dlon, min(lat + dlat, 90.0)
+
+
+def rows_near(index, lats, lons, lat, lon, radius_meters):
+    """(rows, meters) of the positions within radius_meters of (lat, lon)."""
+    rows = candidate_rows(index, *radius_bbox(lat, lon, radius_meters))
+    meters = distance.distances_miles(lats[rows], lons[rows], lat, lon, mode=distance.HAVERSINE) * distance.METERS_PER_MILE
+    inside = meters <= radius_meters
+    return rows[inside], meters[inside]
+
+
+def visits(rows, segment_id):
+    """[first, last] row of each run of consecutive matched rows within one segment."""
+    if len(rows) == 0:
+        return []
+    breaks = np.flatnonzero((np.diff(rows) != 1) | (segment_id[rows[1:]] != segment_id[rows[:-1]])) + 1
+    firsts = np.concatenate(([0], breaks))
+    lasts = np.concatenate((breaks, [len(rows)])) - 1
+    return [(int(rows[a]), int(rows[b])) for a, b in zip(firsts, lasts)]
+
+
+def match_segments(payload, tstamps, segment_id, spatial, rows, meters=None):
+    """
+    Response entries for matched rows of a year payload: one per segment, with
+    its time range, bounding box and the visits (runs of matched rows) in it.
+    With meters (distance of each row), visits also carry their closest approach.
+    """
+    offset = payload.get("segment_offset")
+    by_segment = {}
+    for first, last in visits(rows, segment_id):
+        k = int(segment_id[first])
+        start, end = payload["segments"][k]
+        entry = by_segment.get(k)
+        if entry is None:
+            entry = by_segment[k] = {
+                "segment": None if offset is None else offset + k + 1,
+                "from_timestamp": float(tstamps[start]),
+                "to_timestamp": float(tstamps[end - 1]),
+                "bbox": spatial["segments"][k],
+                "visits": [],
+            }
+        visit = {"from_timestamp": float(tstamps[first]), "to_timestamp": float(tstamps[last]), "points": last - first + 1}
+        if meters is not None:
+            a, b = np.searchsorted(rows, (first, last))
+            visit["min_meters"] = round(float(meters[a:b + 1].min()), 1)
+        entry["visits"].append(visit)
+    return list(by_segment.values())
@@ -0,0 +1,117 @@
+import math
+import numpy as np
+
+# Deterministic synthetic gps_data documents for benchmarks.
+#
+# The track alternates between dock stays (jittering around a fixed point, with
+# repeated identical fixes) and trips (a wandering heading at boat speeds), with
+# gaps longer than SEGMENT_MAX_GAP_SECS between some episodes. On top of that a
+# fraction of fixes are GPS spikes that jump away and come straight back, and a
+# fraction are Null Island (0, 0) points. The oldest swapped_fraction of the
+# documents are written in the historical swapped schema.
+# The same (n, seed, ...) always gives the same documents.
+
+SYNTHETIC_START_TSTAMP = 1735689600   # 2025-01-01
+SYNTHETIC_HOME = (47.6, -122.4)
+SYNTHETIC_TZ_OFFSET = "UTC-07:00"
+
+DOCK_FRACTION = 0.45          # share of episodes spent at the dock
+DOCK_FIXES = (5, 200)         # fixes per dock stay
+TRIP_FIXES = (10, 300)        # fixes per trip
+DOCK_INTERVALS = (60, 120, 300, 600)
+TRIP_INTERVALS = (30, 60, 60, 120)
+GAP_PROBABILITY = 0.3         # chance of an overnight-style gap before an episode
+GAP_SECS = (1800, 36000)
+SPIKE_RATE = 0.01
+NULL_ISLAND_RATE = 0.005
+SWAPPED_FRACTION = 0.2
+
+
+def _episode(rng, t, lat, lon):
+    """Timestamps and coordinates of one dock stay or trip starting after t."""
+    if rng.random() < GAP_PROBABILITY:
+        t += rng.integers(*GAP_SECS)
+    if rng.random() < DOCK_FRACTION:
+        k = int(rng.integers(*DOCK_FIXES))
+        tstamps = t + np.cumsum(rng.choice(DOCK_INTERVALS, k))
+        lats = lat + rng.normal(0, 0.0003, k)
+        lons = lon + rng.normal(0, 0.0003, k)
+        repeat = rng.random(k) < 0.2
+        lats[repeat], lons[repeat] = lat, lon
+        return tstamps, lats, lons, lat, lon
+
+    k = int(rng.integers(*TRIP_FIXES))
+    dts = rng.choice(TRIP_INTERVALS, k)
+    tstamps = t + np.cumsum(dts)
+    heading = rng.uniform(0, 2 * math.pi) + np.cumsum(rng.normal(0, 0.2, k))
+    step = rng.uniform(3, 8, k) / 3600 / 60 * dts   # degrees covered at 3-8 knots-ish
+    lats = lat + np.cumsum(np.cos(heading) * step)
+    lons = lon + np.cumsum(np.sin(heading) * step)
+    return tstamps, lats, lons, float(lats[-1]), float(lons[-1])
+
+
+def generate_tracks(n, seed=0, start=SYNTHETIC_START_TSTAMP):
+    """(tstamps, lats, lons) arrays of n fixes in time order, spikes and Null Island included."""
+    rng = np.random.default_rng(seed)
+    parts = []
+    t, (lat, lon) = start, SYNTHETIC_HOME
+    total = 0
+    while total < n:
+        tstamps, lats, lons, lat, lon = _episode(rng, t, lat, lon)
+        t = int(tstamps[-1])
+        parts.append((tstamps, lats, lons))
+        total += len(tstamps)
+    tstamps = np.concatenate([p[0] for p in parts])[:n].astype(np.int64)
+    lats = np.concatenate([p[1] for p in parts])[:n]
+    lons = np.concatenate([p[2] for p in parts])[:n]
+
+    spikes = rng.random(n) < SPIKE_RATE
+    lats[spikes] += rng.choice((0.01, 0.05, 0.5, 2.0), int(spikes.sum()))
+    null_island = rng.random(n) < NULL_ISLAND_RATE
+    lats[null_island] = 0.0
+    lons[null_island] = 0.0
+    return tstamps, lats, lons
+
+
+def generate_documents(n, seed=0, start=SYNTHETIC_START_TSTAMP, swapped_fraction=SWAPPED_FRACTION):
+    """Yield n (doc ID, raw document) pairs shaped like gps_data documents."""
+    tstamps, lats, lons = generate_tracks(n, seed, start)
+    rng = np.random.default_rng(seed + 1)
+    rpm = np.where(rng.random(n) < 0.5, 0.0, rng.uniform(800, 3000, n)).round(1)
+    engine_hours = (1000 + np.arange(n) / 120).round(2)
+    coolant = rng.uniform(60, 90, n).round(1)
+    voltage = rng.uniform(12.2, 14.4, n).round(2)
+    altitude = rng.normal(0, 5, n).round(1)
+    swapped_before = int(n * swapped_fraction)
+
+    for i, (t, lat, lon, alt, hours, r, cool, volt) in enumerate(zip(
+            tstamps.tolist(), lats.tolist(), lons.tolist(), altitude.tolist(),
+            engine_hours.tolist(), rpm.tolist(), coolant.tolist(), voltage.tolist())):
+        if i < swapped_before:
+            # Historical layout: every value shifted one key over (see normalize_position)
+            doc = {
+                "utc_shifted_tstamp": SYNTHETIC_TZ_OFFSET,
+                "latitude": t,
+                "longitude": lat,
+                "altitude": lon,
+                "tz_offset": alt,
+                "rpm": hours,
+                "alternator_voltage": r,
+                "engine_hours": cool,
+                "coolant_temp": volt,
+                "is_delta": False,
+            }
+        else:
+            doc = {
+                "tz_offset": SYNTHETIC_TZ_OFFSET,
+                "utc_shifted_tstamp": t,
+                "latitude": lat,
+                "longitude": lon,
+                "altitude": alt,
+                "engine_hours": hours,
+                "rpm": r,
+                "coolant_temp": cool,
+                "alternator_voltage": volt,
+                "is_delta": False,
+            }
+        yield f"synthetic{seed:04d}{i:010d}", doc
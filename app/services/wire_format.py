@@ -0,0 +1,230 @@
+import struct
+import numpy as np
+from app.services import metrics
+from app.services import codec
+
+# Compact, versioned payload for /positions and /positions/year.
+#
+#   version          FORMAT_VERSION
+#   from_timestamp   start of the requested range
+#   to_timestamp     end of the requested range
+#   count            number of positions
+#   columns          one list per field, all of length count
+#   tz_offsets       distinct tz_offset strings; columns["tz_offset"] holds indexes into it
+#   segments         [start, end) row ranges into columns
+#   segment_offset   global number of segment k is segment_offset + k + 1 (None for plain ranges)
+#
+# Subsets of a payload (see take_rows) also carry
+#   rows             row index of each position in the full payload
+#   segment_ids      k of each segment in the full payload
+#
+# Each point appears once, and strings derived from the timestamp
+# (utc_shifted_time, local_time) are not sent. utc_shifted_tstamp already reads
+# as local wall-clock time, so clients format it as UTC.
+
+FORMAT_VERSION = 2
+
+
+def _encode_tz(tz_offsets):
+    table = sorted({tz for tz in tz_offsets if tz is not None})
+    lookup = {tz: i for i, tz in enumerate(table)}
+    return table, [lookup.get(tz) for tz in tz_offsets]
+
+
+def decode_tz(payload):
+    """tz_offset strings of every position in a payload."""
+    table = payload["tz_offsets"]
+    return [None if i is None else table[i] for i in payload["columns"]["tz_offset"]]
+
+
+@metrics.timed("encode_payload", rows_out=lambda payload: payload["count"])
+def encode_payload(positions, segment_bounds, from_timestamp, to_timestamp, segment_offset=None) -> codec.Payload:
+    """
+    Build the payload for a PositionTable.
+
+    segment_bounds are [start, end) row ranges of positions, as from
+    PositionTable.segment_bounds().
+    """
+    columns = positions.to_columns()
+    tz_offsets, columns["tz_offset"] = _encode_tz(columns["tz_offset"])
+    return {
+        "version": FORMAT_VERSION,
+        "from_timestamp": from_timestamp,
+        "to_timestamp": to_timestamp,
+        "count": len(positions),
+        "columns": columns,
+        "tz_offsets": tz_offsets,
+        "segments": [[int(start), int(end)] for start, end in segment_bounds],
+        "segment_offset": segment_offset,
+    }
+
+
+def splice(payload: codec.Payload, keep_segments, tail: codec.Payload) -> codec.Payload:
+    """
+    Payload holding the first keep_segments segments of payload followed by
+    every row of tail (another payload).
+    """
+    segments = payload["segments"][:keep_segments]
+    prefix_end = segments[-1][1] if segments else 0
+
+    tz = decode_tz(payload)[:prefix_end] + decode_tz(tail)
+    columns = {name: values[:prefix_end] + tail["columns"][name] for name, values in payload["columns"].items()}
+    tz_offsets, columns["tz_offset"] = _encode_tz(tz)
+    return dict(
+        payload,
+        count=prefix_end + tail["count"],
+        columns=columns,
+        tz_offsets=tz_offsets,
+        segments=segments + [[start + prefix_end, end + prefix_end] for start, end in tail["segments"]],
+    )
+
+
+def concat(payloads, from_timestamp, to_timestamp, stitch=()) -> codec.Payload:
+    """
+    Plain-range payload holding the rows of payloads one after another.
+    stitch[i] joins the last segment of payloads[i] and the first of
+    payloads[i + 1] into one when they meet at the seam.
+    """
+    columns = {name: [] for name in codec.COLUMN_NAMES}
+    tz = []
+    segments = []
+    count = 0
+    for i, payload in enumerate(payloads):
+        for name, values in payload["columns"].items():
+            columns[name].extend(values)
+        tz.extend(decode_tz(payload))
+        shifted = [[start + count, end + count] for start, end in payload["segments"]]
+        if i > 0 and i - 1 < len(stitch) and stitch[i - 1] and segments and shifted \
+                and segments[-1][1] == count and shifted[0][0] == count:
+            segments[-1][1] = shifted.pop(0)[1]
+        segments.extend(shifted)
+        count += payload["count"]
+    tz_offsets, columns["tz_offset"] = _encode_tz(tz)
+    return {
+        "version": FORMAT_VERSION,
+        "from_timestamp": from_timestamp,
+        "to_timestamp": to_timestamp,
+        "count": count,
+        "columns": columns,
+        "tz_offsets": tz_offsets,
+        "segments": segments,
+        "segment_offset": None,
+    }
+
+
+def take_rows(payload: codec.Payload, rows) -> codec.Payload:
+    """Payload holding only the given rows (ascending indexes) of payload."""
+    rows = np.asarray(rows, dtype=np.int64)
+    ends = np.array([end for _, end in payload["segments"]], dtype=np.int64)
+    # Segment k of each kept row, then runs of equal k become the new segments
+    seg = np.searchsorted(ends, rows, side="right")
+    change = np.flatnonzero(np.diff(seg)) + 1
+    starts = np.concatenate(([0], change)) if len(rows) else np.empty(0, dtype=np.int64)
+    bounds = np.append(starts[1:], len(rows))
+    rows_list = rows.tolist()
+    return dict(
+        payload,
+        count=len(rows_list),
+        columns={name: [values[i] for i in rows_list] for name, values in payload["columns"].items()},
+        segments=[[int(a), int(b)] for a, b in zip(starts, bounds)],
+        segment_ids=[int(k) for k in seg[starts]],
+        rows=rows_list,
+    )
+
+
+def boundary_tstamps(payload):
+    """(first, last) utc_shifted_tstamp of a payload, (None, None) when empty."""
+    tstamps = payload["columns"]["utc_shifted_tstamp"]
+    return (tstamps[0], tstamps[-1]) if tstamps else (None, None)
+
+
+# Binary variant (?format=bin): little-endian typed-array columns the browser can
+# wrap without parsing.
+#
+#   bytes 0-3    BINARY_MAGIC
+#   bytes 4-7    uint32 length of the JSON header that follows
+#   header       {"version", "count", "from_timestamp", "to_timestamp", "segment_offset",
+#                 "tz_offsets", "columns": [[name, dtype, byte offset], ...]}
+#   columns      count values each, every column starting on an 8-byte boundary
+#
+# dtype is "f64", "f32" or "i32". Missing values are NaN, and -1 in tz_offset.
+# segment_id is the row's segment number (k above). Subsets add a "row" column.
+
+BINARY_MAGIC = b"BTPB"
+BINARY_VERSION = 1
+BINARY_MEDIA_TYPE = "application/octet-stream"
+
+BINARY_COLUMNS = (
+    # name, dtype
+    ("utc_shifted_tstamp", "f64"),
+    ("latitude", "f64"),
+    ("longitude", "f64"),
+    ("mph", "f32"),
+    ("knots", "f32"),
+    ("rpm", "f32"),
+    ("duration_secs", "f32"),
+    ("tz_offset", "i32"),
+    ("segment_id", "i32"),
+)
+_NUMPY_DTYPES = {"f64": "<f8", "f32": "<f4", "i32": "<i4"}
+
+
+def _pad8(n):
+    return (n + 7) & ~7
+
+
+@metrics.timed("serialize", rows_in=lambda payload: payload["count"], rows_out=None)
+def encode_binary(payload):
+    """Binary encoding of a compact payload."""
+    count = payload["count"]
+    columns = payload["columns"]
+    segment_ids = payload.get("segment_ids") or range(len(payload["segments"]))
+    segment_id = np.full(count, -1, dtype=np.int32)
+    for k, (start, end) in zip(segment_ids, payload["segments"]):
+        segment_id[start:end] = k
+
+    binary_columns = BINARY_COLUMNS + ((("row", "i32"),) if "rows" in payload else ())
+    arrays = []
+    for name, dtype in binary_columns:
+        if name == "segment_id":
+            values = segment_id
+        elif name == "row":
+            values = np.array(payload["rows"], dtype=np.int32)
+        elif name == "tz_offset":
+            values = np.array([-1 if i is None else i for i in columns["tz_offset"]], dtype=np.int32)
+        else:
+            values = np.array([np.nan if v is None else v for v in columns[name]], dtype=np.float64)
+        arrays.append((name, dtype, values.astype(_NUMPY_DTYPES[dtype]).tobytes()))
+
+    def header_bytes(offsets):
+        header = {
+            "version": BINARY_VERSION,
+            "count": count,
+            "from_timestamp": payload["from_timestamp"],
+            "to_timestamp": payload["to_timestamp"],
+            "segment_offset": payload["segment_offset"],
+            "tz_offsets": payload["tz_offsets"],
+            "columns": [[name, dtype, offset] for (name, dtype, _), offset in zip(arrays, offsets)],
+        }
+        return codec.dumps(header)
+
+    # Column offsets depend on the header length and vice versa: reserve 16 digits
+    # per offset, then pad the real header with spaces to the reserved size.
+    data_start = _pad8(8 + len(header_bytes([0] * len(arrays))) + 16 * len(arrays))
+    offsets = []
+    start = data_start
+    for _, _, data in arrays:
+        offsets.append(start)
+        start = _pad8(start + len(data))
+    header = header_bytes(offsets).ljust(data_start - 8, b" ")
+
+    out = bytearray(BINARY_MAGIC + struct.pack("<I", len(header)) + header)
+    for (_, _, data), offset in zip(arrays, offsets):
+        out.extend(b"\0" * (offset - len(out)))
+        out.extend(data)
+    return bytes(out)
+
+
+def binary_from_json(body):
+    """Binary encoding of a JSON-encoded compact payload (a year cache file)."""
+    return encode_binary(codec.loads(body))
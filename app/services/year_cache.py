@@ -0,0 +1,315 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+import numpy as np
+from app.services.firestore import (
+    normalize_position, process_raw_positions, add_speed, segment_positions, trip_segment_mask,
+)
+from app.services.positions import PositionTable
+from app.services.position_stream import context_table, context_rows, resume_row
+from app.services import wire_format
+from app.services import mirror
+from app.services import simplify
+from app.services import spatial_index
+from app.services import rollups
+from app.services import metrics
+from app.services import codec
+
+# Incremental refresh of a cached year.
+#
+# Alongside the year payload (year_{year}.v{FORMAT_VERSION}.json) we keep year_{year}.state.json with:
+#   hwm              newest document timestamp seen so far (high-water mark)
+#   resume_tstamp    timestamp of the segment start the tail is re-processed from
+#   resume_segment   number of cached segments that end before resume_tstamp
+#   segment_offset   global segment offset of the year
+#   context          [tstamp, lat, lon] of the two positions before the resume point (for speed)
+#   tail             normalized documents from resume_tstamp onward, keyed by document ID
+#
+# The resume point is a segment start whose anchor and every earlier decision had
+# a full look-ahead window, so re-running the pipeline from that document alone
+# reproduces exactly what a full rebuild would.
+
+INCREMENTAL_OVERLAP_SECS = 600  # Re-read this much before the high-water mark to catch late arrivals
+YEAR_BUFFER_SECS = 5 * 86400    # Positions fetched before Jan 1, so the year's first trips are processed in context
+
+
+def cache_path(cache_dir, year):
+    """Year payload file; the wire format version is part of the name so old caches are rebuilt."""
+    return os.path.join(cache_dir, f"year_{year}.v{wire_format.FORMAT_VERSION}.json")
+
+
+def state_path(cache_dir, year):
+    return os.path.join(cache_dir, f"year_{year}.state.json")
+
+
+def lod_path(cache_dir, year):
+    return os.path.join(cache_dir, f"year_{year}.lod.v{wire_format.FORMAT_VERSION}.json")
+
+
+def build_lod(payload, body):
+    """Simplification tiers for a year payload whose encoded bytes are body."""
+    lats = payload["columns"]["latitude"]
+    return {
+        "hash": hashlib.sha256(body).hexdigest(),
+        "latitude": float(np.median(lats)) if lats else 0.0,
+        "tolerances_m": list(simplify.LOD_TOLERANCES_METERS),
+        "tiers": simplify.build_tiers(lats, payload["columns"]["longitude"], payload["segments"]),
+    }
+
+
+def save_lod(cache_dir, year, payload, body):
+    try:
+        write_json_atomic(lod_path(cache_dir, year), build_lod(payload, body))
+    except Exception as e:
+        print(f"Error writing LOD tiers for year {year}: {e}")
+
+
+def _load_derived(path, body, build, what, current=lambda data: True):
+    """
+    Contents of a file derived from a year cache body (LOD tiers, spatial index,
+    rollups), rebuilt and saved again if it is missing, from another body, or
+    not current(data).
+    """
+    try:
+        with open(path, "rb") as f:
+            data = codec.loads(f.read())
+        if data.get("hash") == hashlib.sha256(body).hexdigest() and current(data):
+            return data
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Error reading {what} {path}: {e}")
+    data = build()
+    try:
+        write_json_atomic(path, data)
+    except Exception as e:
+        print(f"Error writing {what} {path}: {e}")
+    return data
+
+
+def load_lod(cache_dir, year, payload, body):
+    """Tiers for the year cache body, rebuilt and saved again if the file is missing or out of date."""
+    return _load_derived(lod_path(cache_dir, year), body, lambda: build_lod(payload, body), "LOD tiers",
+                         lambda lod: lod.get("tolerances_m") == list(simplify.LOD_TOLERANCES_METERS))
+
+
+def spatial_path(cache_dir, year):
+    return os.path.join(cache_dir, f"year_{year}.spatial.v{wire_format.FORMAT_VERSION}.json")
+
+
+def build_spatial(payload, body):
+    """Grid index (see spatial_index) for a year payload whose encoded bytes are body."""
+    columns = payload["columns"]
+    return {
+        "hash": hashlib.sha256(body).hexdigest(),
+        **spatial_index.build_index(columns["latitude"], columns["longitude"], payload["segments"]),
+    }
+
+
+def save_spatial(cache_dir, year, payload, body):
+    try:
+        write_json_atomic(spatial_path(cache_dir, year), build_spatial(payload, body))
+    except Exception as e:
+        print(f"Error writing spatial index for year {year}: {e}")
+
+
+def load_spatial(cache_dir, year, payload, body):
+    """Spatial index for the year cache body, rebuilt and saved again if the file is missing or out of date."""
+    return _load_derived(spatial_path(cache_dir, year), body, lambda: build_spatial(payload, body), "spatial index",
+                         lambda index: index.get("cell_degrees") == spatial_index.SPATIAL_CELL_DEGREES)
+
+
+def rollups_path(cache_dir, year):
+    return os.path.join(cache_dir, f"year_{year}.rollups.v{wire_format.FORMAT_VERSION}.json")
+
+
+def build_rollups(payload, body):
+    """Daily and hourly rollups (see rollups) for a year payload whose encoded bytes are body."""
+    return {"hash": hashlib.sha256(body).hexdigest(), "version": rollups.ROLLUPS_VERSION,
+            **rollups.build_rollups(payload)}
+
+
+def save_rollups(cache_dir, year, payload, body):
+    try:
+        write_json_atomic(rollups_path(cache_dir, year), build_rollups(payload, body))
+    except Exception as e:
+        print(f"Error writing rollups for year {year}: {e}")
+
+
+def load_rollups(cache_dir, year, body, payload=None):
+    """
+    Rollups for the year cache body, rebuilt and saved again if the file is
+    missing or out of date (parsing body then, unless payload is given).
+    """
+    build = lambda: build_rollups(payload if payload is not None else codec.loads(body), body)
+    return _load_derived(rollups_path(cache_dir, year), body, build, "rollups",
+                         lambda data: data.get("version") == rollups.ROLLUPS_VERSION
+                         and all(data.get(name, {}).get("bucket_secs") == secs
+                                 for name, secs in rollups.ROLLUP_BUCKETS.items()))
+
+
+def load_state(cache_dir, year):
+    path = state_path(cache_dir, year)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            return codec.loads(f.read())
+    except Exception as e:
+        print(f"Error reading incremental state for year {year}: {e}")
+        return None
+
+
+def write_json_atomic(path, data):
+    """
+    Write JSON to a temp file next to path and rename it into place, so readers
+    never see a partial file. Returns the encoded bytes.
+    """
+    with metrics.stage("cache_write"):
+        body = codec.dumps(data)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp_", suffix=".json")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+            return body
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def save_state(cache_dir, year, state):
+    path = state_path(cache_dir, year)
+    try:
+        if state is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        write_json_atomic(path, state)
+    except Exception as e:
+        print(f"Error writing incremental state for year {year}: {e}")
+
+
+def normalize_documents(raw_docs):
+    """Normalized documents keyed by ID, skipping those without a numeric timestamp."""
+    records = {}
+    for doc_id, raw in raw_docs.items():
+        rec = normalize_position(raw)
+        if isinstance(rec["utc_shifted_tstamp"], (int, float)):
+            records[doc_id] = rec
+    return records
+
+
+def segment_year(positions, from_timestamp):
+    """Unfiltered segmentation plus the mask of segments the year payload keeps."""
+    segmented_all = segment_positions(positions, filter_stationary=False)
+    starts = segmented_all.segment_starts()
+    keep = trip_segment_mask(segmented_all) & (segmented_all.utc_shifted_tstamp[starts] >= from_timestamp)
+    return segmented_all, keep
+
+
+def kept_segments(positions, from_timestamp):
+    """(segmented_all, keep, rows of the kept segments) of segment_year."""
+    segmented_all, keep = segment_year(positions, from_timestamp)
+    return segmented_all, keep, segmented_all.keep_segments(keep)
+
+
+def concat_segments(tables):
+    """Stack segmented tables, numbering their segments on from each other."""
+    offset = 0
+    shifted = []
+    for table in tables:
+        table = table.copy()
+        table.segment_id += offset
+        offset += len(table.segment_starts())
+        shifted.append(table)
+    return PositionTable.concat(shifted)
+
+
+def stream_state(stream, resume_segment, segment_offset):
+    """
+    State describing where a PositionStream stopped releasing rows, for
+    next_state. None if it never released any.
+    """
+    if stream.resume_tstamp is None:
+        return None
+    return {
+        "hwm": stream.hwm,
+        "resume_tstamp": stream.resume_tstamp,
+        "resume_segment": resume_segment,
+        "segment_offset": segment_offset,
+        "context": stream.context,
+        "tail": stream.pending,
+    }
+
+
+def next_state(records, positions, segmented_all, keep, hwm, segment_offset, prev_state=None):
+    """
+    Work out where the next refresh resumes from.
+
+    positions, segmented_all and keep describe the run over records, which started
+    at prev_state's resume point (or covered the whole year when prev_state is None).
+    Returns None when no resume point exists yet and there is no previous state.
+    """
+    context = prev_state["context"] if prev_state else []
+    resume_segment = prev_state["resume_segment"] if prev_state else 0
+
+    row = resume_row(positions, segmented_all)
+    if row is None:
+        if prev_state is None:
+            return None
+        # Nothing settled past the old resume point: keep it and carry the grown tail
+        return dict(prev_state, hwm=hwm, tail=records)
+
+    starts = segmented_all.segment_starts()
+    resume_tstamp = float(positions.utc_shifted_tstamp[row])
+    with_context = PositionTable.concat([context_table(context), positions])
+    return {
+        "hwm": hwm,
+        "resume_tstamp": resume_tstamp,
+        "resume_segment": resume_segment + int(keep[starts < row].sum()),
+        "segment_offset": segment_offset,
+        "context": context_rows(with_context, len(context) + row),
+        "tail": {doc_id: rec for doc_id, rec in records.items() if rec["utc_shifted_tstamp"] >= resume_tstamp},
+    }
+
+
+async def refresh_year_incremental(db, payload, state):
+    """
+    Fetch documents newer than the state's high-water mark, re-process the tail
+    from the resume point and splice it into the cached year payload.
+
+    Returns the new (payload, state).
+    """
+    to_timestamp = payload["to_timestamp"]
+    resume_tstamp = state["resume_tstamp"]
+
+    fetch_from = int(state["hwm"] - INCREMENTAL_OVERLAP_SECS)
+    new_records = normalize_documents(await mirror.fetch_raw_positions(db, fetch_from, to_timestamp))
+    print(f"year_cache.py: fetched {len(new_records)} documents since {fetch_from}")
+
+    records = dict(state["tail"])
+    for doc_id, rec in new_records.items():
+        if rec["utc_shifted_tstamp"] >= resume_tstamp:
+            records[doc_id] = rec
+    hwm = max([state["hwm"]] + [rec["utc_shifted_tstamp"] for rec in new_records.values()])
+
+    return await asyncio.to_thread(_refresh_tail, payload, state, records, hwm)
+
+
+def _refresh_tail(payload, state, records, hwm):
+    """The CPU part of refresh_year_incremental, run in a worker thread."""
+    from_timestamp = payload["from_timestamp"]
+    to_timestamp = payload["to_timestamp"]
+    positions = process_raw_positions(list(records.values()))
+    # Speeds look two positions back, across the resume point
+    context = context_table(state["context"])
+    positions = add_speed(PositionTable.concat([context, positions])).take(slice(len(context), None))
+
+    segmented_all, keep, tail = kept_segments(positions, from_timestamp)
+    tail_payload = wire_format.encode_payload(tail, tail.segment_bounds(), from_timestamp, to_timestamp)
+    new_payload = wire_format.splice(payload, state["resume_segment"], tail_payload)
+    new_state = next_state(records, positions, segmented_all, keep, hwm, state["segment_offset"], prev_state=state)
+    return new_payload, new_state
@@ -1,7 +1,8 @@
 // api.js
 import { updateSpeedGraph } from "./graph.js";
 import { updateMap, clearGraphAndMap } from "./map.js";
-import { SEGMENT_COLORS, MIN_MOTION_SPEED, TIMELINE_PADDING_DAYS } from "./constants.js";
+import { MIN_MOTION_SPEED, TIMELINE_PADDING_DAYS } from "./constants.js";
+import { decodeBinaryPayload, decodeJsonPayload } from "./shared/data.js";
 
 export async function updateEngineHours() {
   try {
@@ -20,12 +21,23 @@ export async function updateEngineHours() {
   }
 }
 
-let yearlyData = null;
+// Timeline and navigation come from the year's rollups (/rollups); full-resolution
+// positions are only fetched around the focused window
+let yearlyRollups = null;
+let currentYear = null;
+let windowData = null;      // { from, to, data } last fetched stretch of positions
+let windowRequest = 0;
 let currentYearStartTs = 0;
 let currentYearEndTs = 0;
 let timelineStartTs = 0;
 let timelineEndTs = 0;
 let timelineChart = null;
+let focusedWindow = null;   // { startTs, endTs } last shown
+
+// The current year follows /positions/live: cached positions from liveData.from
+// on are replaced by the feed's final segments and its (still changing) tail
+let liveSource = null;
+let liveData = null;        // { from, final: [decoded payloads], tail: decoded payload }
 
 function renderTimelineMonths(startTs, endTs) {
   const container = document.getElementById("timeline-months");
@@ -66,7 +78,7 @@ function renderTimelineMonths(startTs, endTs) {
   }
 }
 
-function renderTimelineChart(positions, startTs, endTs) {
+function renderTimelineChart(rollups, startTs, endTs) {
   const canvas = document.getElementById("timeline-chart");
   if (!canvas) return;
   const ctx = canvas.getContext("2d");
@@ -78,14 +90,14 @@ function renderTimelineChart(positions, startTs, endTs) {
   // Create daily bins dynamically based on date range
   const totalDays = Math.ceil((endTs - startTs) / 86400) || 1;
   const dailySpeeds = new Array(totalDays).fill(0);
-  for (const pos of positions) {
-    const dayIdx = Math.floor((pos.utc_shifted_tstamp - startTs) / 86400);
+  const hourly = rollups.hourly;
+  hourly.start.forEach((hourStart, k) => {
+    const dayIdx = Math.floor((hourStart - startTs) / 86400);
     if (dayIdx >= 0 && dayIdx < totalDays) {
-      const speedKnots = pos.knots || 0;
-      const cappedSpeed = Math.min(speedKnots, 6.0);
+      const cappedSpeed = Math.min(hourly.max_knots[k], 6.0);
       dailySpeeds[dayIdx] = Math.max(dailySpeeds[dayIdx], cappedSpeed);
     }
-  }
+  });
 
   const labels = new Array(totalDays).fill("");
 
@@ -120,18 +132,26 @@ function renderTimelineChart(positions, startTs, endTs) {
   });
 }
 
-function findDefaultActiveWindow(positions, segments, startTs, endTs) {
+// Active hours (any position at MIN_MOTION_SPEED or more) with their first and last active timestamps
+function activeHours(rollups) {
+  const hourly = rollups.hourly;
+  const hours = [];
+  hourly.start.forEach((_, k) => {
+    if (hourly.active[k]) hours.push({ first: hourly.first_active[k], last: hourly.last_active[k] });
+  });
+  return hours;
+}
+
+function findDefaultActiveWindow(rollups, startTs, endTs) {
   // Find the latest position with speed >= MIN_MOTION_SPEED mph
-  const activePositions = positions.filter(p => (p.mph || 0) >= MIN_MOTION_SPEED);
-  
+  const hours = activeHours(rollups);
+
   let targetTs;
-  if (activePositions.length > 0) {
-    const latestActive = activePositions[activePositions.length - 1];
-    targetTs = latestActive.utc_shifted_tstamp;
+  if (hours.length > 0) {
+    targetTs = hours[hours.length - 1].last;
   } else {
     // Fallback: use the latest recorded position
-    const lastPos = positions[positions.length - 1];
-    targetTs = lastPos ? lastPos.utc_shifted_tstamp : endTs;
+    targetTs = rollups.last_tstamp ?? endTs;
   }
 
   // Focus window is 7 days
@@ -152,31 +172,30 @@ function findDefaultActiveWindow(positions, segments, startTs, endTs) {
 }
 
 export function getNextActiveWindow(currentStartTs, currentEndTs, direction) {
-  if (!yearlyData || !yearlyData.positions || yearlyData.positions.length === 0) return null;
+  if (!yearlyRollups) return null;
 
-  // Filter positions to active ones (speed >= MIN_MOTION_SPEED)
-  const activePositions = yearlyData.positions.filter(p => (p.mph || 0) >= MIN_MOTION_SPEED);
-  if (activePositions.length === 0) return null;
+  // Hours are the finest rollup: within the hour that straddles the target, its
+  // first (or last) active position stands in for the one nearest the target
+  const hours = activeHours(yearlyRollups);
+  if (hours.length === 0) return null;
 
   if (direction === "prev") {
     // Find latest active position that is strictly before currentStartTs
     const target = currentStartTs - 10;
-    const candidates = activePositions.filter(p => p.utc_shifted_tstamp < target);
-    if (candidates.length === 0) return null;
-    
-    const latestActive = candidates[candidates.length - 1];
-    const focusEnd = latestActive.utc_shifted_tstamp;
+    const hour = hours.findLast(h => h.first < target);
+    if (!hour) return null;
+
+    const focusEnd = hour.last < target ? hour.last : hour.first;
     let focusStart = focusEnd - 7 * 86400;
     if (focusStart < timelineStartTs) focusStart = timelineStartTs;
     return { focusStart, focusEnd };
   } else if (direction === "next") {
     // Find earliest active position that is strictly after currentEndTs
     const target = currentEndTs + 10;
-    const candidates = activePositions.filter(p => p.utc_shifted_tstamp > target);
-    if (candidates.length === 0) return null;
-    
-    const earliestActive = candidates[0];
-    const focusStart = earliestActive.utc_shifted_tstamp;
+    const hour = hours.find(h => h.last > target);
+    if (!hour) return null;
+
+    const focusStart = hour.first > target ? hour.first : hour.last;
     let focusEnd = focusStart + 7 * 86400;
     if (focusEnd > timelineEndTs) focusEnd = timelineEndTs;
     return { focusStart, focusEnd };
@@ -186,42 +205,31 @@ export function getNextActiveWindow(currentStartTs, currentEndTs, direction) {
 
 export async function loadYearData(year, customStartTs = null, customEndTs = null) {
   try {
-    console.log(`Fetching year data for ${year}...`);
-    const response = await fetch(`/positions/year?year=${year}`);
-    const data = await response.json();
+    console.log(`Fetching rollups for ${year}...`);
+    const response = await fetch(`/rollups?year=${year}`);
+    const rollups = await response.json();
 
-    if (data.segments && data.segments.length > 0) {
-      data.segments.forEach((segment) => {
-        const globalIdx = segment[0].global_segment_index || 1;
-        const colorIdx = globalIdx - 1;
-        const color = SEGMENT_COLORS[colorIdx % SEGMENT_COLORS.length];
-        segment.forEach(pos => {
-          pos._segmentIndex = globalIdx;
-          pos._segmentColor = color;
-        });
-      });
-    }
+    yearlyRollups = rollups;
+    currentYear = year;
+    windowData = null;
+    followLivePositions(year);
+    currentYearStartTs = rollups.from_timestamp;
+    currentYearEndTs = rollups.to_timestamp;
 
-    yearlyData = data;
-    currentYearStartTs = data.from_timestamp;
-    currentYearEndTs = data.to_timestamp;
-
-    if (data.positions && data.positions.length > 0) {
-      const firstPos = data.positions[0];
-      const lastPos = data.positions[data.positions.length - 1];
-      const firstActiveTs = firstPos ? firstPos.utc_shifted_tstamp : data.from_timestamp;
-      const lastActiveTs = lastPos ? lastPos.utc_shifted_tstamp : data.to_timestamp;
+    if (rollups.first_tstamp !== null) {
+      const firstActiveTs = rollups.first_tstamp;
+      const lastActiveTs = rollups.last_tstamp;
 
       let startTs = firstActiveTs - TIMELINE_PADDING_DAYS * 86400;
       let endTs = lastActiveTs + TIMELINE_PADDING_DAYS * 86400;
 
-      if (startTs < data.from_timestamp) startTs = data.from_timestamp;
-      if (endTs > data.to_timestamp) endTs = data.to_timestamp;
+      if (startTs < rollups.from_timestamp) startTs = rollups.from_timestamp;
+      if (endTs > rollups.to_timestamp) endTs = rollups.to_timestamp;
 
       timelineStartTs = startTs;
       timelineEndTs = endTs;
 
-      renderTimelineChart(data.positions, timelineStartTs, timelineEndTs);
+      renderTimelineChart(rollups, timelineStartTs, timelineEndTs);
       renderTimelineMonths(timelineStartTs, timelineEndTs);
 
       let focusStart, focusEnd;
@@ -230,8 +238,7 @@ export async function loadYearData(year, customStartTs = null, customEndTs = nul
         focusEnd = customEndTs;
       } else {
         const defaultWindow = findDefaultActiveWindow(
-          data.positions,
-          data.segments,
+          rollups,
           timelineStartTs,
           timelineEndTs
         );
@@ -265,11 +272,86 @@ export async function loadYearData(year, customStartTs = null, customEndTs = nul
   }
 }
 
-export function updateFocusedWindow(startTs, endTs) {
-  if (!yearlyData || !yearlyData.segments) return;
+function followLivePositions(year) {
+  if (liveSource) liveSource.close();
+  liveSource = null;
+  liveData = null;
+  if (year !== new Date().getUTCFullYear()) return;
+
+  liveSource = new EventSource("/positions/live");
+  liveSource.addEventListener("snapshot", event => {
+    const snapshot = JSON.parse(event.data);
+    liveData = {
+      from: snapshot.live_from,
+      final: snapshot.final.map(decodeJsonPayload),
+      tail: decodeJsonPayload(snapshot.tail),
+    };
+    // Fetched positions may predate where the feed starts
+    windowData = null;
+    refreshLiveWindow();
+  });
+  liveSource.addEventListener("positions", event => {
+    if (!liveData) return;
+    const update = JSON.parse(event.data);
+    if (update.final) liveData.final.push(decodeJsonPayload(update.final));
+    liveData.tail = decodeJsonPayload(update.tail);
+    refreshLiveWindow();
+  });
+  liveSource.addEventListener("reset", () => {
+    // The feed started over from a newer cache: reload the year where we are
+    loadYearData(year, focusedWindow?.startTs ?? null, focusedWindow?.endTs ?? null);
+  });
+}
+
+function refreshLiveWindow() {
+  if (focusedWindow && focusedWindow.endTs >= liveData.from) {
+    updateFocusedWindow(focusedWindow.startTs, focusedWindow.endTs);
+  }
+}
+
+// Segments of fetched positions, with the live ones in place of those from liveData.from on
+function withLiveSegments(data) {
+  if (!liveData || data.track.year !== currentYear) return data.segments;
+  // Segments never straddle liveData.from (it is a segment start)
+  return data.segments
+    .filter(seg => seg[0].utc_shifted_tstamp < liveData.from)
+    .concat(...liveData.final.map(live => live.segments), liveData.tail.segments);
+}
+
+// Positions of the focused window, fetched with a window's width of slack on
+// each side so small drags and prev/next steps reuse what is already loaded
+async function loadWindow(startTs, endTs) {
+  if (windowData && windowData.from <= startTs && windowData.to >= endTs) return windowData.data;
+
+  const span = Math.max(endTs - startTs, 86400);
+  const from = Math.max(startTs - span, currentYearStartTs);
+  const to = Math.min(endTs + span, currentYearEndTs);
+  const year = currentYear;
+  const response = await fetch(
+    `/positions/year?year=${year}&format=bin&from_timestamp=${from}&to_timestamp=${to}`);
+  const data = decodeBinaryPayload(await response.arrayBuffer());
+  data.track.year = year;
+  if (year === currentYear) windowData = { from, to, data };
+  return data;
+}
+
+export async function updateFocusedWindow(startTs, endTs) {
+  if (!yearlyRollups) return;
+
+  const request = ++windowRequest;
+  focusedWindow = { startTs, endTs };
+  let data;
+  try {
+    data = await loadWindow(startTs, endTs);
+  } catch (error) {
+    console.error("Error loading positions for the focused window:", error);
+    return;
+  }
+  // A newer window was asked for while this one loaded
+  if (request !== windowRequest) return;
 
   const filteredSegments = [];
-  yearlyData.segments.forEach(seg => {
+  withLiveSegments(data).forEach(seg => {
     const inRange = seg.filter(p => p.utc_shifted_tstamp >= startTs && p.utc_shifted_tstamp <= endTs);
     if (inRange.length > 0) {
       filteredSegments.push(inRange);
@@ -9,3 +9,6 @@ export const SEGMENT_COLORS = [
 ];
 export const MIN_MOTION_SPEED = 1.5;
 export const TIMELINE_PADDING_DAYS = 30;
+// Simplification tiers served by /positions/year?zoom= (match app/services/simplify.py)
+export const LOD_TOLERANCES_METERS = [1000, 250, 60, 15, 4];
+export const WEB_MERCATOR_METERS_PER_PIXEL = 156543.03392;
@@ -57,7 +57,8 @@ export function buildGraph(chartContext, segments) {
        const relX = offset + ((pos.utc_shifted_tstamp - segStart) / segDuration) * width;
        const meta = {
          timestamp: pos.utc_shifted_tstamp,
-         localTime: pos.local_time,
+         // Formatted only when a tooltip asks for it
+         get localTime() { return pos.local_time; },
          segmentIndex: pos._segmentIndex || segment[0]._segmentIndex,
          cumulativeDistance: cumulativeDist
        };
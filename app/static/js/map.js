@@ -1,13 +1,121 @@
 // map.js
 import { highlightGraphPoint } from "./graph/index.js";
-import { SEGMENT_COLORS, IDLE_MIN_SECS, ANIMATION_SPEED_FACTOR } from "./constants.js";
+import {
+  SEGMENT_COLORS, IDLE_MIN_SECS, ANIMATION_SPEED_FACTOR, LOD_TOLERANCES_METERS, WEB_MERCATOR_METERS_PER_PIXEL,
+} from "./constants.js";
+import { decodeBinaryPayload } from "./shared/data.js";
 
 let map;
 let highlightMarker = null;
 let currentPositions = [];
+let currentLines = [];   // { segment, color } drawn as polylines
+let lineLayer = null;
+
+// Simplified-track rows for the current view per track, from /positions/year?zoom=&bbox=
+const lodViews = new WeakMap();
+
+// Coarsest tier whose tolerance is under one screen pixel, as in simplify.tier_for_zoom; null for full detail
+function tierForZoom(zoom, latitude) {
+  const metersPerPixel = WEB_MERCATOR_METERS_PER_PIXEL * Math.cos(latitude * Math.PI / 180) / 2 ** zoom;
+  const tier = LOD_TOLERANCES_METERS.findIndex(tol => tol <= metersPerPixel);
+  return tier === -1 ? null : tier;
+}
+
+function lodView(track, positions) {
+  if (!track || track.year === undefined) return null;
+  const zoom = Math.round(map.getZoom());
+  // Zoomed in past the finest tier: the loaded rows are already the right detail
+  if (tierForZoom(zoom, map.getCenter().lat) === null) return null;
+
+  // Half a screen of margin so small pans stay inside the fetched view
+  const bounds = map.getBounds().pad(0.5);
+  const bbox = [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].map(v => v.toFixed(4));
+  const from = positions[0].utc_shifted_tstamp;
+  const to = positions[positions.length - 1].utc_shifted_tstamp;
+  const key = `${zoom}/${bbox}/${from}/${to}`;
+
+  const view = lodViews.get(track);
+  if (view && view.key === key) return view.rows ? view : null;
+  if (view && view.rows && view.zoom === zoom && view.bounds.contains(map.getBounds())) return view;
+
+  lodViews.set(track, { key, zoom, bounds, rows: null });
+  fetch(`/positions/year?year=${track.year}&format=bin&zoom=${zoom}&bbox=${bbox.join(",")}`
+        + `&from_timestamp=${from}&to_timestamp=${to}`)
+    .then(response => response.arrayBuffer())
+    .then(buffer => {
+      if (lodViews.get(track)?.key !== key) return;  // the view moved on while this was in flight
+      // Tier rows index the full year; windowed tracks map theirs through track.row
+      const rows = new Set(decodeBinaryPayload(buffer).track.row);
+      lodViews.set(track, { key, zoom, bounds, rows });
+      drawSegmentLines();
+    })
+    .catch(error => {
+      if (lodViews.get(track)?.key === key) lodViews.delete(track);
+      console.error("Failed to fetch simplified track:", error);
+    });
+  // Draw the loaded rows until the simplified view arrives
+  return null;
+}
+
+// Position indexes bucketed by GRID_CELL_DEGREES cell, so a pan only tests positions near the view
+const GRID_CELL_DEGREES = 0.02;
+let positionGrid = new Map();
+
+function buildPositionGrid(positions) {
+  const grid = new Map();
+  positions.forEach((pos, i) => {
+    const key = `${Math.floor(pos.longitude / GRID_CELL_DEGREES)},${Math.floor(pos.latitude / GRID_CELL_DEGREES)}`;
+    let cell = grid.get(key);
+    if (!cell) grid.set(key, cell = []);
+    cell.push(i);
+  });
+  return grid;
+}
+
+function positionsInBounds(south, north, west, east) {
+  // Plain number comparisons: positions read lat/lon straight from typed arrays
+  const inside = pos => {
+    const lat = pos.latitude, lon = pos.longitude;
+    return lat >= south && lat <= north && lon >= west && lon <= east;
+  };
+  const x0 = Math.floor(west / GRID_CELL_DEGREES), x1 = Math.floor(east / GRID_CELL_DEGREES);
+  const y0 = Math.floor(south / GRID_CELL_DEGREES), y1 = Math.floor(north / GRID_CELL_DEGREES);
+  if ((x1 - x0 + 1) * (y1 - y0 + 1) > positionGrid.size) {
+    // Zoomed far out: fewer positions than cells to look up
+    return currentPositions.filter(inside);
+  }
+
+  const rows = [];
+  for (let x = x0; x <= x1; x++) {
+    for (let y = y0; y <= y1; y++) {
+      const cell = positionGrid.get(`${x},${y}`);
+      if (cell) cell.forEach(i => { if (inside(currentPositions[i])) rows.push(i); });
+    }
+  }
+  rows.sort((a, b) => a - b);
+  return rows.map(i => currentPositions[i]);
+}
+
+// Draw the current segments with only as many vertices as this zoom can show
+function drawSegmentLines() {
+  lineLayer.clearLayers();
+  const views = new Map();
+  currentLines.forEach(({ segment, color }) => {
+    const track = segment[0].track;
+    if (!views.has(track)) views.set(track, lodView(track, currentPositions.filter(pos => pos.track === track)));
+    const view = views.get(track);
+    const last = segment.length - 1;
+    const row = pos => (pos.track.row ? pos.track.row[pos.i] : pos.i);
+    // Rows outside the fetched view keep full detail; off screen they cost nothing to the eye
+    const keep = pos => !view.bounds.contains([pos.latitude, pos.longitude]) || view.rows.has(row(pos));
+    const points = view ? segment.filter((pos, k) => k === 0 || k === last || keep(pos)) : segment;
+    L.polyline(points.map(pos => [pos.latitude, pos.longitude]), { color, weight: 4 }).addTo(lineLayer);
+  });
+}
 
 export function updateMap(positions) {
   currentPositions = positions;
+  positionGrid = buildPositionGrid(positions);
   const segmentGroups = new Map();
   positions.forEach(pos => {
     if (!segmentGroups.has(pos._segmentIndex)) {
@@ -25,15 +133,17 @@ export function updateMap(positions) {
     }).addTo(map);
 
     map.on("moveend", () => {
+      drawSegmentLines();
       const bounds = map.getBounds();
-      const visiblePositions = currentPositions.filter(pos =>
-        bounds.contains([pos.latitude, pos.longitude])
-      );
+      const visiblePositions = positionsInBounds(
+        bounds.getSouth(), bounds.getNorth(), bounds.getWest(), bounds.getEast());
 
       import("./graph/index.js").then(({ updateSpeedGraphFromMap }) => {
         updateSpeedGraphFromMap(visiblePositions);
       });
     });
+
+    lineLayer = L.layerGroup().addTo(map);
   }
 
   map.eachLayer(layer => {
@@ -46,6 +156,7 @@ export function updateMap(positions) {
     }
   });
 
+  currentLines = [];
   [...segmentGroups.entries()].forEach(([segmentIndex, segment]) => {
     // Calculate segment distance using Leaflet's distanceTo (in meters)
     let totalDistMeters = 0;
@@ -62,10 +173,9 @@ export function updateMap(positions) {
     }
 
     const color = segment[0]._segmentColor || SEGMENT_COLORS[(segmentIndex - 1) % SEGMENT_COLORS.length] || "blue";
-    const latLngs = segment.map(pos => [pos.latitude, pos.longitude]);
-    L.polyline(latLngs, { color, weight: 4 }).addTo(map);
+    currentLines.push({ segment, color });
 
-    const startCoord = latLngs[0];
+    const startCoord = [segment[0].latitude, segment[0].longitude];
 
     const playDiv = document.createElement("div");
     playDiv.className = "play-button-icon";
@@ -87,6 +197,7 @@ export function updateMap(positions) {
     const bounds = L.latLngBounds(allPoints);
     map.fitBounds(bounds, { padding: [50, 50] });
   }
+  drawSegmentLines();
 
   positions.forEach((pos) => {
     const { latitude: lat, longitude: lon, duration_secs, local_time } = pos;
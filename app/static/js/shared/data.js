@@ -1,4 +1,114 @@
 // shared/data.js
+import { SEGMENT_COLORS } from "../constants.js";
+
+const BINARY_MAGIC = "BTPB";
+const BINARY_VERSION = 1;
+const TYPED_ARRAYS = { f64: Float64Array, f32: Float32Array, i32: Int32Array };
+
+// A position backed by one row of the typed-array columns in a track. Fields are
+// read straight from the buffers; NaN (missing) reads as null.
+class Position {
+  constructor(track, i) {
+    this.track = track;
+    this.i = i;
+  }
+
+  value(name) {
+    const v = this.track[name][this.i];
+    return Number.isNaN(v) ? null : v;
+  }
+
+  get utc_shifted_tstamp() { return this.track.utc_shifted_tstamp[this.i]; }
+  get latitude() { return this.track.latitude[this.i]; }
+  get longitude() { return this.track.longitude[this.i]; }
+  get mph() { return this.value("mph"); }
+  get knots() { return this.value("knots"); }
+  get rpm() { return this.value("rpm"); }
+  get duration_secs() { return this.value("duration_secs") ?? undefined; }
+
+  get tz_offset() {
+    const idx = this.track.tz_offset[this.i];
+    return idx < 0 ? null : this.track.tz_offsets[idx];
+  }
+
+  // utc_shifted_tstamp already reads as local wall-clock time
+  get local_time() {
+    return new Date(this.utc_shifted_tstamp * 1000).toISOString().slice(0, 19).replace("T", " ");
+  }
+
+  get global_segment_index() {
+    return (this.track.segment_offset ?? 0) + this.track.segment_id[this.i] + 1;
+  }
+
+  get _segmentIndex() { return this.global_segment_index; }
+
+  get _segmentColor() {
+    return SEGMENT_COLORS[(this.global_segment_index - 1) % SEGMENT_COLORS.length];
+  }
+}
+
+// Wrap a ?format=bin response: a small JSON header followed by little-endian
+// typed-array columns (see wire_format.py). Nothing is parsed per point.
+export function decodeBinaryPayload(buffer) {
+  const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+  if (magic !== BINARY_MAGIC) {
+    throw new Error("Not a binary positions payload");
+  }
+  const headerLen = new DataView(buffer).getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLen)));
+  if (header.version !== BINARY_VERSION) {
+    throw new Error(`Unsupported payload version: ${header.version}`);
+  }
+
+  const count = header.count;
+  const track = { segment_offset: header.segment_offset, tz_offsets: header.tz_offsets };
+  for (const [name, dtype, offset] of header.columns) {
+    track[name] = new TYPED_ARRAYS[dtype](buffer, offset, count);
+  }
+  return wrapTrack(track, count, header);
+}
+
+// The same for a JSON payload (as sent by /positions/live): columns are copied
+// into typed arrays once so positions read exactly as from a binary payload.
+export function decodeJsonPayload(payload) {
+  const count = payload.count;
+  const columns = payload.columns;
+  const track = { segment_offset: payload.segment_offset, tz_offsets: payload.tz_offsets };
+  for (const name of ["utc_shifted_tstamp", "latitude", "longitude", "mph", "knots", "rpm", "duration_secs"]) {
+    track[name] = Float64Array.from(columns[name], v => v ?? NaN);
+  }
+  track.tz_offset = Int32Array.from(columns.tz_offset, i => i ?? -1);
+  track.segment_id = new Int32Array(count).fill(-1);
+  const segmentIds = payload.segment_ids ?? payload.segments.map((_, k) => k);
+  payload.segments.forEach(([start, end], k) => track.segment_id.fill(segmentIds[k], start, end));
+  return wrapTrack(track, count, payload);
+}
+
+function wrapTrack(track, count, header) {
+  const positions = new Array(count);
+  for (let i = 0; i < count; i++) {
+    positions[i] = new Position(track, i);
+  }
+
+  // Segments are runs of equal segment_id
+  const segments = [];
+  let start = 0;
+  for (let i = 1; i <= count; i++) {
+    if (i === count || track.segment_id[i] !== track.segment_id[start]) {
+      segments.push(positions.slice(start, i));
+      start = i;
+    }
+  }
+
+  return {
+    track,
+    positions,
+    segments,
+    from_timestamp: header.from_timestamp,
+    to_timestamp: header.to_timestamp,
+  };
+}
+
 export function segmentPositions(positions, maxGapSecs, maxGapMiles) {
   const segments = [];
   let currentSegment = [];
@@ -1,14 +1,21 @@
 import time
-import pytz
 import re
 import os
 import logging
+import threading
+from functools import lru_cache
 from datetime import datetime, timezone, timedelta
-from timezonefinder import TimezoneFinder
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+TZ_GRID_DEGREES = 0.01      # lat/lon cell size for zone lookups (~1 km); points in one cell share a zone
+TZ_GRID_CACHE_CELLS = 4096  # zone names remembered for this many cells
+
+# Offset strings come from a handful of values, so each is parsed once and the
+# same tzinfo object is handed out for every position that uses it
+@lru_cache(maxsize=None)
 def get_timezone(tz_offset: str) -> timezone:
     # Regex to parse timezone offset
     match = re.match(r"^UTC(?P<sign>[+-])(?P<hours>\d{2}):(?P<minutes>\d{2})$", tz_offset)
@@ -44,6 +51,55 @@ def get_shifted_timestamp(origin_tz: timezone) -> float:
 def get_tz_offset2(tz: timezone) -> str:
     return tz.tzname(None)
 
+def format_shifted_times(tstamps, tz_offsets):
+    """
+    (utc_shifted_time, local_time) strings for arrays of utc_shifted_tstamp and
+    tz_offset, the same as str(datetime.fromtimestamp(...)) of each position.
+
+    The shifted timestamp already reads as local wall-clock time, so both strings
+    share their digits and differ only in the UTC offset suffix.
+    """
+    tstamps = np.asarray(tstamps, dtype=np.float64)
+    whole = tstamps == np.floor(tstamps)
+    wall = np.datetime_as_string(np.where(whole, tstamps, 0).astype(np.int64).astype("datetime64[s]"), unit="s").tolist()
+    suffixes = {tz: datetime(2000, 1, 1, tzinfo=get_timezone(tz)).isoformat()[19:] for tz in set(tz_offsets)}
+
+    utc_times, local_times = [], []
+    for i, (w, tz) in enumerate(zip(wall, tz_offsets)):
+        if whole[i]:
+            base = f"{w[:10]} {w[11:]}"
+            utc_times.append(base + "+00:00")
+            local_times.append(base + suffixes[tz])
+        else:
+            # Sub-second timestamps keep datetime's own rounding and formatting
+            local_tz = get_timezone(tz)
+            utc_times.append(str(datetime.fromtimestamp(tstamps[i], timezone.utc)))
+            local_times.append(str(datetime.fromtimestamp(unshift_timestamp(tstamps[i], local_tz), local_tz)))
+    return utc_times, local_times
+
+_finder = None
+_finder_lock = threading.Lock()
+
+def get_timezone_finder():
+    """Process-wide TimezoneFinder, imported and created (and its polygon data loaded) on first use."""
+    global _finder
+    if _finder is None:
+        with _finder_lock:
+            if _finder is None:
+                from timezonefinder import TimezoneFinder
+                _finder = TimezoneFinder()
+    return _finder
+
+@lru_cache(maxsize=TZ_GRID_CACHE_CELLS)
+def _zone_for_cell(lat_cell: int, lng_cell: int):
+    lat = (lat_cell + 0.5) * TZ_GRID_DEGREES
+    lng = (lng_cell + 0.5) * TZ_GRID_DEGREES
+    return get_timezone_finder().timezone_at(lat=lat, lng=lng)
+
+def get_zone_name(latitude: float, longitude: float):
+    """IANA zone name at a position, looked up once per TZ_GRID_DEGREES cell."""
+    return _zone_for_cell(int(np.floor(latitude / TZ_GRID_DEGREES)), int(np.floor(longitude / TZ_GRID_DEGREES)))
+
 def get_tz_offset(latitude: float, longitude: float) -> str:
     """
     Determine the UTC offset (in 'UTC±HH:MM' format) based on latitude and longitude.
@@ -57,13 +113,13 @@ def get_tz_offset(latitude: float, longitude: float) -> str:
     """
     try:
         # Determine the timezone
-        tf = TimezoneFinder()
-        time_zone_name = tf.timezone_at(lat=latitude, lng=longitude)
+        time_zone_name = get_zone_name(latitude, longitude)
         
         if not time_zone_name:
             return "Unknown"
 
         # Get the current time in the identified timezone
+        import pytz
         timezone = pytz.timezone(time_zone_name)
         local_time = datetime.now(timezone)
 
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+import time
+import asyncio
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from app.main import get_positions_for_year_internal
+from app.services import parallel
+from app.services.firestore import async_client
+
+async def backfill(years, workers):
+    """Rebuild the year caches, oldest first so each year's segment offset is known."""
+    db = async_client()
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for year in sorted(years):
+                start_time = time.time()
+                payload = await get_positions_for_year_internal(year, db, executor)
+                print(f"Rebuilt {year}: {payload['count']} positions, {len(payload['segments'])} segments "
+                      f"in {time.time() - start_time:.2f} seconds.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild year caches from Firestore using every core.")
+    parser.add_argument("years", type=int, nargs="+", help="Years to rebuild, e.g. 2025 2026")
+    parser.add_argument("--workers", type=int, default=parallel.default_workers(), help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(args.years, args.workers))
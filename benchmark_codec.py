@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import json
+import time
+import argparse
+from fastapi.encoders import jsonable_encoder
+from app.services.firestore import process_raw_positions, segment_positions, trip_segment_mask
+from app.services import synthetic, wire_format, codec
+
+# Encode/decode throughput of year payloads: the codec (orjson, see
+# app/services/codec.py) against the standard library json it replaced, and
+# against FastAPI's default response path (jsonable_encoder, then json.dumps).
+#
+#   python benchmark_codec.py --scales 10000 100000
+#
+# Payloads are built from synthetic tracks (app/services/synthetic.py). Each
+# timing is the fastest of --repeat runs.
+
+DEFAULT_SCALES = (10000, 100000)
+
+
+def build_payload(points, seed):
+    positions = process_raw_positions([raw for _, raw in synthetic.generate_documents(points, seed)])
+    segmented_all = segment_positions(positions, filter_stationary=False)
+    keep = trip_segment_mask(segmented_all)
+    bounds = [b for b, k in zip(segmented_all.segment_bounds(), keep) if k]
+    return wire_format.encode_payload(positions, bounds, synthetic.SYNTHETIC_START_TSTAMP, 0, segment_offset=0)
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start_time)
+    return best, result
+
+
+def run_scale(points, seed, repeat):
+    payload = build_payload(points, seed)
+    engines = [
+        ("json", lambda: json.dumps(payload).encode(), json.loads),
+        ("codec", lambda: codec.dumps(payload), codec.loads),
+        ("decode_payload", None, codec.decode_payload),
+        ("fastapi_default", lambda: json.dumps(jsonable_encoder(payload)).encode(), None),
+    ]
+    body = codec.dumps(payload)
+    if codec.loads(body) != json.loads(json.dumps(payload)):
+        print("⚠️ codec round trip differs from the standard library")
+
+    results = []
+    for name, encode, decode in engines:
+        encode_secs, encoded = best_of(repeat, encode) if encode else (None, body)
+        decode_secs, _ = best_of(repeat, lambda: decode(encoded)) if decode else (None, None)
+        results.append((name, len(encoded), encode_secs, decode_secs))
+    return payload["count"], results
+
+
+def print_results(count, results):
+    print(f"\n{count} positions")
+    print(f"{'Engine':<16} | {'MiB':>6} | {'Encode s':>9} | {'MiB/s':>7} | {'Decode s':>9} | {'MiB/s':>7} | {'Points/s (enc)':>14}")
+    print("-" * 86)
+    for name, size, encode_secs, decode_secs in results:
+        mib = size / 2**20
+        enc = f"{encode_secs:>9.4f} | {mib / encode_secs:>7.1f}" if encode_secs else f"{'':>9} | {'':>7}"
+        dec = f"{decode_secs:>9.4f} | {mib / decode_secs:>7.1f}" if decode_secs else f"{'':>9} | {'':>7}"
+        rate = f"{count / encode_secs:>14,.0f}" if encode_secs else ""
+        print(f"{name:<16} | {mib:>6.2f} | {enc} | {dec} | {rate}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark JSON encoding and decoding of year payloads.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="Synthetic document counts (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timing; the fastest is kept")
+    args = parser.parse_args()
+
+    for points in args.scales:
+        print_results(*run_scale(points, args.seed, args.repeat))
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import tracemalloc
+from datetime import datetime, timezone
+from app.services.firestore import normalize_positions, pipeline_steps
+from app.services import synthetic, wire_format, simplify, payload_cache, lod, mirror, codec, year_cache
+
+# Timings and peak memory of each pipeline stage over synthetic data (see
+# app/services/synthetic.py), with optional baselines to catch regressions.
+#
+#   python benchmark_pipeline.py --scales 1000 100000 --save-baseline
+#   python benchmark_pipeline.py --scales 1000 100000 --compare
+#
+# Each stage is timed over --repeat runs and the fastest kept; peak memory comes
+# from a separate tracemalloc run so tracing does not skew the timings.
+# --endpoints also builds the synthetic year through a temporary SQLite mirror
+# and times the /positions/year responses.
+
+DEFAULT_SCALES = (1000, 10000, 100000)
+DEFAULT_BASELINE_PATH = "benchmark_baseline.json"
+REGRESSION_RATIO = 1.25        # slower than baseline by more than this is a regression
+REGRESSION_MIN_SECS = 0.005    # ... unless it is within this much (timer noise)
+
+
+def pipeline_stages(raw_docs):
+    """(name, function) pairs that run process_raw_positions one step at a time, then encode the result."""
+    state = {}
+
+    def normalize():
+        state["positions"] = normalize_positions(raw_docs)
+
+    def step(run):
+        return lambda: state.update(positions=run(state["positions"]))
+
+    def segment():
+        _, _, state["kept"] = year_cache.kept_segments(state["positions"], 0)
+
+    def encode():
+        kept = state["kept"]
+        state["payload"] = wire_format.encode_payload(kept, kept.segment_bounds(), 0, 0)
+
+    def json_dump():
+        state["body"] = codec.dumps(state["payload"])
+
+    def gzip():
+        payload_cache.encode_entry(state["body"])
+
+    def binary():
+        wire_format.encode_binary(state["payload"])
+
+    def build_lod():
+        payload = state["payload"]
+        simplify.build_tiers(payload["columns"]["latitude"], payload["columns"]["longitude"], payload["segments"])
+
+    # The same steps, in the same order, as process_raw_positions itself
+    stages = [("normalize", normalize)] + [(name, step(run)) for name, run in pipeline_steps()]
+    stages += [("segment", segment), ("encode_payload", encode), ("json_dump", json_dump),
+               ("compress", gzip), ("encode_binary", binary), ("build_lod", build_lod)]
+    return stages, state
+
+
+def time_stages(raw_docs, repeat):
+    """Fastest seconds of each stage over repeat runs, and the final staged positions."""
+    best = {}
+    for _ in range(repeat):
+        stages, state = pipeline_stages(raw_docs)
+        for name, run in stages:
+            start_time = time.perf_counter()
+            run()
+            best[name] = min(best.get(name, float("inf")), time.perf_counter() - start_time)
+    return best, state["positions"]
+
+
+def peak_memory(raw_docs):
+    """Peak bytes traced during each stage."""
+    peaks = {}
+    stages, _ = pipeline_stages(raw_docs)
+    tracemalloc.start()
+    try:
+        for name, run in stages:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            run()
+            peaks[name] = tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def time_endpoints(raw_docs, repeat):
+    """Seconds for a cold year build and the /positions/year responses, served from a temporary mirror."""
+    os.environ.setdefault("TRACKER_UI_USERNAME", "benchmark")
+    os.environ.setdefault("TRACKER_UI_PASSWORD", "benchmark")
+    from fastapi.testclient import TestClient
+    from app import main
+
+    year = datetime.fromtimestamp(synthetic.SYNTHETIC_START_TSTAMP, tz=timezone.utc).year
+    auth = (os.environ["TRACKER_UI_USERNAME"], os.environ["TRACKER_UI_PASSWORD"])
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mirror.sqlite")
+        mirror.write_documents(path, raw_docs.items())
+        previous = os.environ.get(mirror.MIRROR_ENV), main.CACHE_DIR, main.year_payloads, main.year_geometry
+        os.environ[mirror.MIRROR_ENV] = path
+        main.app.dependency_overrides[main.get_db] = lambda: None
+        try:
+            for _ in range(repeat):
+                main.CACHE_DIR = tempfile.mkdtemp(dir=tmp)
+                start_time = time.perf_counter()
+                asyncio.run(main.get_positions_for_year_internal(year, None))
+                timings["year_build"] = min(timings.get("year_build", float("inf")), time.perf_counter() - start_time)
+
+            client = TestClient(main.app)
+            headers = {"Accept-Encoding": "gzip"}
+            requests = [("year_json", {}), ("year_bin", {"format": "bin"}), ("year_zoom", {"zoom": 8}),
+                        ("year_bbox", {"bbox": "-122.6,47.4,-122.2,47.8"})]
+            for name, params in requests:
+                main.year_payloads = payload_cache.PayloadCache()
+                main.year_geometry = lod.YearGeometryCache()
+                start_time = time.perf_counter()
+                response = client.get("/positions/year", params={"year": year, **params}, headers=headers, auth=auth)
+                timings[f"{name}_cold"] = time.perf_counter() - start_time
+                response.raise_for_status()
+                for _ in range(repeat):
+                    start_time = time.perf_counter()
+                    client.get("/positions/year", params={"year": year, **params}, headers=headers, auth=auth)
+                    timings[f"{name}_warm"] = min(timings.get(f"{name}_warm", float("inf")), time.perf_counter() - start_time)
+        finally:
+            main.app.dependency_overrides.pop(main.get_db, None)
+            if previous[0] is None:
+                os.environ.pop(mirror.MIRROR_ENV, None)
+            else:
+                os.environ[mirror.MIRROR_ENV] = previous[0]
+            main.CACHE_DIR, main.year_payloads, main.year_geometry = previous[1:]
+    return timings
+
+
+def run_scale(points, seed, repeat, memory, endpoints):
+    print(f"Generating {points} synthetic documents (seed {seed})...")
+    start_time = time.perf_counter()
+    raw_docs = dict(synthetic.generate_documents(points, seed))
+    print(f"Generated in {time.perf_counter() - start_time:.2f} seconds.")
+
+    timings, staged = time_stages(list(raw_docs.values()), repeat)
+    result = {"points": points, "positions": len(staged), "seconds": timings}
+    if memory:
+        result["peak_bytes"] = peak_memory(list(raw_docs.values()))
+    if endpoints:
+        result["seconds"].update(time_endpoints(raw_docs, repeat))
+    return result
+
+
+def print_results(results, baseline=None):
+    for key, result in results.items():
+        previous = (baseline or {}).get(key, {}).get("seconds", {})
+        print(f"\n{result['points']} documents -> {result['positions']} positions")
+        print(f"{'Stage':<20} | {'Seconds':>10} | {'Baseline':>10} | {'Ratio':>6} | {'Peak MiB':>9}")
+        print("-" * 68)
+        for stage, secs in result["seconds"].items():
+            base = previous.get(stage)
+            ratio = f"{secs / base:.2f}" if base else ""
+            base_str = f"{base:.4f}" if base is not None else ""
+            peak = result.get("peak_bytes", {}).get(stage)
+            peak_str = f"{peak / 2**20:.1f}" if peak is not None else ""
+            print(f"{stage:<20} | {secs:>10.4f} | {base_str:>10} | {ratio:>6} | {peak_str:>9}")
+        print(f"{'total':<20} | {sum(result['seconds'].values()):>10.4f} |")
+
+
+def regressions(results, baseline, ratio=REGRESSION_RATIO, min_secs=REGRESSION_MIN_SECS):
+    """(scale, stage, seconds, baseline seconds) of every stage slower than its baseline."""
+    found = []
+    for key, result in results.items():
+        previous = baseline.get(key, {}).get("seconds", {})
+        for stage, secs in result["seconds"].items():
+            base = previous.get(stage)
+            if base is not None and secs > base * ratio and secs - base > min_secs:
+                found.append((key, stage, secs, base))
+    return found
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the position pipeline on synthetic tracks.")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES),
+                        help="Document counts to run, 1000 to 10000000 (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept")
+    parser.add_argument("--memory", action="store_true", help="Also measure peak memory per stage (slow)")
+    parser.add_argument("--endpoints", action="store_true", help="Also time the year build and /positions/year")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE_PATH, metavar="PATH",
+                        help=f"Write the results as the new baseline (default path: {DEFAULT_BASELINE_PATH})")
+    parser.add_argument("--compare", nargs="?", const=DEFAULT_BASELINE_PATH, metavar="PATH",
+                        help="Compare against a baseline and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_RATIO,
+                        help="Slowdown ratio counted as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    for points in args.scales:
+        results[f"{points}:{args.seed}"] = run_scale(points, args.seed, args.repeat, args.memory, args.endpoints)
+    print_results(results, baseline)
+    print(f"\nPeak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({"created_at": datetime.now(timezone.utc).isoformat(), "results": results}, f, indent=2)
+        print(f"💾 Saved baseline to {args.save_baseline}")
+
+    if baseline is not None:
+        found = regressions(results, baseline, args.threshold)
+        for key, stage, secs, base in found:
+            print(f"❌ {key} {stage}: {secs:.4f}s vs {base:.4f}s baseline ({secs / base:.2f}x)")
+        if found:
+            sys.exit(1)
+        print("✅ No regressions against the baseline.")
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+# Import-time budget for the server and the CLI tools, measured with
+# python -X importtime in a fresh interpreter per module.
+#
+#   python check_import_time.py
+#   python check_import_time.py --scale 2 --top 15 app.main
+#
+# tests/test_import_time.py runs the same check for every module under pytest
+# (IMPORT_TIME_SCALE scales the budgets there).
+#
+# Fails (exit 1) when a module takes longer than its budget to import, or when
+# it imports one of DEFERRED_MODULES: those are only imported once actually
+# needed (a Firestore client, a timezone lookup), see app/services/firestore.py
+# and app/utils/mytime.py.
+
+IMPORT_BUDGETS = {             # module -> seconds (cumulative import time)
+    "app.main": 1.0,           # mostly fastapi and pydantic
+    "app.services.firestore": 0.4,
+    "app.services.position_stream": 0.4,
+    "app.utils.mytime": 0.4,
+    "analyze_segments": 0.4,
+    "dump_gps": 0.4,
+    "sync_mirror": 0.4,
+    "migrate_schema": 0.4,
+    "backfill_years": 1.2,     # imports app.main
+    "benchmark_pipeline": 0.4,
+}
+DEFERRED_MODULES = ("google.cloud.firestore", "pytz", "timezonefinder")
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(module):
+    """[(name, self seconds, cumulative seconds, depth), ...] of one fresh import of module."""
+    # Once to compile bytecode, then the measured run
+    command = [sys.executable, "-X", "importtime", "-c", f"import {module}"]
+    # From the repo root, wherever we were started: app.main mounts app/static relative to it
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    subprocess.run(command, capture_output=True, cwd=cwd)
+    result = subprocess.run(command, capture_output=True, text=True, cwd=cwd)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            times.append((name, int(own) / 1e6, int(cumulative) / 1e6, len(indent) // 2))
+    return times
+
+
+def check(module, budget, top):
+    """Print module's import time and slowest imports; returns a list of problems."""
+    times = import_times(module)
+    total = next(cumulative for name, _, cumulative, depth in times if name == module and depth == 0)
+    status = "✅" if total <= budget else "❌"
+    print(f"{status} {module}: {total:.3f}s (budget {budget:.2f}s)")
+    for name, own, cumulative, depth in sorted(times, key=lambda t: -t[1])[:top]:
+        print(f"     {own:8.3f}s self {cumulative:8.3f}s total  {name}")
+
+    problems = []
+    if total > budget:
+        problems.append(f"{module} imports in {total:.3f}s, over its {budget:.2f}s budget")
+    imported = {name for name, _, _, _ in times}
+    for deferred in DEFERRED_MODULES:
+        if deferred in imported:
+            problems.append(f"{module} imports {deferred} at load time")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check import times against their budgets.")
+    parser.add_argument("modules", nargs="*", default=list(IMPORT_BUDGETS),
+                        help="Modules to check (default: every module with a budget)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every budget (slow machines)")
+    parser.add_argument("--top", type=int, default=5, help="Slowest imports to list per module")
+    args = parser.parse_args()
+
+    problems = []
+    for module in args.modules:
+        problems += check(module, IMPORT_BUDGETS.get(module, 1.0) * args.scale, args.top)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        sys.exit(1)
+    print("✅ All imports within budget.")
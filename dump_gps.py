@@ -1,17 +1,10 @@
-from google.cloud import firestore
 from datetime import datetime, timedelta, timezone
 import asyncio
-from app.services.firestore import fs_fetch_positions
-import json
-import re
-import os
+from app.services.firestore import async_client
+from app.services.position_stream import fs_fetch_positions
+from app.services import codec
 import sys
 import traceback
-import app.utils.mytime as mytime
-from geopy.distance import geodesic
-
-# Initialize Firestore client
-db = firestore.Client(project="boat-crumbs")
 
 async def main():
     """
@@ -49,15 +42,18 @@ async def main():
     print(f"From timestamp: {from_timestamp}, To timestamp: {to_timestamp}")
 
     # Call the fetch_positions function
+    db = async_client()
     try:
         positions = await fs_fetch_positions(db, from_timestamp, to_timestamp)
         print(f"Fetched {len(positions)} positions")
-        for position in positions:
-            print(json.dumps(position, indent=2))
+        for position in positions.to_dicts():
+            print(codec.dumps(position, indent=True).decode())
 
     except Exception as e:
         print(f"An error occurred: {e}")
         traceback.print_exc()
+    finally:
+        db.close()
 
 # Run the main function
 if __name__ == "__main__":
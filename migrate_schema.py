@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+import time
+import asyncio
+import argparse
+from app.services import schema_migration
+from app.services.firestore import SCHEMA_TSTAMP_MIN, SCHEMA_TSTAMP_MAX, async_client
+
+async def main(from_timestamp, to_timestamp, dry_run):
+    db = async_client()
+    try:
+        start_time = time.time()
+        found, remaining = await schema_migration.migrate(db, from_timestamp, to_timestamp, dry_run)
+        action = "Found" if dry_run else "Rewrote"
+        print(f"{action} {found} swapped-schema documents in {time.time() - start_time:.2f} seconds.")
+        if remaining:
+            print("Ranges still queried for swapped-schema documents:")
+            for a, b in remaining:
+                print(f"  {a} - {b}")
+        else:
+            print("No ranges left with swapped-schema documents; fetches use a single query.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rewrite swapped-schema gps_data documents in the correct schema.")
+    parser.add_argument("--from", dest="from_timestamp", type=int, default=SCHEMA_TSTAMP_MIN, help="Start of the range (UNIX timestamp)")
+    parser.add_argument("--to", dest="to_timestamp", type=int, default=SCHEMA_TSTAMP_MAX, help="End of the range (UNIX timestamp)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the documents; change nothing.")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.from_timestamp, args.to_timestamp, args.dry_run))
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+import os
+import time
+import asyncio
+import argparse
+from app.services import mirror
+from app.services.firestore import async_client
+
+DEFAULT_MIRROR_PATH = "app/cache/gps_mirror.sqlite"
+
+async def main(path, full):
+    db = async_client()
+    try:
+        start_time = time.time()
+        written = await mirror.sync(db, path, full=full)
+        print(f"Wrote {written} documents to {path} in {time.time() - start_time:.2f} seconds.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mirror Firestore gps_data into a local SQLite file.")
+    parser.add_argument("--path", default=os.getenv(mirror.MIRROR_ENV) or DEFAULT_MIRROR_PATH,
+                        help=f"Mirror file (default: ${mirror.MIRROR_ENV} or {DEFAULT_MIRROR_PATH})")
+    parser.add_argument("--full", action="store_true", help="Re-copy every document instead of only new ones.")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.path, args.full))
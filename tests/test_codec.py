@@ -0,0 +1,40 @@
+import pytest
+from app.services import codec, synthetic, wire_format
+from app.services.firestore import process_raw_positions, segment_positions
+
+
+@pytest.fixture(scope="module")
+def payload():
+    positions = segment_positions(process_raw_positions([raw for _, raw in synthetic.generate_documents(2000, 2)]),
+                                  filter_stationary=False)
+    return wire_format.encode_payload(positions, positions.segment_bounds(), synthetic.SYNTHETIC_START_TSTAMP, 0)
+
+
+def test_round_trip(payload):
+    body = codec.dumps(payload)
+    assert isinstance(body, bytes)
+    assert codec.decode_payload(body, wire_format.FORMAT_VERSION) == payload
+    assert codec.loads(codec.dumps(payload, indent=True)) == payload
+
+
+def test_columns_follow_schema(payload):
+    assert tuple(payload["columns"]) == codec.COLUMN_NAMES
+    assert all(key in payload for key in codec.PAYLOAD_KEYS)
+
+
+@pytest.mark.parametrize("damage", [
+    lambda p: p.pop("segments"),
+    lambda p: p["columns"]["knots"].pop(),
+    lambda p: p["segments"].append([0, p["count"] + 1]),
+    lambda p: p.update(version=wire_format.FORMAT_VERSION + 1),
+])
+def test_decode_payload_rejects(payload, damage):
+    broken = codec.loads(codec.dumps(payload))
+    damage(broken)
+    with pytest.raises(ValueError):
+        codec.decode_payload(codec.dumps(broken), wire_format.FORMAT_VERSION)
+
+
+def test_decode_payload_rejects_non_object():
+    with pytest.raises(ValueError):
+        codec.decode_payload(b"[1, 2]")
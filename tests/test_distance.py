@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+from app.services import distance
+
+# The kernel's documented agreement with geopy (see app/services/distance.py)
+ELLIPSOIDAL_TOLERANCE_MILES = 1e-6
+HAVERSINE_RELATIVE_ERROR = 0.006
+
+
+def random_pairs(n, max_step_degrees, seed):
+    rng = np.random.default_rng(seed)
+    lats1 = rng.uniform(-80, 80, n)
+    lons1 = rng.uniform(-180, 180, n)
+    lats2 = np.clip(lats1 + rng.uniform(-max_step_degrees, max_step_degrees, n), -89, 89)
+    lons2 = (lons1 + rng.uniform(-max_step_degrees, max_step_degrees, n) + 180) % 360 - 180
+    return lats1, lons1, lats2, lons2
+
+
+def random_track(n, seed):
+    rng = np.random.default_rng(seed)
+    lats = 47.6 + np.cumsum(rng.normal(0, 0.002, n))
+    lons = -122.4 + np.cumsum(rng.normal(0, 0.002, n))
+    return lats, lons
+
+
+def geodesic_miles(lats1, lons1, lats2, lons2):
+    return np.array([geodesic((a, b), (c, d)).miles for a, b, c, d in zip(lats1, lons1, lats2, lons2)])
+
+
+@pytest.mark.parametrize("max_step_degrees", [0.001, 0.1, 5.0, 120.0])
+def test_distances_match_geodesic(max_step_degrees):
+    pairs = random_pairs(500, max_step_degrees, seed=int(max_step_degrees * 1000))
+    np.testing.assert_allclose(distance.distances_miles(*pairs), geodesic_miles(*pairs),
+                               rtol=0, atol=ELLIPSOIDAL_TOLERANCE_MILES)
+
+
+def test_scalar_matches_vectorized():
+    pairs = random_pairs(200, 10.0, seed=1)
+    scalar = [distance.distance_miles(*p) for p in zip(*pairs)]
+    np.testing.assert_allclose(scalar, distance.distances_miles(*pairs), rtol=0, atol=ELLIPSOIDAL_TOLERANCE_MILES)
+
+
+def test_nearly_antipodal_falls_back_to_geodesic():
+    pairs = (np.array([0.0, 0.5]), np.array([0.0, 0.0]), np.array([0.5, -0.5]), np.array([179.7, 179.5]))
+    np.testing.assert_allclose(distance.distances_miles(*pairs), geodesic_miles(*pairs),
+                               rtol=0, atol=ELLIPSOIDAL_TOLERANCE_MILES)
+
+
+def test_path_distances_match_geodesic():
+    lats, lons = random_track(300, seed=2)
+    anchor = (47.61, -122.38)
+    path = distance.path_distances(lats, lons, anchor=anchor)
+    tolerance = dict(rtol=0, atol=ELLIPSOIDAL_TOLERANCE_MILES)
+    np.testing.assert_allclose(path.consecutive, geodesic_miles(lats[:-1], lons[:-1], lats[1:], lons[1:]), **tolerance)
+    np.testing.assert_allclose(path.skip_one, geodesic_miles(lats[:-2], lons[:-2], lats[2:], lons[2:]), **tolerance)
+    n = len(lats)
+    np.testing.assert_allclose(path.to_anchor,
+                               geodesic_miles(lats, lons, np.full(n, anchor[0]), np.full(n, anchor[1])), **tolerance)
+
+
+def test_path_distances_short_tracks():
+    for n in range(3):
+        path = distance.path_distances(np.zeros(n), np.zeros(n))
+        assert (len(path.consecutive), len(path.skip_one), len(path.to_anchor)) == (max(n - 1, 0), max(n - 2, 0), 0)
+
+
+@pytest.mark.parametrize("max_step_degrees", [0.01, 5.0, 120.0])
+def test_haversine_within_documented_error(max_step_degrees):
+    pairs = random_pairs(500, max_step_degrees, seed=7)
+    expected = geodesic_miles(*pairs)
+    miles = distance.distances_miles(*pairs, mode=distance.HAVERSINE)
+    assert np.all(np.abs(miles - expected) <= HAVERSINE_RELATIVE_ERROR * expected + 1e-9)
+
+
+def test_invalid_points_are_zero():
+    miles = distance.distances_miles([np.nan, 91.0, 10.0], [0.0, 0.0, 200.0], [1.0, 1.0, 1.0], [1.0, 1.0, 1.0])
+    assert miles.tolist() == [0.0, 0.0, 0.0]
+    assert distance.distance_miles(95.0, 0.0, 1.0, 1.0) == 0.0
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        distance.distances_miles([0.0], [0.0], [1.0], [1.0], mode="flat")
@@ -0,0 +1,12 @@
+import os
+import pytest
+import check_import_time
+
+# Slow machines (CI runners) can scale every budget, e.g. IMPORT_TIME_SCALE=2
+SCALE = float(os.environ.get("IMPORT_TIME_SCALE", "1"))
+
+
+@pytest.mark.parametrize("module", list(check_import_time.IMPORT_BUDGETS))
+def test_import_within_budget(module):
+    problems = check_import_time.check(module, check_import_time.IMPORT_BUDGETS[module] * SCALE, top=5)
+    assert not problems, "\n".join(problems)
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import contextlib
+import importlib
+import io
+import numpy as np
+import pytest
+from app.services import mirror, range_planner, synthetic, year_cache
+from app.services.firestore import normalize_position, process_raw_positions
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+YEAR = 2025
+DAY = 86400
+
+
+@pytest.fixture
+def main(tmp_path, monkeypatch):
+    monkeypatch.setenv(mirror.MIRROR_ENV, str(tmp_path / "gps.sqlite"))
+    monkeypatch.chdir(REPO_ROOT)
+    main = importlib.import_module("app.main")
+    monkeypatch.setattr(main, "CACHE_DIR", str(tmp_path))
+    return main
+
+
+def quietly(coroutine):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(coroutine)
+
+
+def refresh_cuts(raw_docs):
+    """Mirror cut-off timestamps inside stationary groups and one or two rows after a segment start."""
+    positions = process_raw_positions([raw for _, raw in raw_docs])
+    anchors = np.flatnonzero(positions.duration_secs > 600)
+    inside = positions.utc_shifted_tstamp[anchors] + positions.duration_secs[anchors] / 2
+    gaps = np.flatnonzero(np.diff(positions.utc_shifted_tstamp) > 3600) + 1
+    after_start = np.concatenate([positions.utc_shifted_tstamp[gaps[gaps + 2 < len(positions)] + k] for k in (0, 1)])
+    cuts = np.concatenate([inside[::max(len(inside) // 8, 1)], after_start[::max(len(after_start) // 8, 1)]])
+    return sorted(set(cuts.tolist()))
+
+
+def test_incremental_refreshes_match_a_full_build(main, tmp_path):
+    new_year = range_planner.year_bounds(YEAR)[0]
+    raw_docs = list(synthetic.generate_documents(5000, 7, start=new_year - 2 * DAY))
+    tstamps = [normalize_position(raw)["utc_shifted_tstamp"] for _, raw in raw_docs]
+    cuts = refresh_cuts(raw_docs)
+    assert len(cuts) >= 10
+
+    path = os.environ[mirror.MIRROR_ENV]
+    written = set()
+
+    def mirror_until(cut):
+        docs = [(doc_id, raw) for (doc_id, raw), t in zip(raw_docs, tstamps) if t <= cut and doc_id not in written]
+        written.update(doc_id for doc_id, _ in docs)
+        mirror.write_documents(path, docs)
+
+    mirror_until(cuts[0])
+    payload = quietly(main.get_positions_for_year_internal(YEAR, None))
+    state = year_cache.load_state(main.CACHE_DIR, YEAR)
+    refreshed = 0
+    for k, cut in enumerate(cuts[1:]):
+        mirror_until(cut)
+        if state is None:
+            payload = quietly(main.get_positions_for_year_internal(YEAR, None))
+            state = year_cache.load_state(main.CACHE_DIR, YEAR)
+        else:
+            payload, state = quietly(year_cache.refresh_year_incremental(None, payload, state))
+            refreshed += 1
+
+        main.CACHE_DIR = str(tmp_path / f"full-{k}")
+        os.mkdir(main.CACHE_DIR)
+        full = quietly(main.get_positions_for_year_internal(YEAR, None))
+        assert payload == full
+        assert state == year_cache.load_state(main.CACHE_DIR, YEAR)
+    assert refreshed >= len(cuts) // 2
@@ -0,0 +1,35 @@
+from app.services import codec, live, position_stream, synthetic
+
+YEAR = 2025
+
+
+def count_processing(monkeypatch):
+    calls = []
+    process = position_stream.process_raw_positions
+    monkeypatch.setattr(position_stream, "process_raw_positions", lambda docs: calls.append(len(docs)) or process(docs))
+    return calls
+
+
+def test_tail_matches_processing_the_pending_documents():
+    tail = live._Tail(YEAR, None, 0)
+    docs = list(synthetic.generate_documents(600, seed=3))
+    for k in range(0, len(docs), 7):
+        _, payload = tail.advance(docs[k:k + 7])
+    fresh = position_stream.PositionStream()
+    fresh.pending, fresh.context = dict(tail.stream.pending), tail.stream.context
+    expected, _ = tail._payload(fresh.process(), tail.next_segment)
+    assert codec.dumps(payload) == codec.dumps(expected)
+
+
+def test_tail_is_not_rebuilt_without_new_documents(monkeypatch):
+    tail = live._Tail(YEAR, None, 0)
+    docs = list(synthetic.generate_documents(300, seed=4))
+    _, payload = tail.advance(docs[:-2])
+    calls = count_processing(monkeypatch)
+    assert tail.advance([])[1] is payload
+    # Firestore re-sends modified documents; unchanged ones leave the tail alone
+    assert tail.advance(docs[-5:-2])[1] is payload
+    assert calls == []
+
+    tail.advance(docs[-2:])
+    assert len(calls) == 1
@@ -0,0 +1,48 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.services import codec, parallel, synthetic
+from app.services.firestore import process_raw_positions
+
+
+def same(a, b):
+    return codec.dumps(a.to_columns()) == codec.dumps(b.to_columns())
+
+
+def stationary_bounds(records, expected, chunks):
+    """[start, end) chunks whose boundaries fall inside stationary groups or just after an anchor."""
+    tstamps = np.array([rec["utc_shifted_tstamp"] for rec in records])
+    anchors = np.flatnonzero(expected.duration_secs > 0)
+    cuts = set()
+    for k, row in enumerate(anchors[::max(len(anchors) // chunks, 1)]):
+        first = int(np.searchsorted(tstamps, expected.utc_shifted_tstamp[row]))
+        last = int(np.searchsorted(tstamps, expected.utc_shifted_tstamp[row] + expected.duration_secs[row], "right"))
+        # Alternate between the middle of the group and one or two documents past its anchor
+        cuts.add((first + last) // 2 if k % 3 == 0 else first + k % 3)
+    cuts = sorted(k for k in cuts if 0 < k < len(records) and tstamps[k] != tstamps[k - 1])
+    return list(zip([0] + cuts, cuts + [len(records)]))
+
+
+@pytest.fixture(params=[1, 2])
+def documents(request):
+    raw = [raw for _, raw in synthetic.generate_documents(6000, request.param)]
+    return parallel.normalize_sorted(raw), process_raw_positions(raw)
+
+
+def test_parallel_chunks_split_at_gaps_match_process_raw_positions(documents, monkeypatch):
+    records, expected = documents
+    split = parallel.split_at_gaps
+    monkeypatch.setattr(parallel, "split_at_gaps", lambda tstamps, chunks: split(tstamps, chunks, min_docs=200))
+    with ThreadPoolExecutor(4) as executor:
+        assert same(parallel.process_records_parallel(records, executor, workers=4), expected)
+
+
+def test_parallel_chunks_cut_inside_stationary_groups_match_process_raw_positions(documents, monkeypatch):
+    records, expected = documents
+    bounds = stationary_bounds(records, expected, 30)
+    assert len(bounds) > 20
+    monkeypatch.setattr(parallel, "split_at_gaps", lambda tstamps, chunks: bounds)
+    # Short first boundary runs, so stitching has to widen them
+    monkeypatch.setattr(parallel, "BOUNDARY_DOCS", 8)
+    with ThreadPoolExecutor(4) as executor:
+        assert same(parallel.process_records_parallel(records, executor, workers=4), expected)
@@ -0,0 +1,14 @@
+import numpy as np
+from app.services import codec
+from app.services.positions import _plain_float32
+
+
+def test_plain_float32_shortest_repr():
+    values = np.array([13.8, np.nan, 13.8, 2.5], dtype=np.float32)
+    assert _plain_float32(values) == [13.8, None, 13.8, 2.5]
+
+
+def test_plain_float32_signed_zero_is_order_independent():
+    forward = _plain_float32(np.array([-0.0, 0.0, 1.0], dtype=np.float32))
+    backward = _plain_float32(np.array([0.0, -0.0, 1.0], dtype=np.float32))
+    assert codec.dumps(forward) == codec.dumps(backward) == b"[0.0,0.0,1.0]"
@@ -0,0 +1,74 @@
+import os
+import asyncio
+import contextlib
+import importlib
+import io
+import pytest
+from app.services import codec, mirror, range_planner, synthetic, year_cache
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+NEW_YEAR = range_planner.year_bounds(2025)[0]
+DAY = 86400
+RANGES = [
+    (NEW_YEAR - 6 * DAY, NEW_YEAR + 10 * DAY),          # over New Year
+    (NEW_YEAR - 3 * DAY + 11111, NEW_YEAR - 3600),      # inside 2024, starting mid-trip
+    (NEW_YEAR + 7777, NEW_YEAR + 2 * DAY),              # inside 2025
+    (NEW_YEAR - DAY, NEW_YEAR + DAY),
+]
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("mirror") / "gps.sqlite")
+    mirror.write_documents(path, synthetic.generate_documents(9000, 1, start=NEW_YEAR - 9 * DAY))
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv(mirror.MIRROR_ENV, path)
+        patch.chdir(REPO_ROOT)
+        yield importlib.import_module("app.main")
+
+
+def plan(main, cache_dir, from_timestamp, to_timestamp):
+    main.CACHE_DIR = str(cache_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(main.plan_range(None, from_timestamp, to_timestamp))
+
+
+def segment_rows(payload):
+    tstamps = payload["columns"]["utc_shifted_tstamp"]
+    return [tstamps[start:end] for start, end in payload["segments"]]
+
+
+@pytest.fixture(scope="module")
+def cached_dir(main, tmp_path_factory):
+    cache_dir = tmp_path_factory.mktemp("cached")
+    saved = main.CACHE_DIR
+    main.CACHE_DIR = str(cache_dir)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for year in (2024, 2025):
+            asyncio.run(main.get_positions_for_year_internal(year, None))
+    main.CACHE_DIR = saved
+    return cache_dir
+
+
+@pytest.mark.parametrize("from_timestamp, to_timestamp", RANGES)
+def test_range_is_the_same_cached_or_not(main, cached_dir, tmp_path, from_timestamp, to_timestamp):
+    cached = plan(main, cached_dir, from_timestamp, to_timestamp)
+    fetched = plan(main, tmp_path, from_timestamp, to_timestamp)
+    assert cached["count"] > 0
+    assert segment_rows(cached) == segment_rows(fetched)
+    assert cached == fetched
+
+
+def test_range_holds_the_year_rows_plus_the_new_year_trip(main, cached_dir):
+    from_timestamp, to_timestamp = NEW_YEAR - 10 * DAY, NEW_YEAR + 2 * DAY
+    expected = []
+    for year in (2024, 2025):
+        with open(year_cache.cache_path(str(cached_dir), year), "rb") as f:
+            tstamps = codec.loads(f.read())["columns"]["utc_shifted_tstamp"]
+        expected += [t for t in tstamps if from_timestamp <= t <= to_timestamp]
+    planned = plan(main, cached_dir, from_timestamp, to_timestamp)["columns"]["utc_shifted_tstamp"]
+    assert planned == sorted(planned)
+    assert set(expected) <= set(planned)
+    # Anything else is the part of a trip over New Year that neither year cache holds
+    extra = set(planned) - set(expected)
+    assert all(NEW_YEAR <= t <= NEW_YEAR + range_planner.YEAR_EDGE_FETCH_SECS for t in extra)
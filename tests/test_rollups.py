@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+from app.services import rollups, synthetic, wire_format
+from app.services.firestore import process_raw_positions, segment_positions, trip_segment_mask
+
+
+@pytest.fixture(scope="module")
+def payload():
+    positions = process_raw_positions([raw for _, raw in synthetic.generate_documents(4000, 1)])
+    segmented_all = segment_positions(positions, filter_stationary=False)
+    keep = trip_segment_mask(segmented_all)
+    kept = segmented_all.keep_segments(keep)
+    return wire_format.encode_payload(kept, kept.segment_bounds(), synthetic.SYNTHETIC_START_TSTAMP, 0)
+
+
+def path_steps(payload):
+    """(end row, geodesic miles) of every step between neighbouring points of the same segment."""
+    columns = payload["columns"]
+    return [(i, geodesic((columns["latitude"][i - 1], columns["longitude"][i - 1]),
+                         (columns["latitude"][i], columns["longitude"][i])).miles)
+            for start, end in payload["segments"] for i in range(start + 1, end)]
+
+
+@pytest.mark.parametrize("bucket", ["daily", "hourly"])
+def test_bucket_miles_are_path_length(payload, bucket):
+    data = rollups.build_rollups(payload)[bucket]
+    tstamps = np.array(payload["columns"]["utc_shifted_tstamp"], dtype=np.float64)
+    expected = {}
+    for row, miles in path_steps(payload):
+        start = np.floor(tstamps[row] / data["bucket_secs"]) * data["bucket_secs"]
+        expected[start] = expected.get(start, 0.0) + miles
+    assert sum(data["points"]) == payload["count"]
+    for start, miles in zip(data["start"], data["miles"]):
+        assert miles == pytest.approx(expected.get(start, 0.0), abs=2e-3)
+
+
+def test_total_miles_are_path_length(payload):
+    total = sum(miles for _, miles in path_steps(payload))
+    assert total > 0
+    assert sum(rollups.build_rollups(payload)["daily"]["miles"]) == pytest.approx(total, rel=1e-4)
@@ -0,0 +1,54 @@
+import asyncio
+from datetime import datetime, timezone
+from app.services import scheduler
+
+YEAR = datetime.now(timezone.utc).year
+
+
+async def run_until(warmup, done, timeout=5):
+    warmup.start([YEAR])
+    try:
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not done() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(0.01)
+    finally:
+        await warmup.stop()
+
+
+def test_failed_current_year_is_retried_with_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, "WARMUP_RETRY_SECS", 0.05)
+    monkeypatch.setattr(scheduler, "WARMUP_RETRY_MAX_SECS", 0.2)
+    files = set()
+    attempts = []
+
+    async def build(year):
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) < 3:
+            raise RuntimeError("Firestore unavailable")
+        files.add(year)
+
+    warmup = scheduler.WarmupScheduler(build, warm=lambda year: None, cached=lambda year: year in files,
+                                       expires_at=lambda year: None)
+    asyncio.run(run_until(warmup, lambda: warmup.years.get(YEAR, {}).get("state") == "ready"))
+    assert len(attempts) == 3
+    assert warmup.years[YEAR]["state"] == "ready"
+    # The second retry waited twice as long as the first
+    assert attempts[2] - attempts[1] > 1.5 * (attempts[1] - attempts[0])
+
+
+def test_current_year_without_cache_file_is_rebuilt(monkeypatch):
+    monkeypatch.setattr(scheduler, "WARMUP_RETRY_SECS", 0.05)
+    files = set()
+    builds = []
+
+    async def build(year):
+        # The first build succeeds without leaving a cache file (say the write failed)
+        builds.append(year)
+        if len(builds) > 1:
+            files.add(year)
+
+    warmup = scheduler.WarmupScheduler(build, warm=lambda year: None, cached=lambda year: year in files,
+                                       expires_at=lambda year: None)
+    asyncio.run(run_until(warmup, lambda: YEAR in files))
+    assert builds == [YEAR, YEAR]
+    assert warmup.years[YEAR]["state"] == "ready"
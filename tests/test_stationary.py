@@ -0,0 +1,55 @@
+import numpy as np
+from app.services.firestore import group_stationary
+from app.services.positions import PositionTable
+
+
+def table(tstamps, lats, lons):
+    positions = PositionTable(len(tstamps))
+    positions.utc_shifted_tstamp = np.asarray(tstamps, dtype=np.float64)
+    positions.latitude = np.asarray(lats, dtype=np.float64)
+    positions.longitude = np.asarray(lons, dtype=np.float64)
+    return positions
+
+
+def dock_stay(n, lat, lon, seed, bounce_every=0):
+    """n jittered pings around (lat, lon), with a one-ping 1 mile excursion every bounce_every pings."""
+    rng = np.random.default_rng(seed)
+    lats = lat + rng.uniform(-0.0004, 0.0004, n)
+    lons = lon + rng.uniform(-0.0004, 0.0004, n)
+    if bounce_every:
+        lats[bounce_every::bounce_every] += 0.0145
+    return lats, lons
+
+
+def resummed_centroid(values):
+    """
+    The anchor's coordinate after absorbing values[1:] one at a time, as the
+    original implementation computed it: the whole group summed afresh, in
+    order, from the anchor's current coordinate.
+    """
+    centroid = values[0]
+    for size in range(2, len(values) + 1):
+        centroid = sum(values[k] if k else centroid for k in range(size)) / size
+    return centroid
+
+
+def test_centroid_is_bit_identical_to_resumming():
+    lats, lons = dock_stay(1500, 47.6, -122.4, seed=1, bounce_every=97)
+    grouped = group_stationary(table(np.arange(1500) * 60.0, lats, lons))
+    assert len(grouped) == 1
+    assert grouped.latitude[0] == resummed_centroid(lats.tolist())
+    assert grouped.longitude[0] == resummed_centroid(lons.tolist())
+    assert grouped.duration_secs[0] == 1499 * 60.0
+
+
+def test_each_stay_gets_its_own_centroid():
+    first = dock_stay(500, 47.6, -122.4, seed=2)
+    second = dock_stay(700, 47.7, -122.4, seed=3)
+    lats = np.concatenate([first[0], second[0]])
+    lons = np.concatenate([first[1], second[1]])
+    # Far apart in time, so the move between the stays is not a teleport spike
+    tstamps = np.concatenate([np.arange(500) * 60.0, 86400 + np.arange(700) * 60.0])
+    grouped = group_stationary(table(tstamps, lats, lons))
+    assert len(grouped) == 2
+    assert grouped.latitude.tolist() == [resummed_centroid(first[0].tolist()), resummed_centroid(second[0].tolist())]
+    assert grouped.longitude.tolist() == [resummed_centroid(first[1].tolist()), resummed_centroid(second[1].tolist())]
@@ -0,0 +1,67 @@
+import asyncio
+import numpy as np
+import pytest
+from app.services import codec, mirror, position_stream, synthetic
+from app.services.firestore import normalize_position, process_raw_positions
+from app.services.positions import PositionTable
+
+SEEDS = (1, 2)
+
+
+def sorted_records(raw_docs):
+    records = [(doc_id, normalize_position(raw)) for doc_id, raw in raw_docs]
+    return sorted(records, key=lambda item: item[1]["utc_shifted_tstamp"])
+
+
+def tricky_cuts(records, expected):
+    """
+    Document indexes inside stationary groups and one or two rows either side of
+    an anchor, so chunks end within a group and within the speed look-back.
+    """
+    tstamps = np.array([rec["utc_shifted_tstamp"] for _, rec in records])
+    anchors = np.flatnonzero(expected.duration_secs > 0)
+    cuts = set(range(97, len(records), 97))
+    for row in anchors[::max(len(anchors) // 25, 1)]:
+        first = int(np.searchsorted(tstamps, expected.utc_shifted_tstamp[row]))
+        last = int(np.searchsorted(tstamps, expected.utc_shifted_tstamp[row] + expected.duration_secs[row], "right"))
+        cuts.update([first - 2, first - 1, first + 1, first + 2, (first + last) // 2, last - 1, last + 1])
+    # Documents with equal timestamps always arrive together
+    return sorted(k for k in cuts if 0 < k < len(records) and tstamps[k] != tstamps[k - 1])
+
+
+def same(a, b):
+    return codec.dumps(a.to_columns()) == codec.dumps(b.to_columns())
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_stream_cut_inside_stationary_groups_matches_process_raw_positions(seed):
+    raw_docs = list(synthetic.generate_documents(4000, seed))
+    records = sorted_records(raw_docs)
+    expected = process_raw_positions([raw for _, raw in raw_docs])
+    cuts = tricky_cuts(records, expected)
+    assert len(cuts) > 100
+
+    # chunk_docs=1 processes after every feed, so every cut is a processing boundary
+    stream = position_stream.PositionStream(chunk_docs=1)
+    released = [stream.feed(records[start:end]) for start, end in zip([0] + cuts, cuts + [len(records)])]
+    assert sum(len(batch) for batch in released) > len(expected) // 2
+    assert same(PositionTable.concat(released + [stream.process()]), expected)
+
+
+@pytest.mark.parametrize("chunk_docs", [50, 333, 10000])
+def test_stream_positions_matches_process_raw_positions(tmp_path, monkeypatch, chunk_docs):
+    raw_docs = list(synthetic.generate_documents(3000, 3))
+    path = str(tmp_path / "gps.sqlite")
+    mirror.write_documents(path, raw_docs)
+    monkeypatch.setenv(mirror.MIRROR_ENV, path)
+
+    async def stream_all(stream):
+        return [batch async for batch in position_stream.stream_positions(
+            None, mirror.MIRROR_START_TSTAMP, mirror.MIRROR_END_TSTAMP - mirror.MIRROR_OVERLAP_SECS, stream)]
+
+    stream = position_stream.PositionStream(chunk_docs=chunk_docs)
+    released = asyncio.run(stream_all(stream))
+    if chunk_docs < len(raw_docs):
+        assert len(released) > 1
+    expected = process_raw_positions([raw for _, raw in raw_docs])
+    assert same(PositionTable.concat(released + [stream.process()]), expected)